@@ -86,7 +86,7 @@ class _LdaModelScreenState extends State<LdaModelScreen> {
         setState(() {
           modelResults = {
             ...responseData['metrics'],
-            ...responseData['plots'],
+            'plots': responseData['plots'],
             'class_names': responseData['metrics']['class_names'],
           };
         });
@@ -168,10 +168,11 @@ class _LdaModelScreenState extends State<LdaModelScreen> {
         List<double>.from(modelResults!['explained_variance_ratio'] ?? []);
     final classNames = List<String>.from(modelResults!['class_names'] ?? []);
 
-    final confMatrix = modelResults!['confusion_matrix_image'] as String?;
-    final scree = modelResults!['scree_plot'] as String?;
-    final proj2d = modelResults!['projection_2d'] as String?;
-    final proj3d = modelResults!['projection_3d'] as String?;
+    final plots = modelResults!['plots'] as Map<String, dynamic>? ?? {};
+    final confMatrix = plots['confusion_matrix'] as String?;
+    final scree = plots['scree_plot'] as String?;
+    final proj2d = plots['projection_2d'] as String?;
+    final proj3d = plots['projection_3d'] as String?;
 
     return Column(
       crossAxisAlignment: CrossAxisAlignment.start,
@@ -220,7 +221,7 @@ class _LdaModelScreenState extends State<LdaModelScreen> {
             ),
             child: ClipRRect(
               borderRadius: BorderRadius.circular(16),
-              child: Image.memory(base64Decode(confMatrix)),
+              child: Image.network('${widget.apiBaseUrl}$confMatrix'),
             ),
           ),
         ],
@@ -234,7 +235,7 @@ class _LdaModelScreenState extends State<LdaModelScreen> {
             ),
             child: ClipRRect(
               borderRadius: BorderRadius.circular(16),
-              child: Image.memory(base64Decode(scree)),
+              child: Image.network('${widget.apiBaseUrl}$scree'),
             ),
           ),
         ],
@@ -248,7 +249,7 @@ class _LdaModelScreenState extends State<LdaModelScreen> {
             ),
             child: ClipRRect(
               borderRadius: BorderRadius.circular(16),
-              child: Image.memory(base64Decode(proj2d)),
+              child: Image.network('${widget.apiBaseUrl}$proj2d'),
             ),
           ),
         ],
@@ -262,7 +263,7 @@ class _LdaModelScreenState extends State<LdaModelScreen> {
             ),
             child: ClipRRect(
               borderRadius: BorderRadius.circular(16),
-              child: Image.memory(base64Decode(proj3d)),
+              child: Image.network('${widget.apiBaseUrl}$proj3d'),
             ),
           ),
         ],
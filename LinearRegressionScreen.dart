@@ -322,7 +322,7 @@ class _LinearRegressionScreenState extends State<LinearRegressionScreen> {
         // Tabla ANOVA
         if (modelResults!["anova"] != null) _buildAnovaTable(),
 
-        if (modelResults!["residuals_plot"] != null) ...[
+        if (modelResults!["plots"]?["residuals"] != null) ...[
           const SizedBox(height: 24),
           _buildSectionHeader("Análisis de Residuales", Icons.show_chart),
           Card(
@@ -333,13 +333,13 @@ class _LinearRegressionScreenState extends State<LinearRegressionScreen> {
             margin: const EdgeInsets.only(bottom: 24),
             child: ClipRRect(
               borderRadius: BorderRadius.circular(16),
-              child:
-                  Image.memory(base64Decode(modelResults!["residuals_plot"])),
+              child: Image.network(
+                  '$apiBaseUrl${modelResults!["plots"]["residuals"]}'),
             ),
           ),
         ],
 
-        if (modelResults!["visual_plot"] != null) ...[
+        if (modelResults!["plots"]?["visual"] != null) ...[
           const SizedBox(height: 24),
           _buildSectionHeader("Visualización del Modelo", Icons.insights),
           Card(
@@ -349,7 +349,8 @@ class _LinearRegressionScreenState extends State<LinearRegressionScreen> {
             ),
             child: ClipRRect(
               borderRadius: BorderRadius.circular(16),
-              child: Image.memory(base64Decode(modelResults!["visual_plot"])),
+              child: Image.network(
+                  '$apiBaseUrl${modelResults!["plots"]["visual"]}'),
             ),
           ),
         ],
@@ -279,7 +279,7 @@ class _LogisticRegressionScreenState extends State<LogisticRegressionScreen> {
             ),
           ),
         ),
-        if (modelResults!["confusion_matrix_image"] != null) ...[
+        if (modelResults!["plots"]?["confusion_matrix"] != null) ...[
           const SizedBox(height: 24),
           _buildSectionHeader("Matriz de Confusión", Icons.grid_on),
           Card(
@@ -290,12 +290,12 @@ class _LogisticRegressionScreenState extends State<LogisticRegressionScreen> {
             margin: const EdgeInsets.only(bottom: 24),
             child: ClipRRect(
               borderRadius: BorderRadius.circular(16),
-              child: Image.memory(
-                  base64Decode(modelResults!["confusion_matrix_image"])),
+              child: Image.network(
+                  '$apiBaseUrl${modelResults!["plots"]["confusion_matrix"]}'),
             ),
           ),
         ],
-        if (modelResults!["roc_curve_image"] != null) ...[
+        if (modelResults!["plots"]?["roc_curve"] != null) ...[
           const SizedBox(height: 24),
           _buildSectionHeader("Curva ROC", Icons.show_chart),
           Card(
@@ -305,8 +305,8 @@ class _LogisticRegressionScreenState extends State<LogisticRegressionScreen> {
             ),
             child: ClipRRect(
               borderRadius: BorderRadius.circular(16),
-              child:
-                  Image.memory(base64Decode(modelResults!["roc_curve_image"])),
+              child: Image.network(
+                  '$apiBaseUrl${modelResults!["plots"]["roc_curve"]}'),
             ),
           ),
         ],
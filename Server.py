@@ -1,49 +1,219 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Response, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Optional, Union
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Optional, Union, Literal, Tuple
 
+# scipy, sklearn, statsmodels, matplotlib y seaborn se importan dentro de las
+# funciones que los usan: el servidor y cada proceso del pool arrancan sin
+# cargarlos y cada endpoint paga su importación solo la primera vez.
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression, LogisticRegression, HuberRegressor, RANSACRegressor
-from sklearn.feature_selection import SelectKBest, f_regression, RFE
-from sklearn.metrics import (r2_score, accuracy_score, confusion_matrix, 
-                           roc_curve, roc_auc_score, mean_absolute_error, 
-                           mean_squared_error, explained_variance_score,f1_score, confusion_matrix)
-from scipy.stats import pearsonr, spearmanr, kendalltau
 import tempfile
+import re
+import shutil
+import time
 import os
+import threading
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
 from pydantic import BaseModel
-import statsmodels.api as sm
-import statsmodels.formula.api as smf
-import seaborn as sns
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
-from mpl_toolkits.mplot3d import Axes3D
-from sklearn.model_selection import train_test_split, cross_val_score
-import plotly.express as px
-import plotly.graph_objects as go
-import plotly.io as pio
+from io import BytesIO, StringIO
+from contextlib import contextmanager
+import contextvars
+import cProfile
+import pstats
 import joblib
 from datetime import datetime
 import json
+import logging
+import hashlib
+import gzip
+import zlib
+import pickle
 import uuid
 from pathlib import Path
-from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import classification_report
-import plotly.figure_factory as ff
-from typing import List, Dict, Optional, Literal
-from patsy import dmatrix  
+
+os.environ["MPLBACKEND"] = "Agg"  # matplotlib sin pantalla, también en los procesos del pool
+
+try:
+    import pyarrow  # noqa: F401  (Parquet para volcar datasets y Arrow IPC en /predict)
+    import pyarrow.ipc
+    import pyarrow.parquet
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+SPILL_FORMAT = "parquet" if HAS_PYARROW else "pickle"
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+try:
+    import orjson  # JSON en C con NaN a null y arrays de NumPy nativos
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+try:
+    import msgpack  # respuestas binarias si el cliente envía Accept: application/msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+MSGPACK_TYPE = "application/msgpack"
+
+
+# Serialización y compresión de respuestas
+RESPONSE_COMPRESSION = os.environ.get("CORRSTAR_COMPRESSION", "1") != "0"
+COMPRESSION_MIN_BYTES = int(os.environ.get("CORRSTAR_COMPRESSION_MIN_BYTES", "1024"))  # las menores van sin comprimir
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # calidad media: buena relación tamaño/CPU para respuestas generadas al vuelo
+COMPRESSIBLE_TYPES = ("application/json", MSGPACK_TYPE, "text/")  # PNG y Arrow se envían tal cual
+_response_format: contextvars.ContextVar = contextvars.ContextVar("corrstar_response_format", default="json")
+
+
+def json_default(obj):
+    """Tipos que el codificador no conoce: NumPy, fechas y nulos de pandas"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+def msgpack_default(obj):
+    """Como json_default, pero los arrays numéricos viajan en binario:
+    {"dtype": "<f8", "shape": [filas, columnas], "data": bytes little-endian en orden C}
+    """
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in "biuf":
+        arr = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder("<"))
+        return {"dtype": arr.dtype.str, "shape": list(arr.shape), "data": arr.tobytes()}
+    return json_default(obj)
+
+class APIResponse(JSONResponse):
+    """Respuesta por defecto: orjson (NaN e infinitos como null, arrays de NumPy
+    sin convertir) o MessagePack si el cliente lo pide (arrays numéricos en
+    binario, ver msgpack_default). Sin orjson se recurre
+    a json con clean_json_data.
+    """
+
+    def __init__(self, content, *args, **kwargs):
+        self.media_type = MSGPACK_TYPE if _response_format.get() == "msgpack" else "application/json"
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content) -> bytes:
+        with stage("response.serialize"):
+            if self.media_type == MSGPACK_TYPE:
+                return msgpack.packb(content, default=msgpack_default, use_bin_type=True)
+            if HAS_ORJSON:
+                return orjson.dumps(content, default=json_default,
+                                    option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+            return json.dumps(clean_json_data(content), default=json_default, ensure_ascii=False,
+                              allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Codificación preferida entre las que acepta el cliente: brotli (si está instalado) o gzip"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        params = params.strip()
+        try:
+            accepted[name.strip()] = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            accepted[name.strip()] = 0.0
+    for name in ("br", "gzip") if HAS_BROTLI else ("gzip",):
+        if accepted.get(name, accepted.get("*", 0.0)) > 0:
+            return name
+    return None
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+def stream_compressor(encoding: str):
+    """Funciones (bloque, final) para comprimir una respuesta por partes sin retener los bloques"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return (lambda data: compressor.process(data) + compressor.flush()), compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: cabecera gzip
+    return (lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+class ResponseEncodingMiddleware:
+    """Negocia el formato (Accept) y la compresión (Accept-Encoding) de las respuestas.
+
+    Solo se comprimen los tipos de COMPRESSIBLE_TYPES a partir de
+    COMPRESSION_MIN_BYTES; las respuestas por bloques (/predict) se
+    comprimen bloque a bloque.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        wants_msgpack = HAS_MSGPACK and MSGPACK_TYPE in headers.get("accept", "")
+        token = _response_format.set("msgpack" if wants_msgpack else "json")
+        encoding = negotiate_encoding(headers.get("accept-encoding", "")) if RESPONSE_COMPRESSION else None
+        try:
+            await self.app(scope, receive, send if encoding is None else self._compressing(send, encoding))
+        finally:
+            _response_format.reset(token)
+
+    @staticmethod
+    def _compressing(send, encoding: str):
+        pending = {}  # el inicio se retiene hasta ver el primer bloque del cuerpo
+        stream = {}
+
+        async def wrapped(message):
+            if message["type"] == "http.response.start":
+                pending["start"] = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if "start" in pending:
+                start = pending.pop("start")
+                headers = MutableHeaders(raw=list(start["headers"]))
+                if ("content-encoding" not in headers
+                        and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                        and (more or len(body) >= COMPRESSION_MIN_BYTES)):
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if more:
+                        if "content-length" in headers:
+                            del headers["content-length"]
+                        stream["chunk"], stream["finish"] = stream_compressor(encoding)
+                    else:
+                        with stage("response.compress"):
+                            body = compress_body(body, encoding)
+                        headers["Content-Length"] = str(len(body))
+                await send({**start, "headers": headers.raw})
+            if stream:
+                body = stream["chunk"](body) + (b"" if more else stream["finish"]())
+            await send({"type": "http.response.body", "body": body, "more_body": more})
+
+        return wrapped
+
 
 
 
 app = FastAPI(
     title="API de Análisis Estadístico",
     description="API para cálculo de correlaciones y modelos de regresión",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=APIResponse,
 )
 
 # Configuración CORS
@@ -54,39 +224,1563 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ResponseEncodingMiddleware)
+
+# Instrumentación por etapas y métricas
+REQUEST_PROFILING = os.environ.get("CORRSTAR_REQUEST_PROFILING", "1") != "0"  # permite ?profile=1
+PROFILE_REPORT_LINES = 40  # funciones listadas por proceso en el informe de ?profile=1
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # segundos
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:  # Windows
+    HAS_RESOURCE = False
+
+
+class Metrics:
+    """Histogramas, contadores y máximos en memoria con salida en texto de Prometheus"""
+
+    HELP = {
+        "corrstar_request_seconds": ("histogram", "Duración de las peticiones por ruta"),
+        "corrstar_stage_seconds": ("histogram", "Duración de cada etapa instrumentada"),
+        "corrstar_stage_rows_total": ("counter", "Filas procesadas por etapa"),
+        "corrstar_stage_columns_total": ("counter", "Columnas procesadas por etapa"),
+        "corrstar_stage_rss_delta_bytes": ("gauge", "Mayor aumento de memoria residente durante la etapa"),
+    }
+
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self._histograms: Dict[tuple, List] = {}
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, labels: Dict[str, str], value: float):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set_max(self, name: str, labels: Dict[str, str], value: float):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = max(self._values.get(key, 0), value)
+
+    def render(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for metric, (kind, text) in self.HELP.items():
+                lines += [f"# HELP {metric} {text}", f"# TYPE {metric} {kind}"]
+                for (name, labels), (counts, total, count) in sorted(self._histograms.items()):
+                    if name == metric:
+                        for bound, n in zip(self.buckets, counts):
+                            lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {n}")
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+                        lines += [f"{name}_sum{fmt(labels)} {total}", f"{name}_count{fmt(labels)} {count}"]
+                for (name, labels), value in sorted(self._values.items()):
+                    if name == metric:
+                        lines.append(f"{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+# Traza de la petición en curso (etapas para Server-Timing y perfiles de ?profile=1)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("corrstar_trace", default=None)
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("corrstar_stage", default=None)
+# Etapas del trabajo que ejecuta este proceso del pool (ver run_job)
+_job_stages: Optional[List[Dict]] = None
+_thread_state = threading.local()
+
+
+class RequestTrace:
+    def __init__(self, profile: bool):
+        self.profile = profile
+        self.stages: List[Dict] = []
+        self.profilers: List = []  # cProfile de los hilos de esta petición
+        self.reports: List[tuple] = []  # (proceso, informe) de los trabajos del pool
+
+    def server_timing(self, total: float) -> str:
+        durations: Dict[str, float] = {}
+        for record in self.stages:  # las etapas repetidas (p. ej. por bloque) se suman
+            durations[record["name"]] = durations.get(record["name"], 0.0) + record["seconds"]
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+        return ", ".join(parts + [f"total;dur={total * 1000:.1f}"])
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Pico histórico de memoria residente de este proceso (ru_maxrss va en KiB en Linux)"""
+    if not HAS_RESOURCE:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def current_rss_bytes() -> Optional[int]:
+    """Memoria residente actual de este proceso; None fuera de Linux"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def observe_stage(record: Dict):
+    labels = {"stage": record["name"]}
+    metrics.observe("corrstar_stage_seconds", labels, record["seconds"])
+    if record.get("rows") is not None:
+        metrics.inc("corrstar_stage_rows_total", labels, record["rows"])
+    if record.get("cols") is not None:
+        metrics.inc("corrstar_stage_columns_total", labels, record["cols"])
+    if record.get("rss_delta") is not None:
+        metrics.set_max("corrstar_stage_rss_delta_bytes", labels, record["rss_delta"])
+
+@contextmanager
+def stage(name: str):
+    """Mide una etapa con nombre; sirve como ``with`` y como decorador.
+
+    En el proceso principal se registra en las métricas y en la traza de la
+    petición; en el pool se acumula y viaja de vuelta con el resultado del
+    trabajo. Con ``?profile=1`` perfila además el hilo que la ejecuta.
+    """
+    record = {"name": name, "rows": None, "cols": None}
+    trace = _current_trace.get()
+    profiler = None
+    if trace is not None and trace.profile and _job_stages is None and not getattr(_thread_state, "profiling", False):
+        profiler = cProfile.Profile()
+        _thread_state.profiling = True
+        profiler.enable()
+    token = _current_stage.set(record)
+    rss_before = current_rss_bytes()
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        rss_after = current_rss_bytes()
+        # Variación de la memoria residente en la etapa (el pico histórico del proceso no distingue etapas)
+        record["rss_delta"] = None if rss_before is None or rss_after is None else rss_after - rss_before
+        _current_stage.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            _thread_state.profiling = False
+            trace.profilers.append(profiler)
+        if _job_stages is not None:
+            _job_stages.append(record)
+        else:
+            observe_stage(record)
+            if trace is not None:
+                trace.stages.append(record)
+
+def stage_size(rows: Optional[int] = None, cols: Optional[int] = None):
+    """Anota filas y columnas procesadas en la etapa en curso"""
+    record = _current_stage.get()
+    if record is not None:
+        record["rows"], record["cols"] = rows, cols
+
+def profile_text(*profilers) -> str:
+    """Resumen de cProfile ordenado por tiempo acumulado"""
+    out = StringIO()
+    pstats.Stats(*profilers, stream=out).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_REPORT_LINES)
+    return out.getvalue()
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Cabecera Server-Timing, histograma por ruta y, con ?profile=1, informe de cProfile"""
+    trace = RequestTrace(REQUEST_PROFILING and request.query_params.get("profile") == "1")
+    token = _current_trace.set(trace)
+    loop_profiler = None
+    if trace.profile:
+        loop_profiler = cProfile.Profile()  # el hilo del event loop: validación y serialización
+        _thread_state.profiling = True
+        loop_profiler.enable()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if loop_profiler is not None:
+            loop_profiler.disable()
+            _thread_state.profiling = False
+        _current_trace.reset(token)
+    total = time.perf_counter() - started
+    route = request.scope.get("route")
+    metrics.observe("corrstar_request_seconds", {
+        "method": request.method,
+        "route": getattr(route, "path", "desconocida"),
+        "status": str(response.status_code),
+    }, total)
+    server_timing = trace.server_timing(total)
+    if not trace.profile:
+        response.headers["Server-Timing"] = server_timing
+        return response
+
+    report = [f"{request.method} {request.url.path} -> {response.status_code} en {total * 1000:.1f} ms", "", "Etapas:"]
+    for record in trace.stages:
+        size = f"  filas={record['rows']} columnas={record['cols']}" if record["rows"] is not None else ""
+        memory = f"  memoria={record['rss_delta'] / 2**20:+.1f} MiB" if record.get("rss_delta") is not None else ""
+        report.append(f"  {record['name']:<32} {record['seconds'] * 1000:10.1f} ms{size}{memory}")
+    report += ["", "== Proceso principal ==", profile_text(loop_profiler, *trace.profilers)]
+    for process, text in trace.reports:
+        report += [f"== {process} ==", text]
+    return Response(content="\n".join(report), media_type="text/plain; charset=utf-8",
+                    headers={"Server-Timing": server_timing})
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 MODELS_DIR = Path("saved_models")
 MODELS_DIR.mkdir(exist_ok=True)
 
+# Ingesta de CSV por bloques
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes leídos del cuerpo de la petición por iteración
+CSV_SAMPLE_ROWS = 10_000  # filas usadas para inferir los tipos una sola vez
+CSV_CHUNK_ROWS = 100_000  # filas parseadas por bloque
+
+# Hilos usados para evaluar los pares de Kendall (-1 = todos los núcleos)
+CORRELATION_N_JOBS = int(os.environ.get("CORRSTAR_CORRELATION_JOBS", "-1"))
+PAIRWISE_BLOCK_ROWS = 100_000  # filas por bloque al acumular sumas enmascaradas
+
+# Presupuesto de memoria del almacén de datasets
+DATASET_MEMORY_BUDGET = int(os.environ.get("CORRSTAR_MEMORY_BUDGET_MB", "2048")) * 1024 * 1024
+SPILL_DIR = Path(os.environ.get("CORRSTAR_SPILL_DIR", "spilled_data"))
+CATEGORY_MAX_RATIO = 0.5  # proporción máxima de valores distintos para pasar texto a category
+MOMENTS_CACHE_ENTRIES = 32  # conjuntos de columnas con resumen incremental por dataset
+# Datasets persistentes en Arrow IPC entre reinicios (cadena vacía para desactivarlo; requiere pyarrow)
+DATASET_DIR = os.environ.get("CORRSTAR_DATASET_DIR", "datasets")
+DATASET_DIR = Path(DATASET_DIR) if DATASET_DIR and HAS_PYARROW else None
+
+
+def compact_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Reduce los dtypes sin perder información.
+
+    Enteros al menor tipo que los contiene, flotantes a float32 solo si la
+    conversión es exacta y columnas de texto con valores repetidos a category.
+    """
+    for i in range(df.shape[1]):
+        s = df.iloc[:, i]
+        if pd.api.types.is_bool_dtype(s):
+            continue
+        if pd.api.types.is_integer_dtype(s):
+            df.isetitem(i, pd.to_numeric(s, downcast="integer"))
+        elif pd.api.types.is_float_dtype(s) and s.dtype != np.float32:
+            s32 = s.astype(np.float32)
+            if np.array_equal(s32.to_numpy(dtype=np.float64), s.to_numpy(), equal_nan=True):
+                df.isetitem(i, s32)
+        elif pd.api.types.is_object_dtype(s) and pd.api.types.infer_dtype(s, skipna=True) == "string":
+            if s.nunique(dropna=True) <= CATEGORY_MAX_RATIO * len(s):
+                df.isetitem(i, s.astype("category"))
+    return df
+
+def numeric_view(s: pd.Series):
+    """Columna como array numérico más su máscara de validez.
+
+    Los tipos que caben exactos en float32 (float32, bool y enteros de hasta
+    16 bits, como las dummies) se guardan en float32; el resto en float64.
+    """
+    if isinstance(s.dtype, pd.SparseDtype):
+        s = s.sparse.to_dense()  # solo esta columna; el dataset sigue disperso
+    exact_float32 = s.dtype == np.float32 or s.dtype in (np.bool_, np.int8, np.uint8, np.int16, np.uint16)
+    values = pd.to_numeric(s, errors="coerce").to_numpy(
+        dtype=np.float32 if exact_float32 else np.float64, na_value=np.nan
+    )
+    return values, ~np.isnan(values)
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """Huella del contenido del dataset (columnas, tipos y valores)"""
+    digest = hashlib.sha256(json.dumps([[str(c) for c in df.columns], [str(t) for t in df.dtypes]]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def append_frames(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Concatena filas nuevas; las columnas category amplían sus categorías sin cambiar los códigos antiguos"""
+    from pandas.api.types import union_categoricals
+    columns = {}
+    for col in old.columns:
+        if isinstance(old[col].dtype, pd.CategoricalDtype):
+            try:
+                columns[col] = pd.Series(union_categoricals([old[col].array, pd.Categorical(new[col])], ignore_order=True))
+                continue
+            except TypeError:  # categorías de distinto tipo
+                pass
+        columns[col] = pd.concat([old[col], new[col]], ignore_index=True)
+    return pd.DataFrame(columns, columns=old.columns, copy=False)
+
+def column_moments(values: np.ndarray) -> Dict:
+    """Tamaño, medias, co-momentos centrados (X'X de las desviaciones), mínimos y máximos de las filas completas"""
+    values = values[~np.isnan(values).any(axis=1)]
+    k = values.shape[1]
+    if len(values) == 0:
+        return {"n": 0, "mean": np.zeros(k), "m2": np.zeros((k, k)), "min": np.full(k, np.inf), "max": np.full(k, -np.inf)}
+    mean = values.mean(axis=0)
+    centered = values - mean
+    return {"n": len(values), "mean": mean, "m2": centered.T @ centered, "min": values.min(axis=0), "max": values.max(axis=0)}
+
+def merge_moments(a: Dict, b: Dict) -> Dict:
+    """Resumen de la unión de dos grupos de filas (fórmula de Chan et al., estable numéricamente)"""
+    if a["n"] == 0 or b["n"] == 0:
+        return dict(b if a["n"] == 0 else a)
+    n = a["n"] + b["n"]
+    delta = b["mean"] - a["mean"]
+    return {
+        "n": n,
+        "mean": a["mean"] + delta * (b["n"] / n),
+        "m2": a["m2"] + b["m2"] + np.outer(delta, delta) * (a["n"] * b["n"] / n),
+        "min": np.minimum(a["min"], b["min"]),
+        "max": np.maximum(a["max"], b["max"]),
+    }
+
+def densify(df: pd.DataFrame) -> pd.DataFrame:
+    """Convierte las columnas dispersas a su tipo denso (Parquet no las admite)"""
+    sparse = {c: dtype.subtype for c, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)}
+    return df.astype(sparse) if sparse else df
+
+def write_arrow(df: pd.DataFrame, path: Path):
+    """Escribe el dataframe como Arrow IPC sin comprimir, listo para abrirse con mmap.
+
+    Las columnas numéricas se guardan tal cual (NaN incluido, sin máscara de
+    nulos) para que al leerlas pandas use el mapa de memoria sin copiarlas.
+    """
+    df = densify(df)
+    arrays = [
+        pyarrow.array(df[col].to_numpy(), from_pandas=False) if df[col].dtype.kind in "fiu"
+        else pyarrow.array(df[col], from_pandas=True)
+        for col in df.columns
+    ]
+    table = pyarrow.Table.from_arrays(arrays, names=[str(col) for col in df.columns])
+    tmp = path.with_suffix(".tmp")
+    with pyarrow.OSFile(str(tmp), "wb") as sink, pyarrow.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=CSV_CHUNK_ROWS)
+    os.replace(tmp, path)
+
+def read_arrow(path: str) -> pd.DataFrame:
+    """Abre un fichero Arrow IPC con mmap; las columnas numéricas no se copian"""
+    return pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all().to_pandas(split_blocks=True)
+
+def stored_schema(path: str):
+    """Esquema de un fichero volcado (Arrow IPC o Parquet) sin leer sus datos"""
+    if path.endswith(".arrow"):
+        return pyarrow.ipc.open_file(pyarrow.memory_map(path)).schema
+    return pyarrow.parquet.read_schema(path)
+
+def stored_batches(path: str, columns: List[str], chunk_rows: int):
+    """Lotes de ``columns`` de un fichero volcado (Arrow IPC o Parquet)"""
+    if path.endswith(".arrow"):
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(path))
+        return (reader.get_batch(i).select(columns) for i in range(reader.num_record_batches))
+    return pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns)
+
+def aligned_batches(readers: List):
+    """Une lotes de varios lectores de Arrow fila a fila aunque sus tamaños no coincidan"""
+    pending = [None] * len(readers)
+    while True:
+        for i, reader in enumerate(readers):
+            while pending[i] is None or pending[i].num_rows == 0:
+                pending[i] = next(reader, None)
+                if pending[i] is None:
+                    return
+        n = min(batch.num_rows for batch in pending)
+        columns, names = [], []
+        for i, batch in enumerate(pending):
+            columns += batch.slice(0, n).columns
+            names += batch.schema.names
+            pending[i] = batch.slice(n)
+        yield pyarrow.RecordBatch.from_arrays(columns, names=names)
+
+
+class DatasetStore:
+    """Almacén de datasets con presupuesto de memoria.
+
+    Se usa como el antiguo diccionario ``global_data``: cada entrada es un dict
+    con "dataframe", "columns" y, tras codificar, "dummy_encoded" y
+    "encoding_maps". "dummy_encoded" comparte los bloques del dataframe
+    original y solo añade las columnas codificadas. Cuando la memoria total
+    supera el presupuesto, los datasets usados hace más tiempo se vuelcan a
+    disco y se recargan en el siguiente acceso.
+
+    Con ``persist_dir`` cada dataset se guarda además como Arrow IPC en
+    ``persist_dir/{file_id}/``: sobrevive a los reinicios, lo ven todos los
+    procesos de uvicorn y se abre con mmap, así que el arranque no lee nada
+    y varios procesos comparten las mismas páginas de las columnas numéricas.
+    """
+
+    def __init__(self, memory_budget: int, spill_dir: Path, persist_dir: Optional[Path] = None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.persist_dir = persist_dir
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, file_id) -> bool:
+        return self._lookup(file_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __getitem__(self, file_id: str) -> Dict:
+        with self._lock:
+            entry = self._lookup(file_id)
+            if entry is None:
+                raise KeyError(file_id)
+            self._entries.move_to_end(file_id)
+            if "spilled" in entry:
+                self._reload(file_id, entry)
+                self.enforce_budget(keep=file_id)
+            return entry
+
+    def __setitem__(self, file_id: str, entry: Dict):
+        with self._lock:
+            entry["dataframe"] = compact_dataframe(entry["dataframe"])
+            entry["row_count"] = len(entry["dataframe"])
+            entry["fingerprint"] = dataset_fingerprint(entry["dataframe"])
+            self._entries[file_id] = entry
+            self._entries.move_to_end(file_id)
+            self._update_nbytes(entry)
+            self._persist(file_id, entry, {"dataframe": entry["dataframe"]})
+            self.enforce_budget(keep=file_id)
+
+    def __delitem__(self, file_id: str):
+        with self._lock:
+            entry = self._lookup(file_id)
+            if entry is None:
+                raise KeyError(file_id)
+            del self._entries[file_id]
+            if entry.get("persisted"):
+                shutil.rmtree(self._dataset_dir(file_id), ignore_errors=True)
+            else:
+                for path in entry.get("spilled", {}).values():
+                    Path(path).unlink(missing_ok=True)
+
+    def new_id(self) -> str:
+        """Identificador libre; con persistencia se reserva creando su directorio"""
+        with self._lock:
+            i = len(self._entries) + 1
+            while True:
+                file_id = str(i)
+                if file_id not in self._entries:
+                    if self.persist_dir is None:
+                        return file_id
+                    try:
+                        (self.persist_dir / file_id).mkdir(parents=True)
+                        return file_id
+                    except FileExistsError:
+                        pass  # otro proceso lo tiene
+                i += 1
+
+    def items(self):
+        """Itera sin recargar datasets volcados ni alterar el orden LRU"""
+        with self._lock:
+            if self.persist_dir is not None and self.persist_dir.is_dir():
+                for path in self.persist_dir.iterdir():
+                    if path.name not in self._entries:
+                        self._lookup(path.name)
+            return list(self._entries.items())
+
+    def entry(self, file_id: str) -> Dict:
+        """Entrada sin recargar el dataset ni alterar el orden LRU"""
+        entry = self._lookup(file_id)
+        if entry is None:
+            raise KeyError(file_id)
+        return entry
+
+    def column_names(self, file_id: str) -> List[str]:
+        """Columnas disponibles (originales y codificadas) sin recargar el dataset"""
+        entry = self.entry(file_id)
+        if "spilled" not in entry:
+            return self.working_frame(file_id).columns.tolist()
+        names = list(entry["columns"])
+        if "dummy_encoded" in entry["spilled"] and self._readable_spill(entry):
+            names += stored_schema(entry["spilled"]["dummy_encoded"]).names
+        return names
+
+    def write_parquet(self, file_id: str, columns: List[str], path: Path, chunk_rows: int) -> str:
+        """Escribe ``columns`` en un Parquet bloque a bloque.
+
+        Si el dataset está volcado se lee directamente de sus ficheros, sin
+        recargarlo en memoria.
+        """
+        with self._lock:
+            entry = self.entry(file_id)
+            if "spilled" in entry and self._readable_spill(entry):
+                readers = []
+                for stored_path in entry["spilled"].values():
+                    wanted = [c for c in columns if c in stored_schema(stored_path).names]
+                    if wanted:
+                        readers.append(iter(stored_batches(stored_path, wanted, chunk_rows)))
+                batches = (batch.select(columns) for batch in aligned_batches(readers))
+            else:
+                frame = self.working_frame(file_id)
+                batches = (
+                    pyarrow.RecordBatch.from_pandas(densify(frame.iloc[i:i + chunk_rows][columns]), preserve_index=False)
+                    for i in range(0, len(frame), chunk_rows)
+                )
+
+            writer = None
+            try:
+                for batch in batches:
+                    if writer is None:
+                        writer = pyarrow.parquet.ParquetWriter(path, batch.schema)
+                    writer.write_batch(batch)
+            finally:
+                if writer is not None:
+                    writer.close()
+            if writer is None:
+                raise HTTPException(status_code=400, detail="El dataset está vacío")
+            return str(path)
+
+    @stage("encode.store")
+    def set_encoded(self, file_id: str, encoded_columns: pd.DataFrame, encoding_maps: Dict) -> pd.DataFrame:
+        """Registra las columnas codificadas como extensión del dataframe original"""
+        with self._lock:
+            entry = self[file_id]
+            df_encoded = pd.concat([entry["dataframe"], encoded_columns], axis=1, copy=False)
+            entry["dummy_encoded"] = df_encoded
+            entry["encoding_maps"] = encoding_maps
+            entry.pop("numeric_cache", None)
+            entry.pop("column_stats", None)
+            entry.pop("moments", None)
+            self._update_nbytes(entry)
+            self._persist(file_id, entry, {"dummy_encoded": encoded_columns})
+            self.enforce_budget(keep=file_id)
+            return df_encoded
+
+    def working_frame(self, file_id: str) -> pd.DataFrame:
+        """Versión codificada del dataset si existe, si no el original"""
+        entry = self[file_id]
+        if "dummy_encoded" in entry:
+            return entry["dummy_encoded"]
+        elif "ordinal_encoded" in entry:
+            return entry["ordinal_encoded"]
+        return entry["dataframe"]
+
+    @stage("dataset.to_numeric")
+    def numeric_columns(self, file_id: str, columns: List[str], rows: Union[slice, np.ndarray, None] = None):
+        """Matriz float64 (NaN si no es número) y máscara de validez de las columnas.
+
+        Cada columna se convierte una sola vez y queda guardada en el dataset
+        hasta que cambie su codificación. ``rows`` (tramo o índices) limita el
+        resultado a esas filas.
+        """
+        with self._lock:
+            entry = self[file_id]
+            df = self.working_frame(file_id)
+            cache = entry.setdefault("numeric_cache", {})
+            missing = [col for col in dict.fromkeys(columns) if col not in cache]
+            for col in missing:
+                cache[col] = numeric_view(df[col])
+            if missing:
+                self._update_nbytes(entry)
+                self.enforce_budget(keep=file_id)
+
+            rows = slice(None) if rows is None else rows
+            n = len(range(len(df))[rows]) if isinstance(rows, slice) else len(rows)
+            values = np.empty((n, len(columns)))
+            valid = np.empty((n, len(columns)), dtype=bool)
+            for i, col in enumerate(columns):
+                values[:, i], valid[:, i] = cache[col][0][rows], cache[col][1][rows]
+            stage_size(n, len(columns))
+            return values, valid
+
+    def moments(self, file_id: str, columns: List[str]) -> Dict:
+        """Resumen incremental (merge_moments) de las filas completas de ``columns``.
+
+        Se guarda con el número de filas que cubre; tras añadir filas solo se
+        procesan las nuevas.
+        """
+        with self._lock:
+            entry = self[file_id]
+            cache = entry.setdefault("moments", {})
+            key = tuple(columns)
+            stats = cache.pop(key, None)
+            start = stats["rows"] if stats else 0
+            if start < entry["row_count"]:
+                values, _ = self.numeric_columns(file_id, columns, slice(start, None))
+                update = column_moments(values)
+                stats = merge_moments(stats, update) if stats else update
+                stats["rows"] = entry["row_count"]
+            self._keep_moments(cache, key, stats)
+            return stats
+
+    def cached_moments(self, file_id: str, columns: List[str]) -> Optional[Dict]:
+        """Como ``moments``, pero None si aún no hay resumen de ``columns`` (habría que recorrer todo el dataset)"""
+        with self._lock:
+            if tuple(columns) not in self.entry(file_id).get("moments", {}):
+                return None
+            return self.moments(file_id, columns)
+
+    def moments_token(self, file_id: str) -> Tuple:
+        """Estado del dataset con el que ``seed_moments`` comprueba que un resumen sigue valiendo"""
+        with self._lock:
+            entry = self.entry(file_id)
+            return entry["fingerprint"], entry.setdefault("moments", {}), entry["row_count"]
+
+    def seed_moments(self, file_id: str, columns: List[str], stats: Dict, token: Tuple):
+        """Guarda el resumen calculado por un trabajo del pool si el dataset no cambió desde ``token``"""
+        fingerprint, cache, rows = token
+        with self._lock:
+            entry = self._lookup(file_id)
+            # Filas añadidas o recodificación: el resumen ya no corresponde al dataset
+            if entry is None or entry["fingerprint"] != fingerprint or entry.get("moments") is not cache:
+                return
+            cache.pop(tuple(columns), None)
+            self._keep_moments(cache, tuple(columns), {**stats, "rows": rows})
+
+    @staticmethod
+    def _keep_moments(cache: Dict, key: Tuple, stats: Dict):
+        cache[key] = stats  # al final: el más reciente
+        while len(cache) > MOMENTS_CACHE_ENTRIES:
+            cache.pop(next(iter(cache)))
+
+    @stage("dataset.append")
+    def append(self, file_id: str, rows: pd.DataFrame) -> Dict:
+        """Añade filas al final del dataset conservando su file_id.
+
+        Las filas existentes no se vuelven a procesar: la huella se encadena
+        con la de las nuevas, la codificación se amplía con los mismos mapas
+        (las categorías nuevas reciben su propio código o dummy), la caché
+        numérica se extiende y los resúmenes de ``moments`` se ponen al día
+        solo con las filas nuevas la próxima vez que se piden.
+        """
+        with self._lock:
+            entry = self[file_id]
+            missing = [c for c in entry["columns"] if c not in rows.columns]
+            extra = [c for c in rows.columns if c not in entry["columns"]]
+            if missing or extra:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Las columnas no coinciden con las del dataset (faltan: {missing}, sobran: {extra})"
+                )
+            start = entry["row_count"]
+            rows = compact_dataframe(rows[entry["columns"]].reset_index(drop=True))
+            combined = append_frames(entry["dataframe"], rows)
+            frames = {"dataframe": combined}
+            new_categories = {}
+            if "dummy_encoded" in entry:
+                block, encoding_maps, new_categories = extend_encoded_block(
+                    entry["dummy_encoded"].iloc[:, len(entry["columns"]):], rows, entry["encoding_maps"]
+                )
+                entry["dummy_encoded"] = pd.concat([combined, block], axis=1, copy=False)
+                entry["encoding_maps"] = encoding_maps
+                frames["dummy_encoded"] = block
+            entry["dataframe"] = combined
+            entry["row_count"] = len(combined)
+            entry["fingerprint"] = hashlib.sha256(
+                (entry["fingerprint"] + dataset_fingerprint(rows)).encode()
+            ).hexdigest()
+
+            working = self.working_frame(file_id)
+            cache = entry.get("numeric_cache", {})
+            for col, (values, valid) in cache.items():
+                new_values, new_valid = numeric_view(working[col].iloc[start:])
+                cache[col] = (np.concatenate([values, new_values]), np.concatenate([valid, new_valid]))
+            entry.pop("column_stats", None)
+            self._update_nbytes(entry)
+            self._persist(file_id, entry, frames)
+            self.enforce_budget(keep=file_id)
+            return {"rows_appended": len(rows), "row_count": entry["row_count"], "new_categories": new_categories}
+
+    def column_stats(self, file_id: str, columns: List[str]) -> Dict[str, Dict]:
+        """Resumen de cada columna; se calcula una sola vez y queda guardado en el dataset"""
+        with self._lock:
+            entry = self[file_id]
+            df = self.working_frame(file_id)
+            cache = entry.setdefault("column_stats", {})
+            for col in columns:
+                if col not in cache:
+                    cache[col] = column_summary(df[col])
+            return {col: cache[col] for col in columns}
+
+    def total_nbytes(self) -> int:
+        return sum(e["memory_bytes"] for e in self._entries.values() if "spilled" not in e)
+
+    def enforce_budget(self, keep: Optional[str] = None):
+        """Vuelca a disco los datasets menos usados hasta cumplir el presupuesto"""
+        with self._lock:
+            for file_id in list(self._entries):
+                if self.total_nbytes() <= self.memory_budget:
+                    break
+                entry = self._entries[file_id]
+                if file_id != keep and "spilled" not in entry:
+                    self._spill(file_id, entry)
+
+    def _update_nbytes(self, entry: Dict):
+        nbytes = frame_nbytes(entry["dataframe"])
+        if "dummy_encoded" in entry:
+            extra = entry["dummy_encoded"].columns[len(entry["columns"]):]
+            nbytes += frame_nbytes(entry["dummy_encoded"][extra])
+        for values, valid in entry.get("numeric_cache", {}).values():
+            nbytes += values.nbytes + valid.nbytes
+        entry["memory_bytes"] = nbytes
+
+    def _dataset_dir(self, file_id: str) -> Optional[Path]:
+        if self.persist_dir is None or not re.fullmatch(r"[\w-]+", str(file_id)):
+            return None
+        return self.persist_dir / file_id
 
-# Almacenamiento temporal de datos
-global_data: Dict[str, Dict] = {}
+    def _lookup(self, file_id: str) -> Optional[Dict]:
+        """Entrada del dataset; la (re)lee de disco si otro proceso la creó o modificó"""
+        with self._lock:
+            entry = self._entries.get(file_id)
+            directory = self._dataset_dir(file_id)
+            if directory is None or (entry is not None and not entry.get("persisted")):
+                return entry
+            try:
+                mtime = (directory / "meta.json").stat().st_mtime_ns
+            except OSError:
+                if entry is not None:
+                    del self._entries[file_id]  # borrado por otro proceso
+                return None
+            if entry is None or entry["meta_mtime"] != mtime:
+                entry = self._discover(file_id, directory)
+            return entry
+
+    def _discover(self, file_id: str, directory: Path) -> Dict:
+        """Registra un dataset persistido sin cargarlo; se abrirá con mmap al usarlo"""
+        meta_path = directory / "meta.json"
+        mtime = meta_path.stat().st_mtime_ns
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        entry = {
+            "columns": meta["columns"],
+            "row_count": meta["row_count"],
+            "fingerprint": meta["fingerprint"],
+            "memory_bytes": meta["memory_bytes"],
+            "persisted": True,
+            "meta_mtime": mtime,
+            "sparse_columns": meta.get("sparse_columns", []),
+            "spilled": {key: str(directory / f"{key}.arrow") for key in meta["frames"]},
+        }
+        if "encoding_maps" in meta:
+            entry["encoding_maps"] = meta["encoding_maps"]
+        self._entries[file_id] = entry
+        return entry
+
+    def _persist(self, file_id: str, entry: Dict, frames: Dict[str, pd.DataFrame]):
+        """Escribe los frames indicados y los metadatos en el directorio del dataset"""
+        directory = self._dataset_dir(file_id)
+        if directory is None:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        try:
+            for key, frame in frames.items():
+                write_arrow(frame, directory / f"{key}.arrow")
+        except (pyarrow.ArrowException, TypeError):
+            # Columnas que Arrow no representa (p. ej. tipos mezclados): el dataset queda solo en memoria
+            shutil.rmtree(directory, ignore_errors=True)
+            entry.pop("persisted", None)
+            entry.pop("meta_mtime", None)
+            return
+        if "dummy_encoded" in frames:
+            entry["sparse_columns"] = [
+                c for c, dtype in frames["dummy_encoded"].dtypes.items() if isinstance(dtype, pd.SparseDtype)
+            ]
+        meta = {
+            "file_id": file_id,
+            "columns": entry["columns"],
+            "row_count": entry["row_count"],
+            "fingerprint": entry["fingerprint"],
+            "memory_bytes": entry["memory_bytes"],
+            "frames": ["dataframe"] + (["dummy_encoded"] if "dummy_encoded" in entry else []),
+            "sparse_columns": entry.get("sparse_columns", []),
+        }
+        if "encoding_maps" in entry:
+            meta["encoding_maps"] = entry["encoding_maps"]
+        tmp = directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta, default=str), encoding="utf-8")
+        os.replace(tmp, directory / "meta.json")
+        entry["persisted"] = True
+        entry["meta_mtime"] = (directory / "meta.json").stat().st_mtime_ns
+
+    def _readable_spill(self, entry: Dict) -> bool:
+        """True si los ficheros volcados se pueden leer por bloques con pyarrow"""
+        return entry.get("persisted") or SPILL_FORMAT == "parquet"
+
+    def _spill(self, file_id: str, entry: Dict):
+        if entry.get("persisted"):
+            # Ya está en disco: basta con soltar los frames
+            directory = self._dataset_dir(file_id)
+            spilled = {"dataframe": str(directory / "dataframe.arrow")}
+            if "dummy_encoded" in entry:
+                spilled["dummy_encoded"] = str(directory / "dummy_encoded.arrow")
+        else:
+            self.spill_dir.mkdir(exist_ok=True)
+            frames = {"dataframe": entry["dataframe"]}
+            if "dummy_encoded" in entry:
+                frames["dummy_encoded"] = entry["dummy_encoded"].iloc[:, len(entry["columns"]):]
+            spilled = {}
+            for key, frame in frames.items():
+                path = self.spill_dir / f"{file_id}_{key}.{SPILL_FORMAT}"
+                if SPILL_FORMAT == "parquet":
+                    # Parquet no admite columnas dispersas: se guardan densas y se recuerdan
+                    sparse = [c for c, dtype in frame.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+                    if sparse:
+                        entry["spilled_sparse"] = sparse
+                        frame = frame.astype({c: frame[c].dtype.subtype for c in sparse})
+                    frame.to_parquet(path, index=False)
+                else:
+                    frame.to_pickle(path)
+                spilled[key] = str(path)
+        entry.pop("dataframe")
+        entry.pop("dummy_encoded", None)
+        entry.pop("numeric_cache", None)
+        entry["spilled"] = spilled
+
+    def _reload(self, file_id: str, entry: Dict):
+        frames = {}
+        for key, path in entry["spilled"].items():
+            if entry.get("persisted"):
+                frames[key] = read_arrow(path)
+                continue
+            frames[key] = pd.read_parquet(path) if SPILL_FORMAT == "parquet" else pd.read_pickle(path)
+            Path(path).unlink(missing_ok=True)
+        sparse = entry.pop("spilled_sparse", None) or entry.get("sparse_columns", [])
+        if sparse and "dummy_encoded" in frames:
+            frames["dummy_encoded"] = frames["dummy_encoded"].astype(
+                {c: pd.SparseDtype(frames["dummy_encoded"][c].dtype, 0) for c in sparse}
+            )
+        entry["dataframe"] = frames["dataframe"]
+        if "dummy_encoded" in frames:
+            entry["dummy_encoded"] = pd.concat([frames["dataframe"], frames["dummy_encoded"]], axis=1, copy=False)
+        del entry["spilled"]
+
+
+# Almacenamiento de datos (persistente si hay directorio de datasets)
+global_data = DatasetStore(DATASET_MEMORY_BUDGET, SPILL_DIR, DATASET_DIR)
+
+
+# Pool de procesos para ajustes y correlaciones
+JOB_WORKERS = int(os.environ.get("CORRSTAR_JOB_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+JOB_MAX_PENDING = int(os.environ.get("CORRSTAR_JOB_MAX_PENDING", "32"))  # trabajos en cola o ejecución
+JOB_HISTORY = 200  # trabajos terminados que se conservan para consultar su resultado
+JOB_DATA_DIR = Path(os.environ.get(
+    "CORRSTAR_JOB_DATA_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+))
+
+
+class AnalysisError(ValueError):
+    """Error en los datos detectado dentro de un trabajo; se devuelve como 400"""
+
+
+def share_array(array: np.ndarray, path: Path) -> str:
+    """Escribe el array en un .npy que los procesos del pool abren con mmap"""
+    mm = np.lib.format.open_memmap(path, mode="w+", dtype=array.dtype, shape=array.shape)
+    mm[...] = array
+    mm.flush()
+    del mm
+    return str(path)
+
+# Fichero de progreso del trabajo que ejecuta este proceso (ver report_progress)
+_progress_path: Optional[str] = None
+
+def run_job(fn, array_paths: Dict[str, str], params: Dict, progress_path: Optional[str] = None,
+            profile: bool = False):
+    """Punto de entrada en el proceso trabajador: abre los arrays sin copiarlos.
+
+    Devuelve la salida de ``fn`` junto con las etapas medidas y, si se pide,
+    el resumen de cProfile del trabajo.
+    """
+    global _progress_path, _job_stages
+    _progress_path = progress_path
+    _job_stages = []
+    arrays = {name: np.load(path, mmap_mode="r") for name, path in array_paths.items()}
+    profiler = cProfile.Profile() if profile else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        output = fn(**arrays, **params)
+        if profiler is not None:
+            profiler.disable()
+        return output, {"stages": _job_stages, "profile": profile_text(profiler) if profiler else None}
+    finally:
+        _progress_path = None
+        _job_stages = None
+
+def report_progress(done: int, total: int, stage: str = ""):
+    """Publica el avance del trabajo en curso; se consulta en /jobs/{job_id}"""
+    if _progress_path is None:
+        return
+    tmp = f"{_progress_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"done": done, "total": total, "stage": stage}, f)
+    os.replace(tmp, _progress_path)
+
+def read_progress(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class JobManager:
+    """Trabajos de cálculo en un pool de procesos acotado.
+
+    Los arrays de entrada se escriben una vez en ficheros .npy (en /dev/shm si
+    existe) que los procesos abren con mmap, así que el dataset no se
+    serializa con pickle. Un trabajo en cola se puede cancelar; uno que ya se
+    está ejecutando no se interrumpe, pero su resultado se descarta.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, data_dir: Path):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.data_dir = data_dir
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def active_count(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job["future"].done())
+
+    def submit(self, kind: str, fn, arrays: Dict[str, np.ndarray], params: Dict, finalize=None) -> str:
+        """Encola ``fn`` en el pool.
+
+        ``finalize`` se aplica una sola vez, en este proceso, a la salida del
+        trabajo antes de entregarla.
+        """
+        with self._lock:
+            if self.active_count() >= self.max_pending:
+                raise HTTPException(status_code=429, detail="Demasiados trabajos en curso, inténtalo más tarde")
+
+            job_id = str(uuid.uuid4())
+            self.data_dir.mkdir(parents=True, exist_ok=True)
+            paths, inline = {}, {}
+            for name, array in arrays.items():
+                if array.size:
+                    paths[name] = share_array(array, self.data_dir / f"corrstar-{job_id}-{name}.npy")
+                else:
+                    inline[name] = array  # mmap no admite ficheros vacíos
+
+            progress_path = str(self.data_dir / f"corrstar-{job_id}-progress.json")
+            trace = _current_trace.get()
+            args = (run_job, fn, paths, {**inline, **params}, progress_path, trace is not None and trace.profile)
+            try:
+                future = self._get_executor().submit(*args)
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. por memoria): se recrea el pool
+                self._executor = None
+                future = self._get_executor().submit(*args)
+
+            job = {
+                "job_id": job_id,
+                "kind": kind,
+                "future": future,
+                # "source" es el Parquet escrito para el entrenamiento por bloques
+                "paths": list(paths.values()) + ([params["source"]] if "source" in params else []),
+                "progress_path": progress_path,
+                "progress": None,
+                "submitted_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "cancel_requested": False,
+                "finalize": finalize,
+            }
+            self.jobs[job_id] = job
+            self._prune()
+        future.add_done_callback(lambda _, job=job: self._on_done(job))
+        return job_id
+
+    def _on_done(self, job: Dict):
+        for path in job["paths"]:
+            Path(path).unlink(missing_ok=True)
+        future = job["future"]
+        if not future.cancelled() and future.exception() is None:
+            for record in future.result()[1]["stages"]:
+                observe_stage(record)
+        job["progress"] = read_progress(job["progress_path"]) or job["progress"]
+        Path(job["progress_path"]).unlink(missing_ok=True)
+        job["finished_at"] = datetime.now().isoformat()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job["future"].done()]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Dict:
+        if job_id not in self.jobs:
+            raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+        return self.jobs[job_id]
+
+    def status(self, job_id: str) -> Dict:
+        job = self.get(job_id)
+        future = job["future"]
+        error = None
+        if future.cancelled() or (job["cancel_requested"] and future.done()):
+            status = "cancelled"
+        elif future.done():
+            error = future.exception()
+            status = "failed" if error else "done"
+        elif future.running():
+            status = "cancelling" if job["cancel_requested"] else "running"
+            job["progress"] = read_progress(job["progress_path"]) or job["progress"]
+        else:
+            status = "queued"
+        return {
+            "job_id": job_id,
+            "kind": job["kind"],
+            "status": status,
+            "submitted_at": job["submitted_at"],
+            "finished_at": job["finished_at"],
+            "progress": job["progress"],
+            "error": str(error) if error else None,
+        }
+
+    def result(self, job_id: str):
+        status = self.status(job_id)["status"]
+        if status == "cancelled":
+            raise HTTPException(status_code=410, detail="El trabajo fue cancelado")
+        if status in ("queued", "running", "cancelling"):
+            raise HTTPException(status_code=409, detail="El trabajo aún no ha terminado")
+        job = self.jobs[job_id]
+        try:
+            output, _ = job["future"].result()
+        except AnalysisError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if "result" not in job:
+            job["result"] = job["finalize"](output) if job["finalize"] else output
+        return job["result"]
+
+    def cancel(self, job_id: str) -> Dict:
+        job = self.get(job_id)
+        if not job["future"].cancel():
+            job["cancel_requested"] = True
+        return self.status(job_id)
+
+    async def run(self, kind: str, fn, arrays: Dict[str, np.ndarray], params: Dict, finalize=None):
+        """Ejecuta el trabajo en el pool y espera su resultado sin bloquear el event loop"""
+        job_id = await run_in_threadpool(self.submit, kind, fn, arrays, params)
+        try:
+            output, report = await asyncio.wrap_future(self.jobs[job_id]["future"])
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.stages += report["stages"]
+                if report["profile"]:
+                    trace.reports.append((f"Pool: {kind}", report["profile"]))
+            return finalize(output) if finalize else output
+        except AnalysisError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            self.jobs.pop(job_id, None)
+
+    def warm_up(self, fn) -> List:
+        """Arranca los procesos del pool y ejecuta ``fn`` en cada uno sin esperar"""
+        executor = self._get_executor()
+        return [executor.submit(fn) for _ in range(self.max_workers)]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager(JOB_WORKERS, JOB_MAX_PENDING, JOB_DATA_DIR)
+
+
+# Resultados de entrenamiento y caché de gráficos
+RESULT_STORE_BYTES = int(os.environ.get("CORRSTAR_RESULT_STORE_MB", "256")) * 1024 * 1024
+PLOT_CACHE_BYTES = int(os.environ.get("CORRSTAR_PLOT_CACHE_MB", "64")) * 1024 * 1024
+
+# Reducción de datos para gráficos
+PLOT_MAX_POINTS = int(os.environ.get("CORRSTAR_PLOT_MAX_POINTS", "5000"))  # puntos dibujados por gráfico
+PLOT_DENSITY_THRESHOLD = int(os.environ.get("CORRSTAR_PLOT_DENSITY_THRESHOLD", "50000"))  # por encima, densidad
+PLOT_DENSITY_BINS = 100
+
+# Regresión lineal por estadísticos suficientes
+OLS_CHOLESKY_RTOL = 1e-7  # pivote mínimo relativo de Cholesky; por debajo se usa la pseudoinversa
+
+
+class ResultStore:
+    """Datos de los gráficos de cada entrenamiento y PNG ya dibujados.
+
+    Ambos se expulsan por LRU cuando superan su límite de bytes; un gráfico
+    expulsado de la caché se vuelve a dibujar desde sus datos.
+    """
+
+    def __init__(self, max_bytes: int, max_png_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_png_bytes = max_png_bytes
+        self._results: "OrderedDict[str, Dict]" = OrderedDict()
+        self._pngs: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, plots: Dict[str, Dict], result_id: Optional[str] = None) -> str:
+        result_id = result_id or str(uuid.uuid4())
+        nbytes = sum(a.nbytes for spec in plots.values() for a in spec["arrays"].values())
+        with self._lock:
+            self._results[result_id] = {"plots": plots, "nbytes": nbytes}
+            total = sum(r["nbytes"] for r in self._results.values())
+            while total > self.max_bytes and len(self._results) > 1:
+                _, evicted = self._results.popitem(last=False)
+                total -= evicted["nbytes"]
+        return result_id
+
+    def plots(self, result_id: str) -> Optional[Dict[str, Dict]]:
+        with self._lock:
+            stored = self._results.get(result_id)
+            return stored["plots"] if stored else None
+
+    def plot_spec(self, result_id: str, name: str) -> Dict:
+        with self._lock:
+            if result_id not in self._results:
+                raise HTTPException(status_code=404, detail="Resultado no encontrado o expirado")
+            self._results.move_to_end(result_id)
+            plots = self._results[result_id]["plots"]
+        if name not in plots:
+            raise HTTPException(status_code=404, detail=f"Gráfico '{name}' no disponible")
+        return plots[name]
+
+    def cached_png(self, result_id: str, name: str) -> Optional[bytes]:
+        with self._lock:
+            png = self._pngs.get((result_id, name))
+            if png is not None:
+                self._pngs.move_to_end((result_id, name))
+            return png
+
+    def cache_png(self, result_id: str, name: str, png: bytes):
+        with self._lock:
+            self._pngs[(result_id, name)] = png
+            total = sum(len(b) for b in self._pngs.values())
+            while total > self.max_png_bytes and len(self._pngs) > 1:
+                _, evicted = self._pngs.popitem(last=False)
+                total -= len(evicted)
+
+
+result_store = ResultStore(RESULT_STORE_BYTES, PLOT_CACHE_BYTES)
+
+@stage("result.publish")
+def publish_result(output: Dict) -> Dict:
+    """Guarda los datos de los gráficos y devuelve el resultado con sus URLs"""
+    result = output["result"]
+    available = {name: spec for name, spec in output["plots"].items() if spec is not None}
+    result_id = result_store.add(available)
+    result["result_id"] = result_id
+    result["plots"] = {
+        name: f"/results/{result_id}/plots/{name}" if name in available else None
+        for name in output["plots"]
+    }
+    return result
+
+
+# Caché de resultados de análisis
+ANALYSIS_CACHE_BYTES = int(os.environ.get("CORRSTAR_ANALYSIS_CACHE_MB", "128")) * 1024 * 1024
+ANALYSIS_CACHE_DIR = os.environ.get("CORRSTAR_ANALYSIS_CACHE_DIR")  # si se define, también se guarda en disco
+
+
+class AnalysisCache:
+    """Respuestas de análisis indexadas por el hash de todo lo que las determina.
+
+    La clave combina la huella del dataset, su codificación, el endpoint y el
+    cuerpo normalizado de la petición, así que un dataset modificado nunca
+    reutiliza resultados antiguos. Se expulsa por LRU al superar el límite de
+    bytes, tanto en memoria como en el directorio opcional de disco.
+    """
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(file_id: str, endpoint: str, body: BaseModel) -> str:
+        entry = global_data.entry(file_id)
+        payload = json.dumps({
+            "dataset": entry["fingerprint"],
+            "encoding": entry.get("encoding_maps", {}),
+            "endpoint": endpoint,
+            "body": body.model_dump(),
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        if self.directory is None:
+            return None
+        path = self.directory / f"{key}.pkl"
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        os.utime(path)
+        cached = pickle.loads(blob)
+        self._remember(key, cached, len(blob))
+        return cached
+
+    def put(self, key: str, cached: Dict):
+        blob = pickle.dumps(cached, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, cached, len(blob))
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f"{key}.tmp"
+            tmp.write_bytes(blob)
+            os.replace(tmp, self.directory / f"{key}.pkl")
+            self._trim_directory()
+
+    def _remember(self, key: str, cached: Dict, nbytes: int):
+        with self._lock:
+            self._entries[key] = (cached, nbytes)
+            self._entries.move_to_end(key)
+            total = sum(n for _, n in self._entries.values())
+            while total > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                total -= evicted
+
+    def clear(self):
+        """Vacía la caché en memoria (el directorio de disco se conserva)"""
+        with self._lock:
+            self._entries.clear()
+
+    def _trim_directory(self):
+        files = sorted(self.directory.glob("*.pkl"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        for path in files[:-1]:
+            if total <= self.max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+
+analysis_cache = AnalysisCache(ANALYSIS_CACHE_BYTES, ANALYSIS_CACHE_DIR)
+
+
+async def cached_analysis(request: Request, file_id: str, endpoint: str, body: BaseModel, compute):
+    """Devuelve la respuesta cacheada de una petición idéntica o la calcula con ``compute``.
+
+    La clave viaja como ETag; si el cliente la envía en If-None-Match se
+    responde 304 sin cuerpo.
+    """
+    if file_id not in global_data:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    key = await run_in_threadpool(analysis_cache.key, file_id, endpoint, body)
+    etag = f'"{key}"'
+    trace = _current_trace.get()
+    cached = None if trace is not None and trace.profile else analysis_cache.get(key)  # ?profile=1 recalcula
+    if cached is not None and not model_registry.exists(cached["response"].get("model_id")):
+        cached = None  # el modelo guardado se borró: se vuelve a entrenar
+    if cached is not None:
+        result_id = cached["response"].get("result_id")
+        if result_id and result_store.plots(result_id) is None:
+            result_store.add(cached["plots"], result_id)
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers={"ETag": etag})
+        return APIResponse(cached["response"], headers={"ETag": etag})
+
+    result = await compute()
+    plots = result_store.plots(result["result_id"]) if "result_id" in result else None
+    await run_in_threadpool(analysis_cache.put, key, {"response": result, "plots": plots})
+    return APIResponse(result, headers={"ETag": etag})
+
+
+# Registro de modelos guardados
+MODEL_CACHE_SIZE = int(os.environ.get("CORRSTAR_MODEL_CACHE_SIZE", "8"))
+MAX_SAVED_MODELS = int(os.environ.get("CORRSTAR_MAX_SAVED_MODELS", "64"))  # en disco; se borran los menos usados
+
+
+class ModelRegistry:
+    """Modelos guardados en MODELS_DIR con una caché LRU de los ya cargados.
+
+    Así las predicciones repetidas sobre el mismo modelo no pagan
+    ``joblib.load`` en cada petición. En disco se guardan como mucho
+    ``max_saved`` modelos: la fecha de modificación del .joblib marca su
+    último uso y ``prune`` borra los más antiguos.
+    """
+
+    def __init__(self, models_dir: Path, cache_size: int, max_saved: int):
+        self.models_dir = models_dir
+        self.cache_size = cache_size
+        self.max_saved = max(max_saved, cache_size)  # los cargados en la caché no se borran por antigüedad
+        self._loaded: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_id(self, model_id: str):
+        try:
+            uuid.UUID(model_id)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Modelo no encontrado")
+        if not (self.models_dir / f"{model_id}.joblib").exists():
+            raise HTTPException(status_code=404, detail="Modelo no encontrado")
+
+    def list(self) -> List[Dict]:
+        models = []
+        for path in sorted(self.models_dir.glob("*.json"), key=lambda p: p.stat().st_mtime):
+            with open(path, encoding="utf-8") as f:
+                models.append(json.load(f))
+        return models
+
+    def metadata(self, model_id: str) -> Dict:
+        self._check_id(model_id)
+        with open(self.models_dir / f"{model_id}.json", encoding="utf-8") as f:
+            info = json.load(f)
+        info["loaded"] = model_id in self._loaded
+        return info
+
+    def load(self, model_id: str) -> Dict:
+        """Devuelve el modelo guardado, desde la caché si ya estaba cargado"""
+        self._check_id(model_id)  # también descarta los borrados por prune en otro proceso
+        try:
+            os.utime(self.models_dir / f"{model_id}.joblib")  # último uso, para prune
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Modelo no encontrado")
+        with self._lock:
+            if model_id in self._loaded:
+                self._loaded.move_to_end(model_id)
+                return self._loaded[model_id]
+        save_data = load_model_from_disk(model_id, self.models_dir)
+        if save_data is None:  # borrado entre medias: no se guarda en la caché
+            raise HTTPException(status_code=404, detail="Modelo no encontrado")
+        with self._lock:
+            self._loaded[model_id] = save_data
+            while len(self._loaded) > self.cache_size:
+                self._loaded.popitem(last=False)
+        return save_data
+
+    def exists(self, model_id: Optional[str]) -> bool:
+        """True si no hay modelo asociado o si su fichero sigue en disco"""
+        return model_id is None or (self.models_dir / f"{model_id}.joblib").exists()
+
+    def delete(self, model_id: str):
+        self._check_id(model_id)
+        self._remove(model_id)
+
+    def prune(self):
+        """Borra los modelos menos usados hasta dejar ``max_saved`` en disco"""
+        def last_used(path: Path) -> float:
+            try:
+                return path.stat().st_mtime
+            except FileNotFoundError:  # borrado a la vez por otro proceso
+                return 0.0
+
+        paths = sorted(self.models_dir.glob("*.joblib"), key=last_used)
+        for path in paths[:max(0, len(paths) - self.max_saved)]:
+            self._remove(path.stem)
+
+    def _remove(self, model_id: str):
+        with self._lock:
+            self._loaded.pop(model_id, None)
+        (self.models_dir / f"{model_id}.joblib").unlink(missing_ok=True)
+        (self.models_dir / f"{model_id}.json").unlink(missing_ok=True)
+
+
+model_registry = ModelRegistry(MODELS_DIR, MODEL_CACHE_SIZE, MAX_SAVED_MODELS)
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    job_manager.shutdown()
+
+
+# Precalentamiento tras el arranque
+WARMUP = os.environ.get("CORRSTAR_WARMUP", "1") != "0"
+STARTUP_BUDGET_SECONDS = float(os.environ.get("CORRSTAR_STARTUP_BUDGET_SECONDS", "2.5"))  # import Server
+HEAVY_MODULES = ("scipy.stats", "sklearn", "statsmodels", "matplotlib", "seaborn")  # no se cargan al importar
+
+
+def warm_up_fits():
+    """Importa las librerías pesadas y ejecuta ajustes y gráficos diminutos.
+
+    Así la primera petición real no paga las importaciones, la caché de
+    fuentes de matplotlib ni la inicialización de BLAS.
+    """
+    import scipy.sparse  # noqa: F401  (codificación)
+    import statsmodels.api as sm
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    y = X @ np.array([1.0, -1.0, 0.5]) + rng.normal(size=200)
+    labels = LabelEncoder().fit_transform(y > 0)
+    X_train, X_test, y_train, y_test = train_test_split(X, labels, test_size=0.3, random_state=42)
+    design = sm.add_constant(X)
+    ols_from_crossproducts(design.T @ design, design.T @ y, y @ y, len(y), "y", ["a", "b", "c"], np.column_stack([y, X]))
+    sm.Logit(y_train, sm.add_constant(X_train)).fit(disp=0)
+    LogisticRegression().fit(X_train, y_train)
+    roc_auc_score(y_test, LDA().fit(X_train, y_train).predict_proba(X_test)[:, 1])
+    correlation_matrix(X, "kendall")
+    render_plot("confusion_matrix", matrix=np.eye(2, dtype=int))
+
+def warm_up():
+    """Precalienta los procesos del pool y este mismo; es solo una optimización"""
+    try:
+        job_manager.warm_up(warm_up_fits)
+        warm_up_fits()
+    except Exception as e:
+        logging.getLogger(__name__).warning("Precalentamiento fallido: %s", e)
+
+@app.on_event("startup")
+def start_warm_up():
+    # En un hilo: el servidor empieza a atender mientras se cargan las librerías
+    if WARMUP:
+        threading.Thread(target=warm_up, name="corrstar-warmup", daemon=True).start()
+
+def startup_benchmark(runs: int = 5) -> Dict:
+    """Mide ``import Server`` en procesos nuevos, como el arranque de cada worker"""
+    import subprocess
+    import sys
+    code = (
+        "import json, sys, time; t = time.perf_counter(); import Server; "
+        "print(json.dumps([time.perf_counter() - t, [m for m in Server.HEAVY_MODULES if m in sys.modules]]))"
+    )
+    times, eager = [], set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parent,
+                             capture_output=True, text=True, check=True).stdout
+        seconds, loaded = json.loads(out.strip().splitlines()[-1])
+        times.append(seconds)
+        eager.update(loaded)
+    median = float(np.median(times))
+    return {
+        "runs": runs,
+        "median_seconds": median,
+        "max_seconds": max(times),
+        "budget_seconds": STARTUP_BUDGET_SECONDS,
+        "eager_heavy_modules": sorted(eager),
+        "ok": median <= STARTUP_BUDGET_SECONDS and not eager,
+    }
+
+def count_csv_lines(path: str) -> int:
+    """Cuenta los saltos de línea del archivo (cota superior del número de filas)"""
+    lines = 0
+    with open(path, "rb") as f:
+        while block := f.read(UPLOAD_CHUNK_SIZE):
+            lines += block.count(b"\n")
+    return lines + 1
+
+@stage("upload.parse")
+def read_csv_chunked(path: str, text_columns: List[str] = ()):
+    """Lee un CSV por bloques sobre buffers preasignados.
+
+    Los tipos se infieren una vez con una muestra: las columnas enteras se
+    parsean como int64 (sin pasar por float64, que perdería precisión por
+    encima de 2**53), el resto de numéricas como float64 y las demás (y las
+    de ``text_columns``) como texto. Cada bloque se copia en su buffer y se
+    libera, de modo que el pico de memoria es el DataFrame final más un
+    bloque. Si un bloque no respeta los tipos de la muestra se recurre a una
+    lectura completa.
+    """
+    text = {c: object for c in text_columns}
+    sample = pd.read_csv(path, nrows=CSV_SAMPLE_ROWS, dtype=text)
+    numeric_cols = [
+        c for c in sample.columns
+        if pd.api.types.is_numeric_dtype(sample[c]) and not pd.api.types.is_bool_dtype(sample[c])
+    ]
+    int_cols = [c for c in numeric_cols if pd.api.types.is_integer_dtype(sample[c])]
+    bool_cols = [c for c in sample.columns if pd.api.types.is_bool_dtype(sample[c])]
+    column_order = sample.columns.tolist()
+    dtypes = {
+        c: ("Int64" if c in int_cols else "float64" if c in numeric_cols else object)
+        for c in column_order if c not in bool_cols
+    }
+    del sample
+
+    max_rows = count_csv_lines(path)
+    buffers = {
+        c: np.empty(max_rows, dtype=np.int64 if c in int_cols else np.float64 if c in numeric_cols else object)
+        for c in column_order
+    }
+    nulls = {c: np.zeros(max_rows, dtype=bool) for c in int_cols}  # huecos de las columnas enteras
+    rows = 0
+    chunks = 0
+    try:
+        with pd.read_csv(path, dtype=dtypes, chunksize=CSV_CHUNK_ROWS) as reader:
+            for chunk in reader:
+                n = len(chunk)
+                for c in chunk.columns:
+                    if c in nulls:
+                        nulls[c][rows:rows + n] = chunk[c].isna().to_numpy()
+                        buffers[c][rows:rows + n] = chunk[c].to_numpy(dtype=np.int64, na_value=0)
+                    else:
+                        buffers[c][rows:rows + n] = chunk[c].to_numpy()
+                rows += n
+                chunks += 1
+    except (ValueError, TypeError, OverflowError):
+        df = pd.read_csv(path, dtype=text)
+        stage_size(*df.shape)
+        return df, 1
+
+    columns = {}
+    for c in buffers:
+        values = buffers[c][:rows]
+        if c in nulls and nulls[c][:rows].any():  # como pd.read_csv: enteros con nulos pasan a float64
+            values = np.where(nulls[c][:rows], np.nan, values.astype(np.float64))
+        elif c in bool_cols and all(isinstance(v, (bool, np.bool_)) for v in values):
+            values = values.astype(bool)
+        columns[c] = values
+    df = pd.DataFrame(columns, columns=column_order, copy=False)
+    stage_size(*df.shape)
+    return df, chunks
+
+async def spool_to_tempfile(chunks, suffix: str = ".csv"):
+    """Vuelca un iterable asíncrono de bloques de bytes a un archivo temporal"""
+    bytes_read = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        async for chunk in chunks:
+            temp_file.write(chunk)
+            bytes_read += len(chunk)
+    return temp_file.name, bytes_read
+
+async def iter_upload(file: UploadFile):
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
 
 @app.post("/upload-csv/")
 async def upload_csv(file: UploadFile = File(...)):
     """Endpoint para subir archivo CSV"""
     try:
-        # Crear archivo temporal
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        
-        # Leer CSV
-        df = pd.read_csv(temp_file_path)
-        os.unlink(temp_file_path)  # Eliminar archivo temporal
+        # Volcar el cuerpo a un archivo temporal por bloques
+        with stage("upload.spool"):
+            temp_file_path, bytes_read = await spool_to_tempfile(iter_upload(file))
+
+        # Leer CSV fuera del event loop
+        try:
+            df, chunks = await run_in_threadpool(read_csv_chunked, temp_file_path)
+        finally:
+            os.unlink(temp_file_path)  # Eliminar archivo temporal
         
-        # Almacenar datos
-        file_id = str(len(global_data) + 1)
-        global_data[file_id] = {
-            "dataframe": df,
-            "columns": df.columns.tolist()
-        }
+        # Almacenar datos (compactar, huella y escritura en disco fuera del event loop)
+        file_id = await run_in_threadpool(global_data.new_id)
+        with stage("upload.store"):
+            await run_in_threadpool(global_data.__setitem__, file_id, {
+                "dataframe": df,
+                "columns": df.columns.tolist()
+            })
         
         return {
             "file_id": file_id,
             "columns": df.columns.tolist(),
-            "row_count": len(df)
+            "row_count": len(df),
+            "bytes_read": bytes_read,
+            "chunks_parsed": chunks
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al procesar el archivo: {str(e)}")
@@ -94,85 +1788,562 @@ async def upload_csv(file: UploadFile = File(...)):
 class CorrelationRequest(BaseModel):
     variables: List[str]
     method: str = "pearson"  # por defecto
+    missing: Literal["listwise", "pairwise"] = "listwise"
 
-@app.post("/calculate-correlation/{file_id}")
-async def calculate_correlation(file_id: str, req: CorrelationRequest):
+def model_metadata(file_id: str, target: str, features: List[str]) -> Dict:
+    """Metadatos que se guardan con el modelo para poder puntuar datos nuevos"""
+    return {
+        "file_id": file_id,
+        "target": target,
+        "features": features,
+        "encoding_maps": global_data.entry(file_id).get("encoding_maps", {}),
+    }
+
+def check_correlation_request(file_id: str, req: CorrelationRequest):
+    """Valida variables, método y dataset; devuelve las variables y el método normalizado"""
     variables = req.variables
     method = req.method.lower()
 
     if len(variables) < 2:
         raise HTTPException(status_code=400, detail="Selecciona al menos 2 variables")
+
+    if method not in CORRELATION_METHODS:
+        raise HTTPException(status_code=400, detail="Método de correlación no válido")
     
     if file_id not in global_data:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    
-    if "dummy_encoded" in global_data[file_id]:
-        df = global_data[file_id]["dummy_encoded"]
-
-    elif "ordinal_encoded" in global_data[file_id]:
-        df = global_data[file_id]["ordinal_encoded"]
-    else:
-        df = global_data[file_id]["dataframe"]
 
+    df = global_data.working_frame(file_id)
 
     for var in variables:
         if var not in df.columns:
             raise HTTPException(status_code=400, detail=f"Variable {var} no encontrada")
+    return variables, method
 
-    numeric_df = df[variables].apply(pd.to_numeric, errors='coerce').dropna()
-    
-    if len(numeric_df) < 2:
+@stage("correlation.prepare")
+def prepare_correlation(file_id: str, req: CorrelationRequest):
+    """Valida la petición y devuelve los arrays y parámetros del trabajo"""
+    variables, method = check_correlation_request(file_id, req)
+    values, _ = global_data.numeric_columns(file_id, variables)
+    return {"values": values}, {"variables": variables, "method": method, "missing": req.missing}
+
+def seed_moments_from(file_id: str, columns: List[str], token: Tuple, finalize=None):
+    """``finalize`` de los trabajos con ``summarize``: guarda su resumen de momentos y sigue con ``finalize``"""
+    def seed(output: Dict):
+        stats = output.pop("moments", None)
+        if stats is not None:
+            global_data.seed_moments(file_id, columns, stats, token)
+        return finalize(output) if finalize else output
+    return seed
+
+@stage("correlation.moments")
+def correlation_from_moments(file_id: str, req: CorrelationRequest) -> Optional[Dict]:
+    """Pearson por casos completos a partir del resumen incremental del dataset.
+
+    Mismo resultado que ``run_correlation``; tras un /append solo se procesan
+    las filas nuevas. Devuelve None si aún no hay resumen de las variables:
+    lo siembra el primer cálculo en el pool.
+    """
+    variables, method = check_correlation_request(file_id, req)
+    stats = global_data.cached_moments(file_id, variables)
+    if stats is None:
+        return None
+    if stats["n"] < 2:
         raise HTTPException(status_code=400, detail="No hay suficientes datos válidos para calcular correlaciones")
+    scale = np.sqrt(np.diag(stats["m2"]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.clip(stats["m2"] / np.outer(scale, scale), -1.0, 1.0)
+    p = correlation_p_values(r, stats["n"])
+    np.fill_diagonal(r, 1.0)
+    np.fill_diagonal(p, 0.0)
+    return {
+        "variables": variables,
+        "method": method,
+        "missing": req.missing,
+        "correlation_matrix": r,
+        "p_value_matrix": p,
+        "n_matrix": np.full(r.shape, stats["n"]),
+        "n_observations": stats["n"],
+    }
 
-    correlation_matrix = []
-    
-    for i, var1 in enumerate(variables):
-        row = []
-        for j, var2 in enumerate(variables):
-            if i == j:
-                row.append(1.0)
-            elif i < j:
-                if method == "pearson":
-                    corr, _ = pearsonr(numeric_df[var1], numeric_df[var2])
-                elif method == "spearman":
-                    corr, _ = spearmanr(numeric_df[var1], numeric_df[var2])
-                elif method == "kendall":
-                    corr, _ = kendalltau(numeric_df[var1], numeric_df[var2])
-                else:
-                    raise HTTPException(status_code=400, detail="Método de correlación no válido")
-                row.append(float(corr))
-            else:
-                row.append(correlation_matrix[j][i])
-        correlation_matrix.append(row)
+@stage("correlation.compute")
+def run_correlation(values: np.ndarray, variables: List[str], method: str, missing: str, summarize: bool = False):
+    """Calcula las correlaciones (se ejecuta en el pool de procesos).
+
+    Con ``summarize`` la salida incluye en "moments" el resumen de las filas
+    completas para sembrar ``global_data.moments``.
+    """
+    stage_size(*values.shape)
+    if missing == "pairwise":
+        r, p, n = pairwise_correlation_matrix(values, method)
+        if (n[~np.eye(len(variables), dtype=bool)] < 2).all():
+            raise AnalysisError("No hay suficientes datos válidos para calcular correlaciones")
+        result = {}
+    else:
+        values = values[~np.isnan(values).any(axis=1)]
+        if len(values) < 2:
+            raise AnalysisError("No hay suficientes datos válidos para calcular correlaciones")
+        r, p = correlation_matrix(values, method)
+        n = np.full(r.shape, len(values))
+        result = {"n_observations": len(values)}
+        if summarize:
+            result["moments"] = column_moments(values)
 
     return {
         "variables": variables,
         "method": method,
-        "correlation_matrix": correlation_matrix
+        "missing": missing,
+        "correlation_matrix": r,
+        "p_value_matrix": p,
+        "n_matrix": n,
+        **result
     }
 
+@app.post("/calculate-correlation/{file_id}")
+async def calculate_correlation(file_id: str, req: CorrelationRequest, request: Request):
+    async def compute():
+        summarize = req.method.lower() == "pearson" and req.missing == "listwise"
+        if summarize:
+            output = await run_in_threadpool(correlation_from_moments, file_id, req)
+            if output is not None:
+                return output
+            token = global_data.moments_token(file_id)
+        arrays, params = await run_in_threadpool(prepare_correlation, file_id, req)
+        if not summarize:
+            return await job_manager.run("correlation", run_correlation, arrays, params)
+        return await job_manager.run("correlation", run_correlation, arrays, {**params, "summarize": True},
+                                     seed_moments_from(file_id, params["variables"], token))
+    return await cached_analysis(request, file_id, "correlation", req, compute)
+
 ##funciones
 def quote(name: str) -> str:
     return f'Q("{name}")'
 
 def clean_json_data(obj):
-    if isinstance(obj, float):
+    """NaN e infinitos a None recorriendo todo el objeto.
+
+    Solo hace falta para escribir JSON con el módulo estándar (metadatos de
+    los modelos o APIResponse sin orjson); las respuestas no pasan por aquí.
+    """
+    if isinstance(obj, np.ndarray):
+        return clean_json_data(obj.tolist())
+    if isinstance(obj, (float, np.floating)):
         if np.isnan(obj) or np.isinf(obj):
             return None
-        return obj
+        return float(obj)
     elif isinstance(obj, dict):
         return {k: clean_json_data(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
+    elif isinstance(obj, (list, tuple)):
         return [clean_json_data(i) for i in obj]
     else:
         return obj
     
-def generate_interactive_plot(fig):
-    """Convierte gráfico Plotly a HTML para frontend"""
-    return fig.to_html(full_html=False, include_plotlyjs='cdn')
+CORRELATION_METHODS = ("pearson", "spearman", "kendall")
+
+def correlation_p_values(r: np.ndarray, n) -> np.ndarray:
+    """p-valores bilaterales de la prueba t para cada coeficiente"""
+    from scipy.stats import t as student_t
+    dof = np.asarray(n, dtype=np.float64) - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = r * np.sqrt(dof / ((1.0 - r) * (1.0 + r)))
+        p = 2 * student_t.sf(np.abs(t_stat), dof)
+    p = np.where(np.abs(r) == 1.0, 0.0, p)
+    p = np.where(dof <= 0, 1.0, p)
+    return np.where(np.isnan(r), np.nan, p)
+
+def pearson_matrix(values: np.ndarray):
+    """Pearson de todas las columnas con un único producto matricial"""
+    centered = values - values.mean(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = centered / np.sqrt((centered ** 2).sum(axis=0))
+    r = np.clip(z.T @ z, -1.0, 1.0)
+    return r, correlation_p_values(r, values.shape[0])
+
+def kendall_pair(x: np.ndarray, y: np.ndarray, valid: Optional[np.ndarray] = None):
+    from scipy.stats import kendalltau
+    if valid is not None:
+        x, y = x[valid], y[valid]
+    if len(x) < 2:
+        return np.nan, np.nan
+    return kendalltau(x, y)
+
+def kendall_matrix(values: np.ndarray, valid: Optional[np.ndarray] = None):
+    """Kendall tau-b por pares (O(n log n) cada uno) repartidos entre hilos.
+
+    Con ``valid`` cada par usa solo sus filas completas.
+    """
+    k = values.shape[1]
+    pairs = [(i, j) for i in range(k) for j in range(i + 1, k)]
+    results = joblib.Parallel(n_jobs=CORRELATION_N_JOBS, prefer="threads")(
+        joblib.delayed(kendall_pair)(
+            values[:, i], values[:, j], None if valid is None else valid[:, i] & valid[:, j]
+        )
+        for i, j in pairs
+    )
+    r = np.eye(k)
+    p = np.zeros((k, k))
+    for (i, j), res in zip(pairs, results):
+        r[i, j] = r[j, i] = res[0]
+        p[i, j] = p[j, i] = res[1]
+    return r, p
+
+def correlation_matrix(values: np.ndarray, method: str):
+    """Matrices de correlación y p-valores de todas las columnas en una pasada.
+
+    Spearman ordena cada columna una sola vez y reutiliza Pearson.
+    """
+    from scipy.stats import rankdata
+    if method == "pearson":
+        r, p = pearson_matrix(values)
+    elif method == "spearman":
+        r, p = pearson_matrix(rankdata(values, axis=0))
+    else:
+        r, p = kendall_matrix(values)
+    np.fill_diagonal(r, 1.0)
+    np.fill_diagonal(p, 0.0)
+    return r, p
+
+def pairwise_counts(valid: np.ndarray) -> np.ndarray:
+    """Número de filas con ambos valores presentes para cada par de columnas"""
+    k = valid.shape[1]
+    n = np.zeros((k, k))
+    for start in range(0, valid.shape[0], PAIRWISE_BLOCK_ROWS):
+        v = valid[start:start + PAIRWISE_BLOCK_ROWS].astype(np.float64)
+        n += v.T @ v
+    return n.round().astype(np.int64)
+
+def pairwise_pearson_matrix(values: np.ndarray):
+    """Pearson por pares completos a partir de sumas enmascaradas acumuladas por bloques"""
+    k = values.shape[1]
+    shift = np.nanmean(values, axis=0)  # centrar reduce la cancelación numérica
+    n = np.zeros((k, k))
+    sx = np.zeros((k, k))
+    sxx = np.zeros((k, k))
+    sxy = np.zeros((k, k))
+    for start in range(0, values.shape[0], PAIRWISE_BLOCK_ROWS):
+        block = values[start:start + PAIRWISE_BLOCK_ROWS] - shift
+        valid = ~np.isnan(block)
+        v = valid.astype(np.float64)
+        x = np.where(valid, block, 0.0)
+        n += v.T @ v
+        sx += x.T @ v  # sx[i, j] = suma de x_i en las filas donde i y j son válidos
+        sxx += (x * x).T @ v
+        sxy += x.T @ x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sx.T / n
+        ss = sxx - sx ** 2 / n
+        r = np.clip(cov / np.sqrt(ss * ss.T), -1.0, 1.0)
+    n = n.round().astype(np.int64)
+    r[n < 2] = np.nan
+    return r, correlation_p_values(r, n), n
+
+def pairwise_spearman_matrix(values: np.ndarray, valid: np.ndarray):
+    """Spearman por pares completos.
+
+    Las columnas se agrupan por patrón de nulos: todos los pares entre dos
+    grupos comparten las mismas filas, así que se ordenan una vez por
+    combinación de grupos (una sola vez si no hay nulos).
+    """
+    k = values.shape[1]
+    patterns: Dict[bytes, List[int]] = {}
+    for c in range(k):
+        patterns.setdefault(np.packbits(valid[:, c]).tobytes(), []).append(c)
+    groups = list(patterns.values())
+
+    r = np.full((k, k), np.nan)
+    p = np.full((k, k), np.nan)
+    for a, group_a in enumerate(groups):
+        for group_b in groups[a:]:
+            same = group_b is group_a
+            rows = valid[:, group_a[0]] & valid[:, group_b[0]]
+            if rows.sum() < 2:
+                continue
+            cols = group_a if same else group_a + group_b
+            r_sub, p_sub = correlation_matrix(values[np.ix_(rows, cols)], "spearman")
+            if same:
+                r[np.ix_(group_a, group_a)] = r_sub
+                p[np.ix_(group_a, group_a)] = p_sub
+            else:
+                na = len(group_a)
+                r[np.ix_(group_a, group_b)] = r_sub[:na, na:]
+                r[np.ix_(group_b, group_a)] = r_sub[na:, :na]
+                p[np.ix_(group_a, group_b)] = p_sub[:na, na:]
+                p[np.ix_(group_b, group_a)] = p_sub[na:, :na]
+    return r, p
+
+def pairwise_correlation_matrix(values: np.ndarray, method: str):
+    """Correlaciones usando las observaciones completas de cada par.
+
+    Devuelve también el tamaño muestral efectivo de cada par.
+    """
+    valid = ~np.isnan(values)
+    if method == "pearson":
+        r, p, n = pairwise_pearson_matrix(values)
+    else:
+        n = pairwise_counts(valid)
+        if method == "spearman":
+            r, p = pairwise_spearman_matrix(values, valid)
+        else:
+            r, p = kendall_matrix(values, valid)
+    np.fill_diagonal(r, 1.0)
+    np.fill_diagonal(p, 0.0)
+    return r, p, n
+
+def preview_records(df: pd.DataFrame) -> List[Dict]:
+    """Filas de muestra con los nulos como cadena vacía (admite columnas category)"""
+    df = df.astype(object)
+    return df.where(df.notna(), "").to_dict(orient="records")
+
+def plot_spec(renderer: str, arrays: Dict[str, np.ndarray], **params) -> Dict:
+    """Describe un gráfico para dibujarlo más tarde con render_plot"""
+    return {"renderer": renderer, "arrays": {k: np.asarray(v) for k, v in arrays.items()}, "params": params}
+
+def sample_indices(n: int, budget: int) -> np.ndarray:
+    """Índices ordenados de una muestra aleatoria (reproducible) de como máximo ``budget`` filas"""
+    if n <= budget:
+        return np.arange(n)
+    return np.sort(np.random.default_rng(0).choice(n, budget, replace=False))
+
+def stratified_indices(labels: np.ndarray, budget: int) -> np.ndarray:
+    """Muestra con el mismo peso relativo por clase y al menos un punto de cada una"""
+    n = len(labels)
+    if n <= budget:
+        return np.arange(n)
+    rng = np.random.default_rng(0)
+    parts = []
+    for cls in np.unique(labels):
+        idx = np.flatnonzero(labels == cls)
+        k = max(1, int(round(budget * len(idx) / n)))
+        parts.append(idx if k >= len(idx) else rng.choice(idx, k, replace=False))
+    return np.sort(np.concatenate(parts))
+
+def line_arrays(x: np.ndarray, y: np.ndarray) -> Dict[str, np.ndarray]:
+    """Ordena una vez por x y reduce la línea a puntos equiespaciados (conserva los extremos)"""
+    order = np.argsort(x, kind="stable")
+    if len(order) > PLOT_MAX_POINTS:
+        order = order[np.unique(np.linspace(0, len(order) - 1, PLOT_MAX_POINTS).round().astype(int))]
+    return {"line_x": x[order], "line_y": y[order]}
+
+def scatter_arrays(x: np.ndarray, y: np.ndarray) -> Dict[str, np.ndarray]:
+    """Datos de un diagrama de dispersión con tamaño acotado.
+
+    Hasta PLOT_DENSITY_THRESHOLD filas se muestrea a PLOT_MAX_POINTS puntos;
+    por encima se dibuja la densidad (histograma 2D de todas las filas).
+    """
+    if len(x) > PLOT_DENSITY_THRESHOLD:
+        counts, xedges, yedges = np.histogram2d(x, y, bins=PLOT_DENSITY_BINS)
+        return {"counts": counts, "xedges": xedges, "yedges": yedges}
+    idx = sample_indices(len(x), PLOT_MAX_POINTS)
+    return {"x": x[idx], "y": y[idx]}
+
+def draw_scatter(ax, x=None, y=None, counts=None, xedges=None, yedges=None, label=None):
+    if counts is not None:
+        mesh = ax.pcolormesh(xedges, yedges, np.ma.masked_equal(counts.T, 0), cmap="Blues")
+        ax.figure.colorbar(mesh, ax=ax, label="Observaciones")
+    else:
+        ax.scatter(x, y, label=label)
+
+@stage("plot.png")
+def fig_to_png(fig) -> bytes:
+    import matplotlib.pyplot as plt
+    buf = BytesIO()
+    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    plt.close(fig)  # ¡Importante!
+    return buf.getvalue()
+
+def plot_residuals(**points):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    draw_scatter(ax, **points)
+    ax.axhline(0, color='red', linestyle='--')
+    ax.set_xlabel("Predicción")
+    ax.set_ylabel("Residuales")
+    ax.set_title("Residuales vs Predicción")
+    return fig
+
+def plot_fit_2d(line_x, line_y, xlabel, ylabel, **points):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    draw_scatter(ax, label="Datos", **points)
+    ax.plot(line_x, line_y, color='red', label="Recta")
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title("Ajuste 2D")
+    ax.legend()
+    return fig
+
+def plot_fit_3d(x1, x2, y, x1_range, x2_range, coef, xlabel, ylabel, zlabel):
+    import matplotlib.pyplot as plt
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    ax.scatter(x1, x2, y, c='blue', label='Datos')
+    xx, yy = np.meshgrid(
+        np.linspace(x1_range[0], x1_range[1], 10),
+        np.linspace(x2_range[0], x2_range[1], 10),
+    )
+    zz = coef[0] + coef[1]*xx + coef[2]*yy
+    ax.plot_surface(xx, yy, zz, alpha=0.3, color='red')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_zlabel(zlabel)
+    ax.set_title("Ajuste 3D")
+    return fig
+
+def plot_confusion_matrix(matrix, axis_labels: bool = False):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    fig, ax = plt.subplots()
+    sns.heatmap(matrix, annot=True, fmt='d', cmap='Blues', ax=ax)
+    if axis_labels:
+        ax.set_xlabel('Predicho')
+        ax.set_ylabel('Real')
+    ax.set_title('Matriz de Confusión')
+    return fig
+
+def plot_roc_curve(line_x, line_y, auc: float):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    ax.plot(line_x, line_y, label=f'AUC = {auc:.2f}')
+    ax.plot([0, 1], [0, 1], linestyle='--', color='grey')
+    ax.set_xlabel('False Positive Rate')
+    ax.set_ylabel('True Positive Rate')
+    ax.set_title('Curva ROC')
+    ax.legend()
+    return fig
+
+def plot_scree(explained_variance):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    ax.bar(range(1, len(explained_variance)+1), explained_variance)
+    ax.set_title("Varianza Explicada por Componente")
+    return fig
+
+def plot_projection(projected, labels, class_names):
+    """Proyección LDA en 2D o 3D según el número de columnas de ``projected``"""
+    import matplotlib.pyplot as plt
+    if projected.shape[1] >= 3:
+        fig = plt.figure()
+        ax = fig.add_subplot(111, projection='3d')
+    else:
+        fig, ax = plt.subplots()
+    for i, class_name in enumerate(class_names):
+        mask = (labels == i)
+        ax.scatter(*(projected[mask, d] for d in range(projected.shape[1])), label=class_name)
+    ax.set_title(f"Proyección LDA {projected.shape[1]}D")
+    ax.legend()
+    return fig
+
+PLOT_RENDERERS = {
+    "residuals": plot_residuals,
+    "fit_2d": plot_fit_2d,
+    "fit_3d": plot_fit_3d,
+    "confusion_matrix": plot_confusion_matrix,
+    "roc_curve": plot_roc_curve,
+    "scree": plot_scree,
+    "projection": plot_projection,
+}
+
+@stage("plot.render")
+def render_plot(renderer: str, **kwargs) -> bytes:
+    """Dibuja un gráfico a PNG (se ejecuta en el pool de procesos)"""
+    return fig_to_png(PLOT_RENDERERS[renderer](**kwargs))
+
+@stage("ols.fit")
+def ols_from_crossproducts(XtX: np.ndarray, Xty: np.ndarray, yty: float, n: int, target: str,
+                           features: List[str], head: np.ndarray):
+    """OLS con término independiente a partir de X'X, X'y, y'y y el número de filas.
+
+    Lo comparten el ajuste en memoria, el ajuste por bloques y el resumen de
+    momentos. X'X se equilibra por columnas y se resuelve por Cholesky; si está
+    mal condicionada (columnas colineales) se usa la pseudoinversa. El modelo
+    de statsmodels que se guarda se crea sobre las primeras filas de ``head``
+    (objetivo y predictoras) solo por su estructura. Devuelve el resultado de
+    la respuesta y ese modelo.
+    """
+    from scipy.linalg import LinAlgError, cho_factor, cho_solve
+    from scipy.stats import t as student_t
+    import statsmodels.api as sm
+    k = len(XtX)
+    diag = np.diag(XtX)
+    d = 1 / np.sqrt(np.where(diag > 0, diag, 1.0))  # columnas nulas sin escalar
+    scaled = XtX * np.outer(d, d)
+    try:
+        factor = cho_factor(scaled, check_finite=False)
+        pivots = np.abs(np.diag(factor[0]))
+        if n <= k or pivots.min() <= pivots.max() * OLS_CHOLESKY_RTOL:
+            raise LinAlgError("matriz mal condicionada")
+        normalized_cov = cho_solve(factor, np.eye(k), check_finite=False) * np.outer(d, d)
+        rank = k
+    except LinAlgError:
+        # El rango se decide sobre la matriz equilibrada; la pseudoinversa, sobre la original como statsmodels
+        scaled_eigvals = np.linalg.eigvalsh(scaled)
+        rank = int((scaled_eigvals > scaled_eigvals.max() * OLS_CHOLESKY_RTOL ** 2).sum())
+        eigvals, eigvecs = np.linalg.eigh(XtX)
+        keep = eigvecs[:, k - rank:]
+        normalized_cov = (keep / eigvals[k - rank:]) @ keep.T
+    params = normalized_cov @ Xty
+
+    # Forma cuadrática completa: los errores de redondeo de params solo entran en segundo orden
+    ssr = max(yty - 2 * params @ Xty + params @ XtX @ params, 0.0)
+    tss = yty - Xty[0] ** 2 / n
+    df_resid = n - rank
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = ssr / df_resid
+        p_values = 2 * student_t.sf(np.abs(params / np.sqrt(scale * np.diag(normalized_cov))), df_resid)
+    terms = [quote(f) for f in features]
+    anova = ols_anova_type2(params, normalized_cov, scale, df_resid, terms) if len(features) > 1 else None
+    result = linear_regression_result(
+        target, features, pd.Series(params, index=["Intercept"] + terms), p_values, 1 - ssr / tss, anova
+    )
+
+    head = head[:k + 1]
+    model = sm.OLS(head[:, 0], with_intercept(head[:, 1:]))
+    model.rank, model.df_model, model.df_resid = rank, rank - 1, df_resid
+    results = sm.regression.linear_model.OLSResults(model, params, normalized_cov, scale=scale)
+    results.scale = scale  # OLSResults vacía su caché al crearse y la recalcularía con los residuos de ``head``
+    return result, sm.regression.linear_model.RegressionResultsWrapper(results)
+
+def linear_regression_result(target: str, features: List[str], coef: pd.Series, p_values: np.ndarray,
+                             r_squared: float, anova: Optional[pd.DataFrame]) -> Dict:
+    """Respuesta común de los ajustes de regresión lineal"""
+    intercept = coef.iloc[0]
+    equation = f"{target} = {intercept:.4f} + " + " + ".join([f"{coef[i]:.4f}*{i}" for i in coef.index[1:]])
+    return {
+        "target": target,
+        "features": features,
+        "coefficients": coef.iloc[1:].tolist(),
+        "intercept": intercept,
+        "p_values": np.asarray(p_values)[1:].tolist(),
+        "intercept_p_value": np.asarray(p_values)[0].item(),
+        "r_squared": r_squared,
+        "equation": equation,
+        "anova": None if anova is None else anova.reset_index().to_dict(orient="records"),
+    }
 
+def ols_anova_type2(params: np.ndarray, normalized_cov: np.ndarray, scale: float, df_resid: float,
+                    terms: List[str]) -> pd.DataFrame:
+    """ANOVA de tipo II (como ``anova_lm(typ=2)``) cuando cada término es una sola columna"""
+    from scipy.stats import f as fisher_f
+    sum_sq = np.asarray(params)[1:] ** 2 / np.diag(np.asarray(normalized_cov))[1:]
+    F = sum_sq / scale
+    return pd.DataFrame({
+        "sum_sq": np.append(sum_sq, scale * df_resid),
+        "df": np.append(np.ones(len(terms)), df_resid),
+        "F": np.append(F, np.nan),
+        "PR(>F)": np.append(fisher_f.sf(F, 1, df_resid), np.nan),
+    }, index=terms + ["Residual"])
+
+def interaction_name(columns: List[str]) -> str:
+    return ":".join(quote(c) for c in columns)
+
+@stage("model.save")
 def save_model_to_disk(model, model_type: str, metadata: dict) -> str:
-    """Guarda modelo en disco y devuelve ID único"""
+    """Guarda modelo en disco y devuelve ID único.
+
+    Junto al .joblib se escribe un .json con los metadatos para poder
+    listarlos sin deserializar el modelo. Después se borran los modelos
+    menos usados por encima de MAX_SAVED_MODELS.
+    """
     model_id = str(uuid.uuid4())
     model_path = MODELS_DIR / f"{model_id}.joblib"
     
@@ -184,22 +2355,33 @@ def save_model_to_disk(model, model_type: str, metadata: dict) -> str:
     }
     
     joblib.dump(save_data, model_path)
+    with open(MODELS_DIR / f"{model_id}.json", "w", encoding="utf-8") as f:
+        json.dump(clean_json_data({
+            "model_id": model_id,
+            "model_type": model_type,
+            "created_at": save_data["created_at"],
+            "metadata": metadata,
+        }), f, default=str)
+    model_registry.prune()
     return model_id
 
-def load_model_from_disk(model_id: str):
-    """Carga modelo desde disco"""
-    model_path = MODELS_DIR / f"{model_id}.joblib"
+def load_model_from_disk(model_id: str, models_dir: Path = MODELS_DIR):
+    """Carga modelo desde disco (los arrays grandes se abren con mmap)"""
+    model_path = models_dir / f"{model_id}.joblib"
     if not model_path.exists():
         return None
-    return joblib.load(model_path)
+    return joblib.load(model_path, mmap_mode="r")
 ######################
 
 class LinearRegressionRequest(BaseModel):
     target: str
     features: List[str]
+    interactions: Optional[List[List[str]]] = None  # p. ej. [["x1", "x2"]] añade x1:x2
+    chunked: Optional[bool] = None  # ajuste por bloques desde disco; None = automático por tamaño
 
-@app.post("/train-linear-regression/{file_id}")
-async def train_linear_regression(file_id: str, req: LinearRegressionRequest):
+@stage("linear.prepare")
+def prepare_linear_regression(file_id: str, req: LinearRegressionRequest):
+    """Valida la petición y devuelve las filas completas de objetivo y predictoras"""
     target = req.target
     features = req.features
 
@@ -209,13 +2391,14 @@ async def train_linear_regression(file_id: str, req: LinearRegressionRequest):
     if file_id not in global_data:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
 
-    if "dummy_encoded" in global_data[file_id]:
-        df = global_data[file_id]["dummy_encoded"]
-    elif "ordinal_encoded" in global_data[file_id]:
-        df = global_data[file_id]["ordinal_encoded"]
-    else:
-        df = global_data[file_id]["dataframe"]
+    if req.chunked and req.interactions:
+        raise HTTPException(status_code=400, detail="El entrenamiento por bloques no admite interacciones")
+    if not req.interactions and use_chunked_training(file_id, [target] + features, req.chunked):
+        source = prepare_chunked_source(file_id, [target] + features)
+        return {}, {"source": source, "target": target, "features": features,
+                    "metadata": model_metadata(file_id, target, features)}
 
+    df = global_data.working_frame(file_id)
 
     if target not in df.columns:
         raise HTTPException(status_code=400, detail=f"Variable objetivo {target} no encontrada")
@@ -229,112 +2412,597 @@ async def train_linear_regression(file_id: str, req: LinearRegressionRequest):
     if missing:
         raise HTTPException(status_code=400, detail=f"Columnas no encontradas: {missing}")
     
-    df = df[all_vars].apply(pd.to_numeric, errors='coerce').dropna()
+    interactions = req.interactions or []
+    for term in interactions:
+        if len(term) < 2 or any(col not in features for col in term):
+            raise HTTPException(status_code=400, detail=f"Interacción no válida: {term}; sus variables deben estar entre las predictoras")
+
+    values, valid = global_data.numeric_columns(file_id, all_vars)
+    metadata = model_metadata(file_id, target, features)
+    if interactions:
+        metadata["interactions"] = interactions
+    return {"data": values[valid.all(axis=1)]}, {
+        "target": target, "features": features, "interactions": interactions, "metadata": metadata
+    }
 
+@stage("linear.train")
+def run_linear_regression(target: str, features: List[str], metadata: Dict, data: Optional[np.ndarray] = None,
+                          interactions: Optional[List[List[str]]] = None, source: Optional[str] = None,
+                          summarize: bool = False):
+    """Ajusta la regresión lineal y genera sus gráficos (pool de procesos).
+
+    Con ``summarize`` la salida incluye en "moments" el resumen de las filas
+    completas para sembrar ``global_data.moments``.
+    """
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+    if source is not None:
+        return run_linear_regression_chunked(source, target, features, metadata)
+    df = pd.DataFrame(data, columns=[target] + features)
 
     if len(df) < 2:
-        raise HTTPException(status_code=400, detail="No hay suficientes datos válidos para entrenar el modelo")
+        raise AnalysisError("No hay suficientes datos válidos para entrenar el modelo")
+
+    # Entrenar modelo: fórmula de patsy solo si hay interacciones
+    if interactions:
+        terms = [quote(f) for f in features] + [interaction_name(t) for t in interactions]
+        model = smf.ols(formula=f"{quote(target)} ~ " + " + ".join(terms), data=df).fit()
+        fitted = np.asarray(model.fittedvalues)
+        result = linear_regression_result(
+            target, features, model.params, np.asarray(model.pvalues), model.rsquared,
+            sm.stats.anova_lm(model, typ=2) if len(features) > 1 else None,
+        )
+    else:
+        X, y = with_intercept(data[:, 1:]), data[:, 0]
+        result, model = ols_from_crossproducts(X.T @ X, X.T @ y, y @ y, len(y), target, features, data)
+        fitted = X @ np.asarray(model.params)
 
-    # Entrenar modelo
-    quoted_target = quote(target)
-    quoted_features = [quote(f) for f in features]
-    formula = f"{quoted_target} ~ " + " + ".join(quoted_features)
-    model = smf.ols(formula=formula, data=df).fit()
+    # Datos de los gráficos; se dibujan bajo demanda en /results/{id}/plots/{name}
+    plots = {
+        "residuals": plot_spec("residuals", scatter_arrays(fitted, data[:, 0] - fitted)),
+        "visual": None,
+    }
+    if len(features) == 1:
+        x = df[features[0]].to_numpy()
+        plots["visual"] = plot_spec(
+            "fit_2d",
+            {**scatter_arrays(x, df[target].to_numpy()), **line_arrays(x, fitted)},
+            xlabel=features[0], ylabel=target,
+        )
+    elif len(features) == 2:
+        x1, x2 = df[features[0]].to_numpy(), df[features[1]].to_numpy()
+        idx = sample_indices(len(df), PLOT_MAX_POINTS)
+        plots["visual"] = plot_spec(
+            "fit_3d",
+            {"x1": x1[idx], "x2": x2[idx], "y": df[target].to_numpy()[idx],
+             "x1_range": [x1.min(), x1.max()], "x2_range": [x2.min(), x2.max()],
+             "coef": np.asarray(model.params)[:3]},
+            xlabel=features[0], ylabel=features[1], zlabel=target,
+        )
 
-    coef = model.params
-    intercept = coef.iloc[0]
-    equation = f"{target} = {intercept:.4f} + " + " + ".join([f"{coef[i]:.4f}*{i}" for i in coef.index[1:]])
+    # Guardar el modelo sin los datos de entrenamiento
+    model.remove_data()
+    result["model_id"] = save_model_to_disk(
+        model, "linear_regression", {**metadata, "r_squared": result["r_squared"]}
+    )
 
-    anova_table = None
-    if len(features) > 1:
-        anova = sm.stats.anova_lm(model, typ=2)
-        anova_table = anova.reset_index().to_dict(orient="records")
+    output = {"result": result, "plots": plots}
+    if summarize:
+        output["moments"] = column_moments(data)
+    return output
 
-    # Gráfico de residuales
-    fig, ax = plt.subplots()
-    ax.scatter(model.fittedvalues, model.resid)
-    ax.axhline(0, color='red', linestyle='--')
-    ax.set_xlabel("Predicción")
-    ax.set_ylabel("Residuales")
-    ax.set_title("Residuales vs Predicción")
-    buf = BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format='png')
-    plt.close(fig)
-    residuals_plot = base64.b64encode(buf.getvalue()).decode('utf-8')
+def moments_regression_allowed(file_id: str, req: LinearRegressionRequest) -> bool:
+    """Si la petición puede resolverse con el resumen de momentos: sin interacciones ni bloques pedidos y sin recargar el dataset"""
+    if req.interactions or req.chunked:
+        return False
+    entry = global_data.entry(file_id)
+    return "spilled" not in entry or bool(entry.get("persisted"))  # los persistentes se abren con mmap
+
+@stage("linear.moments")
+def linear_regression_from_moments(file_id: str, req: LinearRegressionRequest) -> Optional[Dict]:
+    """OLS sin interacciones a partir del resumen incremental del dataset.
 
-    # Visualización 2D o 3D
-    visual_plot = None
+    Coeficientes, errores estándar y ANOVA salen solo de las medias y
+    co-momentos de ``global_data.moments``, y los gráficos de una muestra de
+    PLOT_MAX_POINTS filas (sample_indices), así que tras un /append el coste
+    es proporcional a las filas nuevas. Devuelve None si la petición debe
+    seguir el camino habitual (errores, interacciones, ajuste por bloques,
+    dataset volcado a disco o resumen aún sin sembrar).
+    """
+    target, features = req.target, req.features
+    columns = [target] + features
+    if not target or not features or file_id not in global_data or not moments_regression_allowed(file_id, req):
+        return None
+    available = set(global_data.column_names(file_id))
+    if any(col not in available for col in columns):
+        return None
+
+    stats = global_data.cached_moments(file_id, columns)
+    if stats is None or stats["n"] < 2:
+        return None
+    n, k = stats["n"], len(columns)
+    mean, m2 = stats["mean"], stats["m2"]
+    XtX = np.empty((k, k))
+    XtX[0, 0] = n
+    XtX[0, 1:] = XtX[1:, 0] = n * mean[1:]
+    XtX[1:, 1:] = m2[1:, 1:] + n * np.outer(mean[1:], mean[1:])
+    Xty = np.append(n * mean[0], m2[1:, 0] + n * mean[1:] * mean[0])
+    yty = m2[0, 0] + n * mean[0] ** 2
+
+    # Muestra acotada de filas para los gráficos; las completas dan además la estructura del modelo
+    rows = sample_indices(global_data.entry(file_id)["row_count"], PLOT_MAX_POINTS)
+    values, valid = global_data.numeric_columns(file_id, columns, rows)
+    data = values[valid.all(axis=1)]
+    if len(data) == 0:
+        return None
+    result, model = ols_from_crossproducts(XtX, Xty, yty, n, target, features, data)
+    params = np.asarray(model.params)
+    fitted = with_intercept(data[:, 1:]) @ params
+    plots = {
+        "residuals": plot_spec("residuals", scatter_arrays(fitted, data[:, 0] - fitted)),
+        "visual": None,
+    }
     if len(features) == 1:
-        fig, ax = plt.subplots()
-        ax.scatter(df[features[0]], df[target], label="Datos")
-        ax.plot(df[features[0]], model.fittedvalues, color='red', label="Recta")
-        ax.set_xlabel(features[0])
-        ax.set_ylabel(target)
-        ax.set_title("Ajuste 2D")
-        ax.legend()
-        buf = BytesIO()
-        plt.tight_layout()
-        plt.savefig(buf, format='png')
-        plt.close(fig)
-        visual_plot = base64.b64encode(buf.getvalue()).decode('utf-8')
+        x_range = np.array([stats["min"][1], stats["max"][1]])
+        plots["visual"] = plot_spec(
+            "fit_2d",
+            {**scatter_arrays(data[:, 1], data[:, 0]), "line_x": x_range, "line_y": params[0] + params[1] * x_range},
+            xlabel=features[0], ylabel=target,
+        )
     elif len(features) == 2:
-        fig = plt.figure()
-        ax = fig.add_subplot(111, projection='3d')
-        ax.scatter(df[features[0]], df[features[1]], df[target], c='blue', label='Datos')
-        xx, yy = np.meshgrid(
-            np.linspace(df[features[0]].min(), df[features[0]].max(), 10),
-            np.linspace(df[features[1]].min(), df[features[1]].max(), 10),
+        plots["visual"] = plot_spec(
+            "fit_3d",
+            {"x1": data[:, 1], "x2": data[:, 2], "y": data[:, 0],
+             "x1_range": [stats["min"][1], stats["max"][1]], "x2_range": [stats["min"][2], stats["max"][2]],
+             "coef": params[:3]},
+            xlabel=features[0], ylabel=features[1], zlabel=target,
+        )
+
+    model.remove_data()
+    result["model_id"] = save_model_to_disk(
+        model, "linear_regression", {**model_metadata(file_id, target, features), "r_squared": result["r_squared"]}
+    )
+    return {"result": result, "plots": plots}
+
+@app.post("/train-linear-regression/{file_id}")
+async def train_linear_regression(file_id: str, req: LinearRegressionRequest, request: Request):
+    async def compute():
+        output = await run_in_threadpool(linear_regression_from_moments, file_id, req)
+        if output is not None:
+            return publish_result(output)
+        token = global_data.moments_token(file_id)
+        arrays, params = await run_in_threadpool(prepare_linear_regression, file_id, req)
+        if not moments_regression_allowed(file_id, req):
+            return await job_manager.run("linear_regression", run_linear_regression, arrays, params, publish_result)
+        return await job_manager.run(
+            "linear_regression", run_linear_regression, arrays, {**params, "summarize": True},
+            seed_moments_from(file_id, [req.target] + req.features, token, publish_result),
         )
-        zz = intercept + coef[1]*xx + coef[2]*yy
-        ax.plot_surface(xx, yy, zz, alpha=0.3, color='red')
-        ax.set_xlabel(features[0])
-        ax.set_ylabel(features[1])
-        ax.set_zlabel(target)
-        ax.set_title("Ajuste 3D")
-        buf = BytesIO()
-        plt.tight_layout()
-        plt.savefig(buf, format='png')
-        plt.close(fig)
-        visual_plot = base64.b64encode(buf.getvalue()).decode('utf-8')
+    return await cached_analysis(request, file_id, "linear_regression", req, compute)
+
+
+# Validación cruzada de los clasificadores
+CV_N_JOBS = int(os.environ.get("CORRSTAR_CV_JOBS", "-1"))  # procesos para ajustar las particiones
+CV_SEED = 42
+
+
+def evaluate_fold(model_type: str, X: np.ndarray, y: np.ndarray, train: np.ndarray, test: np.ndarray,
+                  classes: np.ndarray, n_components: Optional[int] = None, options: Optional[Dict] = None) -> Dict:
+    """Ajusta una partición y devuelve sus métricas sobre las filas de test"""
+    import statsmodels.api as sm
+    from sklearn.metrics import accuracy_score, confusion_matrix, f1_score, roc_auc_score
+    from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
+    start = time.perf_counter()
+    if model_type == "logistic_regression":
+        fit = sm.Logit(y[train], sm.add_constant(X[train], has_constant="add")).fit(disp=0)
+        y_prob = fit.predict(sm.add_constant(X[test], has_constant="add"))
+        y_pred = (y_prob >= 0.5).astype(y.dtype)
+    elif model_type == "logistic_fast":
+        weights = class_weight_vector(y[train], len(classes), options["class_weight"])
+        fit = fit_logistic(with_intercept(X[train]), y[train], len(classes), weights, options["penalty"], options["solver"])
+        probabilities = logistic_probabilities(fit["params"], with_intercept(X[test]))
+        y_pred = probabilities.argmax(axis=1)
+        y_prob = probabilities[:, 1] if len(classes) == 2 else None
+    else:
+        lda = LDA(n_components=n_components).fit(X[train], y[train])
+        y_pred = lda.predict(X[test])
+        y_prob = lda.predict_proba(X[test])[:, 1] if len(classes) == 2 else None
+    seconds = time.perf_counter() - start
+
+    y_test = y[test]
+    return {
+        "accuracy": accuracy_score(y_test, y_pred),
+        "auc": roc_auc_score(y_test, y_prob) if y_prob is not None and len(np.unique(y_test)) == 2 else None,
+        "f1_score": f1_score(y_test, y_pred, average="weighted"),
+        "confusion_matrix": confusion_matrix(y_test, y_pred, labels=classes).tolist(),
+        "n_train": len(train),
+        "n_test": len(test),
+        "seconds": seconds,
+    }
+
+def check_cv_folds(folds: Optional[int]):
+    if folds is not None and folds < 2:
+        raise HTTPException(status_code=400, detail="Se necesitan al menos 2 particiones")
+
+@stage("cross_validation")
+def cross_validate_classifier(model_type: str, X: np.ndarray, y: np.ndarray, folds: int,
+                              n_components: Optional[int] = None, options: Optional[Dict] = None) -> Dict:
+    """Validación cruzada estratificada con las particiones ajustadas en paralelo.
+
+    X llega como memmap de solo lectura y joblib la comparte con los procesos
+    sin copiarla.
+    """
+    from sklearn.model_selection import StratifiedKFold
+    classes = np.unique(y)
+    if np.unique(y, return_counts=True)[1].min() < folds:
+        raise AnalysisError("Cada clase necesita al menos tantas filas como particiones")
+    splits = StratifiedKFold(n_splits=folds, shuffle=True, random_state=CV_SEED).split(np.zeros(len(y)), y)
+    start = time.perf_counter()
+    per_fold = joblib.Parallel(n_jobs=min(folds, os.cpu_count() or 1) if CV_N_JOBS == -1 else CV_N_JOBS)(
+        joblib.delayed(evaluate_fold)(model_type, X, y, train, test, classes, n_components, options)
+        for train, test in splits
+    )
+    wall_time = time.perf_counter() - start
+
+    summary = {}
+    for metric in ("accuracy", "auc", "f1_score"):
+        values = [fold[metric] for fold in per_fold if fold[metric] is not None]
+        summary[metric] = {"mean": float(np.mean(values)), "std": float(np.std(values))} if values else None
+    return {
+        "folds": folds,
+        "per_fold": [{"fold": i + 1, **fold} for i, fold in enumerate(per_fold)],
+        **summary,
+        "confusion_matrix": np.sum([fold["confusion_matrix"] for fold in per_fold], axis=0).tolist(),
+        "wall_time": wall_time,
+    }
+
+
+# Regresión logística binaria y multinomial (motor "fast")
+FAST_LOGIT_IRLS_MAX_PARAMS = 200  # con más parámetros, L-BFGS en vez de IRLS (en "auto")
+LOGIT_LBFGS_MAX_ITER = 1000
+LOGIT_WARM_START_ENTRIES = 64
+
+
+class WarmStarts:
+    """Últimos coeficientes por dataset y objetivo, para arrancar el siguiente ajuste desde ellos.
+
+    Se guardan por nombre de variable, así que sirven aunque cambie el
+    conjunto de predictoras (p. ej. al probar una variable más).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            return self._entries.get(key)
+
+    def put(self, key: str, value: Dict):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+logit_warm_starts = WarmStarts(LOGIT_WARM_START_ENTRIES)
+
+
+def softmax_terms(B: np.ndarray, X: np.ndarray):
+    """Probabilidades y log-sum-exp con la primera clase como referencia (η = 0).
+
+    ``B`` tiene una columna por clase distinta de la de referencia; con dos
+    clases es la regresión logística habitual.
+    """
+    eta = X @ B
+    top = np.maximum(eta.max(axis=1), 0.0)
+    exp = np.exp(eta - top[:, None])
+    lse = top + np.log(np.exp(-top) + exp.sum(axis=1))
+    return eta, exp / np.exp(lse - top)[:, None], lse
+
+def logistic_objective(B: np.ndarray, X: np.ndarray, Y: np.ndarray, w: np.ndarray, penalty: float, mask: np.ndarray):
+    """Log-verosimilitud negativa ponderada más λ/2·||β||² (sin la constante) y su gradiente"""
+    eta, P, lse = softmax_terms(B, X)
+    loss = w @ (lse - (Y * eta).sum(axis=1)) + 0.5 * penalty * ((B * mask) ** 2).sum()
+    grad = X.T @ ((P - Y) * w[:, None]) + penalty * B * mask
+    return loss, grad
+
+def logistic_hessian(B: np.ndarray, X: np.ndarray, w: np.ndarray, penalty: float, mask: np.ndarray) -> np.ndarray:
+    """Hessiana por bloques de clase; los parámetros se ordenan clase a clase como en MNLogit"""
+    _, P, _ = softmax_terms(B, X)
+    p, m = B.shape
+    H = np.empty((p * m, p * m))
+    for j in range(m):
+        for l in range(j, m):
+            c = w * P[:, j] * ((j == l) - P[:, l])
+            block = X.T @ (X * c[:, None])
+            H[j * p:(j + 1) * p, l * p:(l + 1) * p] = block
+            H[l * p:(l + 1) * p, j * p:(j + 1) * p] = block.T
+    return H + penalty * np.diag(mask.ravel(order="F"))
+
+def class_weight_vector(y: np.ndarray, n_classes: int, class_weight) -> np.ndarray:
+    """Peso por fila: "balanced" usa n / (k · n_clase), como scikit-learn; una lista da el peso de cada clase"""
+    if class_weight is None:
+        return np.ones(len(y))
+    if class_weight == "balanced":
+        counts = np.bincount(y, minlength=n_classes)
+        per_class = len(y) / (n_classes * np.maximum(counts, 1))
+    else:
+        per_class = np.asarray(class_weight, dtype=np.float64)
+    return per_class[y]
+
+def fit_logistic(X: np.ndarray, y: np.ndarray, n_classes: int, weights: np.ndarray, penalty: float = 0.0,
+                 solver: str = "auto", init: Optional[np.ndarray] = None) -> Dict:
+    """Ajusta la regresión logística (multinomial si hay más de dos clases) sobre X con constante.
+
+    IRLS (Newton con búsqueda lineal) para diseños pequeños y L-BFGS sobre la
+    función y el gradiente vectorizados para los anchos; la hessiana solo se
+    calcula una vez al final en ese caso.
+    """
+    from scipy.optimize import minimize
+    p, m = X.shape[1], n_classes - 1
+    Y = (y[:, None] == np.arange(1, n_classes)[None, :]).astype(np.float64)
+    mask = np.ones((p, m))
+    mask[0] = 0.0  # la constante no se penaliza
+    B = np.zeros((p, m)) if init is None else np.array(init, dtype=np.float64).reshape(p, m)
+    if solver == "auto":
+        solver = "irls" if p * m <= FAST_LOGIT_IRLS_MAX_PARAMS else "lbfgs"
+    # La función se escala por el peso total para que las tolerancias no dependan de n
+    scale = weights.sum()
+
+    if solver == "lbfgs":
+        def fun(theta):
+            loss, grad = logistic_objective(theta.reshape(m, p).T, X, Y, weights, penalty, mask)
+            return loss / scale, grad.T.ravel() / scale
+        opt = minimize(fun, B.T.ravel(), jac=True, method="L-BFGS-B",
+                       options={"maxiter": LOGIT_LBFGS_MAX_ITER, "gtol": 1e-8, "ftol": 1e-14})
+        B = opt.x.reshape(m, p).T
+        converged, iterations = bool(opt.success), int(opt.nit)
+    else:
+        converged = False
+        loss, grad = logistic_objective(B, X, Y, weights, penalty, mask)
+        for iterations in range(1, LOGIT_MAX_ITER + 1):
+            H = logistic_hessian(B, X, weights, penalty, mask)
+            g = grad.ravel(order="F")
+            try:
+                step = np.linalg.solve(H, g)
+            except np.linalg.LinAlgError:
+                step = np.linalg.lstsq(H, g, rcond=None)[0]  # diseño colineal sin penalización
+            step = step.reshape(p, m, order="F")
+            t = 1.0
+            while True:
+                candidate = B - t * step
+                new_loss, new_grad = logistic_objective(candidate, X, Y, weights, penalty, mask)
+                if new_loss <= loss + 1e-12 * abs(loss) or t < 1e-6:
+                    break
+                t /= 2
+            B, loss, grad = candidate, new_loss, new_grad
+            if np.abs(t * step).max() < LOGIT_TOL:
+                converged = True
+                break
+
+    # Errores estándar una sola vez, con la hessiana en los parámetros finales
+    H = logistic_hessian(B, X, weights, penalty, mask)
+    try:
+        cov = np.linalg.inv(H)
+        if not np.isfinite(cov).all() or (np.diag(cov) < 0).any():
+            raise np.linalg.LinAlgError("hessiana singular")
+    except np.linalg.LinAlgError:
+        cov = np.linalg.pinv(H)
+    return {"params": B, "cov": cov, "solver": solver, "converged": converged, "iterations": iterations}
+
+def logistic_probabilities(B: np.ndarray, X: np.ndarray) -> np.ndarray:
+    """Probabilidad de cada clase, incluida la de referencia, para X con constante"""
+    _, P, _ = softmax_terms(B, X)
+    return np.column_stack([1 - P.sum(axis=1), P])
+
+def logit_results(X_head: np.ndarray, y_head: np.ndarray, params: np.ndarray, cov: np.ndarray,
+                  converged: bool, iterations: int, nobs: int):
+    """Resultados de statsmodels (Logit o MNLogit) montados sobre unas pocas filas.
+
+    Así el modelo guardado tiene la misma estructura que un ajuste de
+    statsmodels sin conservar los datos de entrenamiento.
+    """
+    import statsmodels.api as sm
+    from statsmodels.base.model import LikelihoodModelResults
+    from statsmodels.discrete.discrete_model import (
+        BinaryResultsWrapper, LogitResults, MNLogit, MultinomialResults, MultinomialResultsWrapper,
+    )
+    if params.ndim == 1 or params.shape[1] == 1:
+        fit = LikelihoodModelResults(sm.Logit(y_head, X_head), params.ravel(), cov)
+        fit.mle_retvals = {"converged": converged, "iterations": iterations}
+        model = LogitResults(fit.model, fit)
+        model.nobs = nobs
+        return BinaryResultsWrapper(model)
+    fit = LikelihoodModelResults(MNLogit(y_head, X_head), params.ravel(order="F"), cov)
+    fit.mle_retvals = {"converged": converged, "iterations": iterations}
+    fit.params = params
+    model = MultinomialResults(fit.model, fit)
+    model.nobs = nobs
+    return MultinomialResultsWrapper(model)
+
+def logistic_summary_table(params: np.ndarray, cov: np.ndarray, names: List[str],
+                           class_names: Optional[List] = None) -> List[Dict]:
+    """Tabla de coeficientes con las columnas de summary2; en multinomial, una fila por clase y variable"""
+    from scipy.stats import norm
+    p, m = params.reshape(len(names), -1).shape
+    coef = params.reshape(p, m).ravel(order="F")
+    bse = np.sqrt(np.clip(np.diag(cov), 0, None))
+    q = norm.ppf(0.975)
+    rows = []
+    for i, (b, se) in enumerate(zip(coef.tolist(), bse.tolist())):
+        z = b / se if se > 0 else np.nan
+        row = {"Variable": names[i % p], "Coefficient": b, "Std_Error": se, "Z_value": z,
+               "P_value": 2 * norm.sf(abs(z)), "[0.025": b - q * se, "0.975]": b + q * se}
+        if m > 1:
+            row = {"Class": class_names[i // p + 1], **row}
+        rows.append(row)
+    return rows
+
+def warm_start_params(init: Optional[Dict], class_names: List, names: List[str]) -> Optional[np.ndarray]:
+    """Coeficientes iniciales a partir del ajuste anterior; las variables nuevas empiezan en 0"""
+    if not init or init["class_names"] != class_names:
+        return None
+    previous = dict(zip(init["names"], np.asarray(init["params"])))
+    m = len(class_names) - 1
+    return np.array([previous.get(name, np.zeros(m)) for name in names])
+
+@stage("logistic.train")
+def run_logistic_regression_fast(target: str, features: List[str], metadata: Dict, X: np.ndarray, y: np.ndarray,
+                                 class_names: List, penalty: float, class_weight, solver: str,
+                                 warm_key: str, init: Optional[Dict] = None, cv_folds: Optional[int] = None):
+    """Regresión logística con fit_logistic: binaria o multinomial, ponderada y penalizada"""
+    from sklearn.metrics import accuracy_score, confusion_matrix, roc_auc_score, roc_curve
+    from sklearn.model_selection import train_test_split
+    n_classes = len(class_names)
+    if len(y) < 2:
+        raise AnalysisError("No hay suficientes datos válidos para entrenar el modelo")
+    if n_classes < 2:
+        raise AnalysisError("La variable objetivo debe tener al menos 2 valores")
+
+    train, test = train_test_split(np.arange(len(y)), test_size=0.3, stratify=y, random_state=42)
+    X_train, y_train = with_intercept(X[train]), y[train]
+    names = ["const"] + features
+    start = warm_start_params(init, class_names, names)
+    with stage("logistic.fit"):
+        weights = class_weight_vector(y_train, n_classes, class_weight)
+        fit = fit_logistic(X_train, y_train, n_classes, weights, penalty, solver, start)
+    params = fit["params"]
+
+    # Predicción
+    probabilities = logistic_probabilities(params, with_intercept(X[test]))
+    y_test, y_pred = y[test], probabilities.argmax(axis=1)
+
+    # Métricas
+    accuracy = accuracy_score(y_test, y_pred)
+    conf_matrix = confusion_matrix(y_test, y_pred, labels=np.arange(n_classes))
+    plots = {
+        "confusion_matrix": plot_spec("confusion_matrix", {"matrix": conf_matrix}, axis_labels=True),
+        "roc_curve": None,
+    }
+    if n_classes == 2:
+        fpr, tpr, _ = roc_curve(y_test, probabilities[:, 1])
+        auc_score = roc_auc_score(y_test, probabilities[:, 1])
+        plots["roc_curve"] = plot_spec("roc_curve", line_arrays(fpr, tpr), auc=float(auc_score))
+    elif len(np.unique(y_test)) == n_classes:
+        auc_score = roc_auc_score(y_test, probabilities, multi_class="ovr", labels=np.arange(n_classes))
+    else:
+        auc_score = None
 
     result = {
         "target": target,
         "features": features,
-        "coefficients": coef.iloc[1:].tolist(),
-        "intercept": intercept,
-        "p_values": model.pvalues.iloc[1:].tolist(),
-        "intercept_p_value": model.pvalues.iloc[0].item(),
-        "r_squared": model.rsquared,
-        "equation": equation,
-        "anova": anova_table,
-        "residuals_plot": residuals_plot,
-        "visual_plot": visual_plot,
+        "summary_table": logistic_summary_table(params, fit["cov"], names, class_names),
+        "accuracy": accuracy,
+        "auc": auc_score,
+        "model_type": "logistic_regression",
+        "engine": "fast",
+        "class_names": class_names,
+        "confusion_matrix": conf_matrix.tolist(),
+        "solver": fit["solver"],
+        "converged": fit["converged"],
+        "iterations": fit["iterations"],
+        "warm_start": start is not None,
     }
+    if cv_folds:
+        options = {"penalty": penalty, "class_weight": class_weight, "solver": solver}
+        result["cross_validation"] = cross_validate_classifier("logistic_fast", X, y, cv_folds, options=options)
 
-    return clean_json_data(result)
+    # Una fila de cada clase basta para reconstruir la estructura de statsmodels
+    head = np.unique(np.concatenate([np.arange(min(len(train), len(names) + 1)),
+                                     np.unique(y_train, return_index=True)[1]]))
+    model = logit_results(X_train[head], y_train[head], params, fit["cov"],
+                          fit["converged"], fit["iterations"], len(train))
+    model.remove_data()
+    result["model_id"] = save_model_to_disk(model, "logistic_regression", {
+        **metadata, "accuracy": accuracy, "auc": auc_score, "engine": "fast", "class_names": class_names,
+    })
+
+    warm_start = {"class_names": class_names, "names": names, "params": params}
+    return {"result": result, "plots": plots, "warm_start": (warm_key, warm_start)}
+
+def publish_logistic_result(output: Dict) -> Dict:
+    """Recuerda los coeficientes para el siguiente ajuste y publica el resultado"""
+    if "warm_start" in output:
+        logit_warm_starts.put(*output.pop("warm_start"))
+    return publish_result(output)
 
 
 class LogisticRegressionRequest(BaseModel):
     target: str
     features: List[str]
+    chunked: Optional[bool] = None  # ajuste por bloques desde disco; None = automático por tamaño
+    cv_folds: Optional[int] = None  # además del reparto 70/30, validación cruzada con k particiones
+    # auto: statsmodels para objetivos binarios sin pesos ni penalización; "fast" en el resto (multinomial)
+    engine: Literal["auto", "statsmodels", "fast"] = "auto"
+    solver: Literal["auto", "irls", "lbfgs"] = "auto"  # motor "fast"
+    penalty: float = 0.0  # L2 sobre los coeficientes, sin la constante (equivale a C = 1/penalty)
+    class_weight: Optional[Union[Literal["balanced"], Dict[str, float]]] = None  # claves: valores del objetivo
+    warm_start: bool = True  # arranca desde el último ajuste del mismo dataset y objetivo
 
-@app.post("/train-logistic-regression/{file_id}")
-async def train_logistic_regression(file_id: str, req: LogisticRegressionRequest):
+def uses_fast_logit(req: LogisticRegressionRequest, n_classes: int) -> bool:
+    if req.engine != "auto":
+        return req.engine == "fast"
+    return n_classes != 2 or req.penalty > 0 or req.class_weight is not None or req.solver != "auto"
+
+def prepare_fast_logit(file_id: str, req: LogisticRegressionRequest, df: pd.DataFrame):
+    """Filas completas y clases codificadas para run_logistic_regression_fast.
+
+    Las clases se leen del objetivo sin convertir, así también sirven
+    objetivos de texto.
+    """
+    values, valid = global_data.numeric_columns(file_id, req.features)
+    rows = valid.all(axis=1) & df[req.target].notna().to_numpy()
+    y_raw = df[req.target].to_numpy()[rows]
+    class_values, y = np.unique(y_raw.astype(str) if y_raw.dtype == object else y_raw, return_inverse=True)
+    if class_values.dtype.kind == "f" and np.all(class_values == np.round(class_values)):
+        class_values = class_values.astype(np.int64)  # 0.0/1.0 leídos como float se muestran como 0/1
+    class_names = class_values.tolist()
+
+    if req.penalty < 0:
+        raise HTTPException(status_code=400, detail="penalty no puede ser negativo")
+    class_weight = req.class_weight
+    if isinstance(class_weight, dict):
+        by_name = {str(name): i for i, name in enumerate(class_names)}
+        unknown = [name for name in class_weight if name not in by_name]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Clases no encontradas en class_weight: {unknown}")
+        if any(weight <= 0 for weight in class_weight.values()):
+            raise HTTPException(status_code=400, detail="Los pesos de class_weight deben ser positivos")
+        class_weight = [class_weight.get(str(name), 1.0) for name in class_names]
+    warm_key = f"{global_data.entry(file_id)['fingerprint']}:{req.target}"
+    return {"X": values[rows], "y": y}, {
+        "target": req.target, "features": req.features, "metadata": model_metadata(file_id, req.target, req.features),
+        "cv_folds": req.cv_folds, "fast": {
+            "class_names": class_names, "penalty": req.penalty, "class_weight": class_weight, "solver": req.solver,
+            "warm_key": warm_key, "init": logit_warm_starts.get(warm_key) if req.warm_start else None,
+        },
+    }
+
+@stage("logistic.prepare")
+def prepare_logistic_regression(file_id: str, req: LogisticRegressionRequest):
+    """Valida la petición y devuelve las filas completas de objetivo y predictoras"""
     target = req.target
     features = req.features
 
     if file_id not in global_data:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    check_cv_folds(req.cv_folds)
 
-    if "dummy_encoded" in global_data[file_id]:
-        df = global_data[file_id]["dummy_encoded"]
-    elif "ordinal_encoded" in global_data[file_id]:
-        df = global_data[file_id]["ordinal_encoded"]
-    else:
-        df = global_data[file_id]["dataframe"]
-
+    if use_chunked_training(file_id, [target] + features, req.chunked):
+        if req.cv_folds:
+            raise HTTPException(status_code=400, detail="La validación cruzada no está disponible en el entrenamiento por bloques")
+        if uses_fast_logit(req, 2):
+            raise HTTPException(status_code=400, detail="El motor fast no está disponible en el entrenamiento por bloques")
+        source = prepare_chunked_source(file_id, [target] + features)
+        return {}, {"source": source, "target": target, "features": features,
+                    "metadata": model_metadata(file_id, target, features)}
 
+    df = global_data.working_frame(file_id)
 
     if target not in df.columns:
         raise HTTPException(status_code=400, detail=f"Variable objetivo {target} no encontrada")
@@ -343,18 +3011,36 @@ async def train_logistic_regression(file_id: str, req: LogisticRegressionRequest
         if feature not in df.columns:
             raise HTTPException(status_code=400, detail=f"Variable predictora {feature} no encontrada")
 
+    if uses_fast_logit(req, df[target].nunique()):
+        return prepare_fast_logit(file_id, req, df)
+
     all_vars = [target] + features
-    numeric_df = df[all_vars].apply(pd.to_numeric, errors='coerce').dropna()
+    values, valid = global_data.numeric_columns(file_id, all_vars)
+    return {"data": values[valid.all(axis=1)]}, {
+        "target": target, "features": features, "metadata": model_metadata(file_id, target, features),
+        "cv_folds": req.cv_folds,
+    }
+
+@stage("logistic.train")
+def run_logistic_regression(target: str, features: List[str], metadata: Dict, data: Optional[np.ndarray] = None,
+                            source: Optional[str] = None, cv_folds: Optional[int] = None,
+                            X: Optional[np.ndarray] = None, y: Optional[np.ndarray] = None, fast: Optional[Dict] = None):
+    """Ajusta la regresión logística y genera sus gráficos (pool de procesos)"""
+    import statsmodels.api as sm
+    from sklearn.metrics import accuracy_score, confusion_matrix, roc_auc_score, roc_curve
+    from sklearn.model_selection import train_test_split
+    if fast is not None:
+        return run_logistic_regression_fast(target, features, metadata, X, y, cv_folds=cv_folds, **fast)
+    if source is not None:
+        return run_logistic_regression_chunked(source, target, features, metadata)
+    numeric_df = pd.DataFrame(data, columns=[target] + features)
 
     if len(numeric_df) < 2:
-        raise HTTPException(status_code=400, detail="No hay suficientes datos válidos para entrenar el modelo")
+        raise AnalysisError("No hay suficientes datos válidos para entrenar el modelo")
 
     unique_values = numeric_df[target].unique()
-    if len(unique_values) != 2:
-        raise HTTPException(
-            status_code=400,
-            detail="La variable objetivo debe tener exactamente 2 valores para regresión logística"
-        )
+    if len(unique_values) != 2:
+        raise AnalysisError("La variable objetivo debe tener exactamente 2 valores para regresión logística")
 
     # Partir los datos en 70% train, 30% test
     X = numeric_df[features]
@@ -363,7 +3049,8 @@ async def train_logistic_regression(file_id: str, req: LogisticRegressionRequest
 
     # Ajustar el modelo con statsmodels
     X_train_const = sm.add_constant(X_train)
-    model = sm.Logit(y_train, X_train_const).fit(disp=0)
+    with stage("logistic.fit"):
+        model = sm.Logit(y_train, X_train_const).fit(disp=0)
 
     # Predicción
     X_test_const = sm.add_constant(X_test, has_constant='add')
@@ -386,42 +3073,35 @@ async def train_logistic_regression(file_id: str, req: LogisticRegressionRequest
         'P>|z|': 'P_value'
     }).to_dict(orient="records")
 
-    # Matriz de confusión (gráfico)
-    fig, ax = plt.subplots()
-    sns.heatmap(conf_matrix, annot=True, fmt='d', cmap='Blues', ax=ax)
-    ax.set_xlabel('Predicho')
-    ax.set_ylabel('Real')
-    ax.set_title('Matriz de Confusión')
-    buf = BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format='png')
-    plt.close(fig)
-    conf_matrix_img = base64.b64encode(buf.getvalue()).decode('utf-8')
-
-    # Curva ROC (gráfico)
-    fig, ax = plt.subplots()
-    ax.plot(fpr, tpr, label=f'AUC = {auc_score:.2f}')
-    ax.plot([0, 1], [0, 1], linestyle='--', color='grey')
-    ax.set_xlabel('False Positive Rate')
-    ax.set_ylabel('True Positive Rate')
-    ax.set_title('Curva ROC')
-    ax.legend()
-    buf = BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format='png')
-    plt.close(fig)
-    roc_curve_img = base64.b64encode(buf.getvalue()).decode('utf-8')
+    plots = {
+        "confusion_matrix": plot_spec("confusion_matrix", {"matrix": conf_matrix}, axis_labels=True),
+        "roc_curve": plot_spec("roc_curve", line_arrays(fpr, tpr), auc=float(auc_score)),
+    }
 
-    return {
+    result = {
         "target": target,
         "features": features,
         "summary_table": summary_table,
         "accuracy": accuracy,
         "auc": auc_score,
-        "confusion_matrix_image": conf_matrix_img,
-        "roc_curve_image": roc_curve_img,
         "model_type": "logistic_regression"
     }
+    if cv_folds:
+        result["cross_validation"] = cross_validate_classifier("logistic_regression", data[:, 1:], data[:, 0], cv_folds)
+
+    model.remove_data()
+    result["model_id"] = save_model_to_disk(
+        model, "logistic_regression", {**metadata, "accuracy": accuracy, "auc": auc_score}
+    )
+
+    return {"result": result, "plots": plots}
+
+@app.post("/train-logistic-regression/{file_id}")
+async def train_logistic_regression(file_id: str, req: LogisticRegressionRequest, request: Request):
+    async def compute():
+        arrays, params = await run_in_threadpool(prepare_logistic_regression, file_id, req)
+        return await job_manager.run("logistic_regression", run_logistic_regression, arrays, params, publish_logistic_result)
+    return await cached_analysis(request, file_id, "logistic_regression", req, compute)
 
 @app.get("/list-files/")
 async def list_files():
@@ -431,7 +3111,9 @@ async def list_files():
             {
                 "file_id": file_id,
                 "columns": data["columns"],
-                "row_count": len(data["dataframe"])
+                "row_count": data["row_count"],
+                "memory_bytes": data["memory_bytes"],
+                "spilled": "spilled" in data
             }
             for file_id, data in global_data.items()
         ]
@@ -440,188 +3122,1394 @@ async def list_files():
 @app.delete("/remove-file/{file_id}")
 async def remove_file(file_id: str):
     """Elimina un archivo cargado"""
-    if file_id in global_data:
-        del global_data[file_id]
-        return {"message": f"Archivo {file_id} eliminado"}
-    raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    try:
+        await run_in_threadpool(global_data.__delitem__, file_id)  # borra también sus ficheros en disco
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    return {"message": f"Archivo {file_id} eliminado"}
+
+@app.post("/append/{file_id}")
+async def append_csv(file_id: str, file: UploadFile = File(...)):
+    """Añade las filas de un CSV con las mismas columnas a un dataset cargado"""
+    try:
+        df = (await run_in_threadpool(global_data.__getitem__, file_id))["dataframe"]  # puede recargarlo del disco
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    text_columns = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c])]
+    try:
+        with stage("upload.spool"):
+            temp_file_path, bytes_read = await spool_to_tempfile(iter_upload(file))
+        try:
+            rows, chunks = await run_in_threadpool(read_csv_chunked, temp_file_path, text_columns)
+        finally:
+            os.unlink(temp_file_path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al procesar el archivo: {str(e)}")
+
+    summary = await run_in_threadpool(global_data.append, file_id, rows)
+    return {"file_id": file_id, **summary, "bytes_read": bytes_read, "chunks_parsed": chunks}
+
+
+# Codificación de categóricas
+ENCODING_MAX_CATEGORIES = int(os.environ.get("CORRSTAR_ENCODING_MAX_CATEGORIES", "100"))  # dummies por columna
+ENCODING_SPARSE_MIN_DUMMIES = int(os.environ.get("CORRSTAR_ENCODING_SPARSE_MIN_DUMMIES", "64"))  # en "auto"
+OTHER_CATEGORY = "otros"  # categoría que agrupa los valores poco frecuentes
+
+
+def factorize_column(s: pd.Series):
+    """Códigos enteros (-1 para nulos), categorías en orden de aparición y frecuencia de cada una"""
+    codes, uniques = pd.factorize(s)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return codes, pd.Index(uniques).tolist(), counts
+
+@stage("encode.ordinal")
+def ordinal_encoding(s: pd.Series):
+    """Ordinal por frecuencia (0 = más frecuente) traducido a través de los códigos"""
+    codes, uniques, counts = factorize_column(s)
+    order = np.argsort(-counts, kind="stable")
+    mapping = {uniques[code]: rank for rank, code in enumerate(order.tolist())}
+    rank_of_code = np.empty(len(uniques), dtype=np.float64)
+    rank_of_code[order] = np.arange(len(uniques))
+    values = np.where(codes >= 0, rank_of_code[codes], np.nan)
+    return pd.to_numeric(pd.Series(values, index=s.index), downcast="integer"), mapping
+
+@stage("encode.layout")
+def nominal_layout(col: str, s: pd.Series, max_categories: int):
+    """Posición de cada fila dentro del bloque de dummies de la columna.
+
+    Se conservan las ``max_categories`` categorías más frecuentes, en el mismo
+    orden que ``pd.get_dummies``; el resto va a la dummy "otros". Devuelve la
+    posición por fila (-1 si es nulo), los nombres de las dummies y el mapa.
+    """
+    codes, uniques, counts = factorize_column(s)
+    kept = np.arange(len(uniques))
+    if len(uniques) > max_categories:
+        kept = np.sort(np.argsort(-counts, kind="stable")[:max_categories])
+    try:
+        kept = kept[pd.Index([uniques[c] for c in kept]).argsort()]
+    except TypeError:  # tipos mezclados: orden por texto
+        kept = kept[np.argsort([str(uniques[c]) for c in kept], kind="stable")]
+    categories = [uniques[c] for c in kept]
+    dummies = [f"{col}_{cat}" for cat in categories]
+
+    other = None
+    position = np.full(len(uniques) + 1, -1, dtype=np.int64)  # el último hueco es el de los nulos
+    if len(kept) < len(uniques):
+        other = f"{col}_{OTHER_CATEGORY}"
+        while other in dummies:
+            other += "_"
+        position[:len(uniques)] = len(kept)
+        dummies.append(other)
+    position[kept] = np.arange(len(kept))
+    encoding = {
+        "type": "nominal", "dummies": dummies, "categories": categories, "other": other,
+        "other_count": int(counts.sum() - counts[kept].sum()), "max_categories": max_categories,
+    }
+    return position[codes], dummies, encoding
+
+@stage("encode.dummies")
+def dummy_block(positions: List, names: List[str], index: pd.Index, sparse: bool) -> pd.DataFrame:
+    """Construye de una vez todas las dummies como un bloque uint8, denso o disperso"""
+    import scipy.sparse as sp
+    n_rows = len(index)
+    rows, cols = [], []
+    offset = 0
+    for position, width in positions:
+        hit = position >= 0
+        rows.append(np.flatnonzero(hit))
+        cols.append(position[hit] + offset)
+        offset += width
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+
+    if sparse:
+        matrix = sp.csc_matrix((np.ones(len(rows), dtype=np.uint8), (rows, cols)), shape=(n_rows, offset))
+        block = pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=names)
+        return block.astype(pd.SparseDtype(np.uint8, 0))
+    matrix = np.zeros((n_rows, offset), dtype=np.uint8)
+    matrix[rows, cols] = 1
+    return pd.DataFrame(matrix, index=index, columns=names, copy=False)
+
+@stage("encode.extend")
+def extend_encoded_block(encoded: pd.DataFrame, rows: pd.DataFrame, encoding_maps: Dict):
+    """Codifica filas añadidas con los mapas existentes y amplía el bloque codificado.
+
+    Los valores nuevos de una ordinal reciben los rangos siguientes (por
+    frecuencia) y los de una nominal, una dummy propia mientras quepan en su
+    ``max_categories`` (si no, la de "otros"); los códigos existentes no
+    cambian. Las dummies nuevas van al final del bloque, con ceros en las
+    filas anteriores. Devuelve el bloque, los mapas y los valores nuevos.
+    """
+    start = len(encoded)
+    index = pd.RangeIndex(start, start + len(rows))
+    sparse = any(isinstance(dtype, pd.SparseDtype) for dtype in encoded.dtypes)
+    maps, new_values = {}, {}
+    ordinals, positions, names, added = [], [], [], []
+
+    for col, encoding in encoding_maps.items():
+        codes, uniques, counts = factorize_column(rows[col])
+        by_frequency = np.argsort(-counts, kind="stable")
+        if encoding["type"] == "ordinal":
+            mapping = dict(encoding["mapping"])
+            unseen = [uniques[i] for i in by_frequency if uniques[i] not in mapping]
+            for rank, value in enumerate(unseen, start=max(mapping.values(), default=-1) + 1):
+                mapping[value] = rank
+            rank_of_code = np.array([mapping[u] for u in uniques] + [np.nan], dtype=np.float64)  # -1 = nulo
+            ordinals.append(pd.to_numeric(pd.Series(rank_of_code[codes], index=index), downcast="integer").rename(col + "_ordinal"))
+            maps[col] = {**encoding, "mapping": mapping}
+        else:
+            categories, dummies, other = list(encoding["categories"]), list(encoding["dummies"]), encoding.get("other")
+            max_categories = encoding.get("max_categories", ENCODING_MAX_CATEGORIES)
+            known = pd.Index(categories, dtype=object).get_indexer(pd.Index(uniques, dtype=object))
+            position = np.full(len(uniques) + 1, -1, dtype=np.int64)  # el último hueco es el de los nulos
+            other_count = encoding.get("other_count", 0)
+            unseen = []
+            for i in by_frequency:
+                if known[i] >= 0:
+                    position[i] = known[i]
+                    continue
+                unseen.append(uniques[i])
+                if other is None and len(categories) < max_categories:
+                    categories.append(uniques[i])
+                    dummies.append(f"{col}_{uniques[i]}")
+                    added.append(dummies[-1])
+                    position[i] = len(dummies) - 1
+                    continue
+                if other is None:
+                    other = f"{col}_{OTHER_CATEGORY}"
+                    while other in dummies:
+                        other += "_"
+                    dummies.append(other)
+                    added.append(other)
+                position[i] = dummies.index(other)
+                other_count += int(counts[i])
+            positions.append((position[codes], len(dummies)))
+            names.extend(dummies)
+            maps[col] = {**encoding, "categories": categories, "dummies": dummies, "other": other, "other_count": other_count}
+        if unseen:
+            new_values[col] = unseen
+
+    appended = pd.concat(ordinals + [dummy_block(positions, names, index, sparse)], axis=1, copy=False)
+    if added:
+        zeros = dummy_block([(np.full(start, -1), len(added))], added, encoded.index, sparse)
+        encoded = pd.concat([encoded, zeros], axis=1, copy=False)
+    return pd.concat([encoded, appended[encoded.columns]]), maps, new_values
 
 
 class AutoCategoricalEncodingRequest(BaseModel):
     file_id: str
     columns: List[str]
     column_types: Optional[Dict[str, Literal["ordinal", "nominal"]]] = {}
+    max_categories: Optional[int] = None  # dummies por columna; el resto va a "otros"
+    sparse: Literal["auto", "dense", "sparse"] = "auto"
 
-@app.post("/encode-categoricals-auto/")
-async def encode_categoricals_auto(req: AutoCategoricalEncodingRequest):
+def apply_categorical_encoding(req: AutoCategoricalEncodingRequest) -> Dict:
+    """Factoriza las columnas, construye las dummies y las registra en el dataset (fuera del event loop)"""
     if req.file_id not in global_data:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    max_categories = req.max_categories or ENCODING_MAX_CATEGORIES
+    if max_categories < 1:
+        raise HTTPException(status_code=400, detail="max_categories debe ser al menos 1")
 
-    df_original = global_data[req.file_id]["dataframe"].copy()
-    df_encoded = df_original.copy()
+    df_original = global_data[req.file_id]["dataframe"]
+    ordinals = {}
+    positions, dummy_names = [], []
     encoding_maps = {}
 
     for col in req.columns:
-        if col not in df_encoded.columns:
+        if col not in df_original.columns:
             raise HTTPException(status_code=400, detail=f"Columna '{col}' no existe en el dataset")
 
-        if not pd.api.types.is_object_dtype(df_encoded[col]) and not pd.api.types.is_categorical_dtype(df_encoded[col]):
+        if not pd.api.types.is_object_dtype(df_original[col]) and not isinstance(df_original[col].dtype, pd.CategoricalDtype):
             raise HTTPException(status_code=400, detail=f"Columna '{col}' no es categórica")
 
         # Determinar si es ordinal o nominal
         encoding_type = req.column_types.get(col, "nominal")  # por defecto nominal
 
         if encoding_type == "ordinal":
-            freq_order = df_encoded[col].value_counts().index.tolist()
-            mapping = {cat: i for i, cat in enumerate(freq_order)}
-            df_encoded[col + "_ordinal"] = df_encoded[col].map(mapping)
+            ordinal, mapping = ordinal_encoding(df_original[col])
+            ordinals[col] = ordinal.rename(col + "_ordinal")
             encoding_maps[col] = {"type": "ordinal", "mapping": mapping}
         else:  # nominal
-            dummies = pd.get_dummies(df_encoded[col], prefix=col, dtype=int)
-            df_encoded = pd.concat([df_encoded, dummies], axis=1)
-            encoding_maps[col] = {"type": "nominal", "dummies": dummies.columns.tolist()}
+            position, names, encoding = nominal_layout(col, df_original[col], max_categories)
+            positions.append((position, len(names)))
+            dummy_names.extend(names)
+            encoding_maps[col] = encoding
 
-    global_data[req.file_id]["dummy_encoded"] = df_encoded
-    global_data[req.file_id]["encoding_maps"] = encoding_maps
+    # Solo se guardan las columnas nuevas; el original no se duplica
+    sparse = req.sparse == "sparse" or (req.sparse == "auto" and len(dummy_names) >= ENCODING_SPARSE_MIN_DUMMIES)
+    dummies = dummy_block(positions, dummy_names, df_original.index, sparse)
+    # Vistas del bloque en el orden de la petición, sin copiar
+    encoded_parts, start = [], 0
+    for col, encoding in encoding_maps.items():
+        if encoding["type"] == "ordinal":
+            encoded_parts.append(ordinals[col])
+        else:
+            encoded_parts.append(dummies.iloc[:, start:start + len(encoding["dummies"])])
+            start += len(encoding["dummies"])
+    encoded_columns = pd.concat(encoded_parts, axis=1, copy=False) if encoded_parts else pd.DataFrame(index=df_original.index)
+    df_encoded = global_data.set_encoded(req.file_id, encoded_columns, encoding_maps)
 
     return {
         "message": "Codificación aplicada sin sobrescribir columnas originales",
         "columns_encoded": list(encoding_maps.keys()),
         "encoding_maps": encoding_maps,
-        "preview": df_encoded.head(10).fillna("").to_dict(orient="records")
+        "sparse": sparse,
+        "preview": preview_records(df_encoded.head(10))
     }
 
+@app.post("/encode-categoricals-auto/")
+async def encode_categoricals_auto(req: AutoCategoricalEncodingRequest):
+    return await run_in_threadpool(apply_categorical_encoding, req)
+
 
 class TrainLDARequest(BaseModel):
     target: str
     features: List[str]
+    chunked: Optional[bool] = None  # ajuste por bloques desde disco; None = automático por tamaño
+    cv_folds: Optional[int] = None  # además del reparto 70/30, validación cruzada con k particiones
     
 
+@stage("lda.prepare")
+def prepare_lda(file_id: str, req: TrainLDARequest):
+    """Valida la petición y devuelve las predictoras completas y las clases codificadas"""
+    from sklearn.preprocessing import LabelEncoder
+    if file_id not in global_data:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    check_cv_folds(req.cv_folds)
+
+    if use_chunked_training(file_id, [req.target] + req.features, req.chunked):
+        if req.cv_folds:
+            raise HTTPException(status_code=400, detail="La validación cruzada no está disponible en el entrenamiento por bloques")
+        source = prepare_chunked_source(file_id, [req.target] + req.features)
+        return {}, {"source": source, "target": req.target, "features": req.features,
+                    "metadata": model_metadata(file_id, req.target, req.features)}
+
+    df = global_data.working_frame(file_id)
+
+    # Validación de columnas
+    missing = [f for f in req.features if f not in df.columns]
+    if req.target not in df.columns or missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Columnas no encontradas: {missing + [req.target] if req.target not in df.columns else missing}"
+        )
+
+    # Preprocesamiento
+    values, valid = global_data.numeric_columns(file_id, req.features)
+    rows = valid.all(axis=1)
+    y_raw = df[req.target].to_numpy()[rows]
+    le = LabelEncoder()
+    y = le.fit_transform(y_raw)
+    class_names = le.classes_.tolist()
+    return {"X": values[rows], "y": y}, {
+        "features": req.features, "class_names": class_names,
+        "metadata": model_metadata(file_id, req.target, req.features), "cv_folds": req.cv_folds,
+    }
+
+@stage("lda.train")
+def run_lda(features: List[str], metadata: Dict, X: Optional[np.ndarray] = None, y: Optional[np.ndarray] = None,
+            class_names: Optional[List] = None, source: Optional[str] = None, target: Optional[str] = None,
+            cv_folds: Optional[int] = None):
+    """Ajusta el LDA y genera sus gráficos (pool de procesos)"""
+    from sklearn.metrics import accuracy_score, confusion_matrix, f1_score, roc_auc_score
+    from sklearn.model_selection import train_test_split
+    from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
+    if source is not None:
+        return run_lda_chunked(source, target, features, metadata)
+    X_shared = X  # memmap de solo lectura para la validación cruzada
+    X = pd.DataFrame(X, columns=features)
+
+    n_classes = len(class_names)
+    n_components = min(X.shape[1], n_classes - 1)
+
+    if n_components < 1:
+        raise AnalysisError("Se requieren al menos 2 clases para LDA")
+
+    # Entrenamiento
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.3, random_state=42, stratify=y
+    )
+    lda = LDA(n_components=n_components)
+    with stage("lda.fit"):
+        X_train_lda = lda.fit_transform(X_train, y_train)
+    y_pred = lda.predict(X_test)
+
+    # Métricas
+    accuracy = accuracy_score(y_test, y_pred)
+    f1 = f1_score(y_test, y_pred, average='weighted')
+    auc_score = roc_auc_score(y_test, lda.predict_proba(X_test)[:, 1]) if n_classes == 2 else None
+
+    # Datos de los gráficos; se dibujan bajo demanda
+    plots = {
+        "confusion_matrix": plot_spec("confusion_matrix", {"matrix": confusion_matrix(y_test, y_pred)}),
+        "scree_plot": plot_spec("scree", {"explained_variance": lda.explained_variance_ratio_}),
+        "projection_2d": None,
+        "projection_3d": None,
+    }
+    idx = stratified_indices(y_train, PLOT_MAX_POINTS)
+    if n_components >= 2:
+        plots["projection_2d"] = plot_spec(
+            "projection", {"projected": X_train_lda[idx, :2], "labels": y_train[idx]}, class_names=class_names
+        )
+    if n_components >= 3:
+        plots["projection_3d"] = plot_spec(
+            "projection", {"projected": X_train_lda[idx, :3], "labels": y_train[idx]}, class_names=class_names
+        )
+
+    result = {
+        "metrics": {
+            "accuracy": accuracy,
+            "f1_score": f1,
+            "auc_roc": auc_score,
+            "confusion_matrix": confusion_matrix(y_test, y_pred).tolist(),
+            "class_names": class_names,
+            "explained_variance": lda.explained_variance_ratio_.tolist()
+        },
+        "model_id": save_model_to_disk(
+            lda, "lda", {**metadata, "class_names": class_names, "accuracy": accuracy}
+        ),
+    }
+    if cv_folds:
+        result["cross_validation"] = cross_validate_classifier("lda", X_shared, y, cv_folds, n_components)
+
+    return {"result": result, "plots": plots}
+
 @app.post("/train-lda/{file_id}")
-def train_lda(file_id: str, req: TrainLDARequest):
+async def train_lda(file_id: str, req: TrainLDARequest, request: Request):
+    async def compute():
+        arrays, params = await run_in_threadpool(prepare_lda, file_id, req)
+        return await job_manager.run("lda", run_lda, arrays, params, publish_result)
     try:
-        if file_id not in global_data:
-            raise HTTPException(status_code=404, detail="Archivo no encontrado")
+        return await cached_analysis(request, file_id, "lda", req, compute)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Vista previa paginada
+PREVIEW_DEFAULT_ROWS = 10
+PREVIEW_MAX_ROWS = int(os.environ.get("CORRSTAR_PREVIEW_MAX_ROWS", "1000"))  # filas por página
+
+
+def column_summary(s: pd.Series) -> Dict:
+    """Estadísticos de una columna: posición y dispersión si es numérica, frecuencias si no"""
+    summary = {"dtype": str(s.dtype)}
+    if isinstance(s.dtype, pd.SparseDtype):
+        s = s.sparse.to_dense()
+    nulls = int(s.isna().sum())
+    summary.update(count=len(s) - nulls, nulls=nulls)
+    if pd.api.types.is_numeric_dtype(s):
+        values = s.to_numpy(dtype=np.float64, na_value=np.nan)
+        values = values[~np.isnan(values)]
+        if len(values):
+            q1, median, q3 = np.percentile(values, [25, 50, 75])
+            summary.update(
+                mean=float(values.mean()),
+                std=float(values.std(ddof=1)) if len(values) > 1 else None,
+                min=float(values.min()), q1=float(q1), median=float(median), q3=float(q3),
+                max=float(values.max()),
+            )
+    else:
+        counts = s.value_counts(dropna=True)
+        summary.update(
+            unique=len(counts),
+            top=counts.index[:1].tolist()[0] if len(counts) else None,
+            freq=int(counts.iloc[0]) if len(counts) else 0,
+        )
+    return summary
+
+def projected_columns(df: pd.DataFrame, columns: Optional[List[str]]) -> List[str]:
+    """Columnas pedidas (repetidas o separadas por comas) validadas contra el dataframe"""
+    if not columns:
+        return df.columns.tolist()
+    names = []
+    for item in columns:
+        names += [item] if item in df.columns else item.split(",")
+    missing = [c for c in names if c not in df.columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Columnas no encontradas: {', '.join(missing)}")
+    return list(dict.fromkeys(names))
+
+@stage("preview.page")
+def preview_page(file_id: str, encoded: bool, columns: Optional[List[str]], offset: int, limit: int,
+                 stats: bool, format: str):
+    """Página de filas y columnas del dataset en el formato pedido"""
+    entry = global_data[file_id]
+    df = entry["dummy_encoded"] if encoded and "dummy_encoded" in entry else entry["dataframe"]
+    names = projected_columns(df, columns)
+    page = df.iloc[offset:offset + limit][names]  # solo se copia la página
+    body = {"columns": names, "row_count": len(df), "offset": offset, "limit": limit}
+    if stats:
+        body["stats"] = global_data.column_stats(file_id, names)
+
+    if format == "arrow":
+        table = pyarrow.Table.from_pandas(densify(page), preserve_index=False)
+        table = table.replace_schema_metadata({"preview": json.dumps(body, default=str)})
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(content=sink.getvalue().to_pybytes(), media_type=ARROW_STREAM_TYPE,
+                        headers={"X-Row-Count": str(len(df))})
+    if format == "columnar":
+        page = densify(page).astype(object)
+        page = page.where(page.notna(), None)
+        body["data"] = {col: page[col].tolist() for col in names}
+    else:
+        body["preview"] = preview_records(densify(page))
+    return APIResponse(body)
+
+@app.get("/preview/{file_id}")
+async def preview_file(file_id: str, encoded: Optional[bool] = False, offset: int = 0,
+                       limit: Optional[int] = None, rows: Optional[int] = None,
+                       columns: Optional[List[str]] = Query(None), stats: bool = False,
+                       format: Literal["records", "columnar", "arrow"] = "records"):
+    """Devuelve una página del archivo original o codificado.
+
+    ``offset`` y ``limit`` (o ``rows``) eligen las filas y ``columns`` las
+    columnas. Con ``stats`` se añade el resumen de cada columna, que se
+    calcula una sola vez por dataset. ``format=columnar`` devuelve una lista
+    por columna y ``format=arrow`` la página como flujo Arrow IPC, con los
+    metadatos de la respuesta en el esquema.
+    """
+    if file_id not in global_data:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    limit = limit if limit is not None else rows if rows is not None else PREVIEW_DEFAULT_ROWS
+    if offset < 0 or limit < 0:
+        raise HTTPException(status_code=400, detail="offset y limit no pueden ser negativos")
+    if format == "arrow" and not HAS_PYARROW:
+        raise HTTPException(status_code=400, detail="El formato arrow requiere pyarrow en el servidor")
+    limit = min(limit, PREVIEW_MAX_ROWS)
+    return await run_in_threadpool(preview_page, file_id, encoded, columns, offset, limit, stats, format)
+
+
+# Perfil de columnas
+PROFILE_HLL_PRECISION = 14  # 2^14 registros: error típico del 0,8 % en el número de distintos
+PROFILE_SAMPLE_ROWS = int(os.environ.get("CORRSTAR_PROFILE_SAMPLE_ROWS", "200000"))  # muestra para cuantiles y top-k
+PROFILE_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+PROFILE_N_JOBS = int(os.environ.get("CORRSTAR_PROFILE_JOBS", "-1"))  # hilos, una columna por tarea
+PROFILE_TOP_MAX_DISTINCT_RATIO = 0.5  # con muestra, top-k solo si los distintos no pasan de esta fracción
+
+
+def hll_registers(hashes: np.ndarray, precision: int = PROFILE_HLL_PRECISION) -> np.ndarray:
+    """Registros HyperLogLog de un array de hashes de 64 bits"""
+    index = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    # Los 53 bits siguientes caben exactos en float64, así frexp da su longitud en bits
+    rest = ((hashes << np.uint64(precision)) >> np.uint64(11)).astype(np.float64)
+    rank = (54 - np.frexp(rest)[1]).astype(np.uint8)  # ceros a la izquierda + 1
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+def hll_estimate(registers: np.ndarray) -> int:
+    """Número estimado de valores distintos, con conteo lineal para cardinalidades bajas"""
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+def column_profile(s: pd.Series, sample: np.ndarray, top_k: int) -> Dict:
+    """Tipo, nulos, distintos, cuantiles y valores más frecuentes de una columna.
+
+    Nulos, mínimo, máximo y media son exactos; los distintos se estiman con
+    HyperLogLog salvo en columnas category, donde se cuentan sus códigos.
+    Cuantiles y top-k salen de la muestra ``sample`` y se reescalan al total.
+    """
+    profile = {"dtype": str(s.dtype)}
+    if isinstance(s.dtype, pd.SparseDtype):
+        s = s.sparse.to_dense()
+    valid = s.notna().to_numpy()
+    count = int(valid.sum())
+    profile.update(count=count, nulls=len(s) - count, null_ratio=(len(s) - count) / len(s) if len(s) else 0.0)
 
-        if "dummy_encoded" in global_data[file_id]:
-            df = global_data[file_id]["dummy_encoded"]
-        elif "ordinal_encoded" in global_data[file_id]:
-            df = global_data[file_id]["ordinal_encoded"]
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        kind = "categorical"
+        codes = s.cat.codes.to_numpy()
+        freq = np.bincount(codes[codes >= 0], minlength=len(s.cat.categories))
+        distinct, distinct_exact = int(np.count_nonzero(freq)), True
+        order = np.argsort(-freq, kind="stable")[:top_k]
+        top = [{"value": v, "count": int(c)} for v, c in zip(s.cat.categories[order].tolist(), freq[order]) if c]
+        top_exact = True
+    else:
+        if pd.api.types.is_bool_dtype(s):
+            kind = "boolean"
+        elif pd.api.types.is_numeric_dtype(s):
+            kind = "numeric"
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            kind = "datetime"
         else:
-            df = global_data[file_id]["dataframe"]
-
-        # Validación de columnas
-        missing = [f for f in req.features if f not in df.columns]
-        if req.target not in df.columns or missing:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Columnas no encontradas: {missing + [req.target] if req.target not in df.columns else missing}"
+            kind = "text"
+        values = s.to_numpy()
+        values = values if count == len(s) else values[valid]
+        distinct = hll_estimate(hll_registers(pd.util.hash_array(values))) if count else 0
+        distinct_exact = False
+        sampled = s.iloc[sample].dropna()
+        top, top_exact = [], len(sample) == len(s)
+        if len(sampled) and (top_exact or distinct <= PROFILE_TOP_MAX_DISTINCT_RATIO * count):
+            counts = sampled.value_counts().head(top_k)
+            scale = count / len(sampled)
+            top = [{"value": v, "count": int(round(c * scale))} for v, c in zip(counts.index.tolist(), counts.tolist())]
+        if kind == "numeric" and count:
+            quantiles = np.quantile(sampled.to_numpy(dtype=np.float64), PROFILE_QUANTILES)
+            profile.update(
+                min=float(values.min()), max=float(values.max()), mean=float(values.mean(dtype=np.float64)),
+                quantiles={str(q): float(v) for q, v in zip(PROFILE_QUANTILES, quantiles)},
             )
 
-        # Preprocesamiento
-        X = df[req.features].apply(pd.to_numeric, errors='coerce').dropna()
-        y_raw = df.loc[X.index, req.target]
-        le = LabelEncoder()
-        y = le.fit_transform(y_raw)
-        class_names = le.classes_.tolist()
+    profile.update(
+        kind=kind,
+        distinct=distinct,
+        distinct_exact=distinct_exact,
+        top=top,
+        top_exact=top_exact,
+        encodable=kind in ("categorical", "text"),  # lo que acepta encode_categoricals_auto
+        high_cardinality=distinct > ENCODING_MAX_CATEGORIES,
+        constant=distinct <= 1,
+    )
+    return profile
+
+@stage("profile.compute")
+def profile_dataset(file_id: str, req: "ProfileRequest") -> Dict:
+    """Perfil de las columnas pedidas, repartidas entre hilos"""
+    entry = global_data[file_id]
+    df = entry["dummy_encoded"] if req.encoded and "dummy_encoded" in entry else entry["dataframe"]
+    names = projected_columns(df, req.columns)
+    sample = sample_indices(len(df), PROFILE_SAMPLE_ROWS)
+    profiles = joblib.Parallel(n_jobs=PROFILE_N_JOBS, prefer="threads")(
+        joblib.delayed(column_profile)(df[col], sample, req.top_k) for col in names
+    )
+    return {
+        "file_id": file_id,
+        "row_count": len(df),
+        "sample_rows": len(sample),
+        "columns": dict(zip(names, profiles)),
+    }
+
+
+class ProfileRequest(BaseModel):
+    columns: Optional[List[str]] = None
+    encoded: bool = False
+    top_k: int = 10
+
+@app.get("/profile/{file_id}")
+async def profile_file(file_id: str, request: Request,
+                       columns: Optional[List[str]] = Query(None), encoded: bool = False, top_k: int = 10):
+    """Perfil de las columnas para decidir qué codificar y qué variables usar.
+
+    Se calcula en una pasada vectorizada por columna y se cachea por versión
+    del dataset.
+    """
+    if not 1 <= top_k <= 100:
+        raise HTTPException(status_code=400, detail="top_k debe estar entre 1 y 100")
+    req = ProfileRequest(columns=columns, encoded=encoded, top_k=top_k)
+
+    async def compute():
+        return await run_in_threadpool(profile_dataset, file_id, req)
+    return await cached_analysis(request, file_id, "profile", req, compute)
+
+
+
+
+
+# Entrenamiento por bloques
+TRAINING_CHUNK_ROWS = int(os.environ.get("CORRSTAR_TRAINING_CHUNK_ROWS", "200000"))  # filas por bloque
+CHUNKED_TRAINING_MIN_BYTES = int(os.environ.get("CORRSTAR_CHUNKED_TRAINING_MB", "1024")) * 1024 * 1024
+TRAINING_DIR = SPILL_DIR
+LOGIT_MAX_ITER = 35  # mismos límites que Logit.fit de statsmodels
+LOGIT_TOL = 1e-8
+
+
+def use_chunked_training(file_id: str, columns: List[str], chunked: Optional[bool]) -> bool:
+    """Decide si el ajuste se hace por bloques desde un Parquet en disco.
+
+    Por defecto se usa cuando el dataset está volcado a disco o la matriz
+    de diseño superaría CHUNKED_TRAINING_MIN_BYTES.
+    """
+    if chunked is False:
+        return False
+    if not HAS_PYARROW:
+        if chunked:
+            raise HTTPException(status_code=400, detail="El entrenamiento por bloques requiere pyarrow")
+        return False
+    entry = global_data.entry(file_id)
+    spilled = "spilled" in entry and not entry.get("persisted")  # los persistentes se abren con mmap
+    return bool(chunked) or spilled or entry["row_count"] * len(columns) * 8 > CHUNKED_TRAINING_MIN_BYTES
+
+@stage("chunked.source")
+def prepare_chunked_source(file_id: str, columns: List[str]) -> str:
+    """Valida las columnas sin recargar el dataset y escribe el Parquet que leerá el trabajo"""
+    available = set(global_data.column_names(file_id))
+    missing = [col for col in columns if col not in available]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Columnas no encontradas: {missing}")
+    TRAINING_DIR.mkdir(exist_ok=True)
+    path = TRAINING_DIR / f"{file_id}_training_{uuid.uuid4().hex}.parquet"
+    return global_data.write_parquet(file_id, columns, path, TRAINING_CHUNK_ROWS)
+
+def iter_training_chunks(source: str, numeric: List[str], raw: Optional[str] = None):
+    """Recorre el Parquet por bloques y devuelve solo las filas completas.
+
+    Cada bloque es la matriz float64 de ``numeric`` y, si se pide, los valores
+    sin convertir de la columna ``raw``.
+    """
+    columns = list(dict.fromkeys(numeric + ([raw] if raw else [])))
+    for batch in pyarrow.parquet.ParquetFile(source).iter_batches(batch_size=TRAINING_CHUNK_ROWS, columns=columns):
+        df = batch.to_pandas()
+        values = np.column_stack([numeric_view(df[col])[0].astype(np.float64) for col in numeric])
+        rows = ~np.isnan(values).any(axis=1)
+        if raw:
+            rows &= df[raw].notna().to_numpy()
+            yield values[rows], df[raw].to_numpy()[rows]
+        else:
+            yield values[rows]
+
+def with_intercept(X: np.ndarray) -> np.ndarray:
+    return np.column_stack([np.ones(len(X)), X])
 
-        n_classes = len(class_names)
-        n_components = min(X.shape[1], n_classes - 1)
+def train_test_masks(y: np.ndarray):
+    """Máscara de entrenamiento sobre las filas completas, con el mismo reparto que train_test_split"""
+    from sklearn.model_selection import train_test_split
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.3, stratify=y, random_state=42)
+    is_train = np.zeros(len(y), dtype=bool)
+    is_train[train_idx] = True
+    return is_train, train_idx
 
-        if n_components < 1:
-            raise HTTPException(status_code=400, detail="Se requieren al menos 2 clases para LDA")
+def streamed_scatter(points, n: int, lows: np.ndarray, highs: np.ndarray, sample: Dict[str, np.ndarray]):
+    """Datos de dispersión equivalentes a scatter_arrays sin tener todas las filas en memoria.
 
-        # Entrenamiento
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.3, random_state=42, stratify=y
+    ``points`` es una función que vuelve a recorrer los datos dando pares (x, y);
+    ``sample`` son los puntos de la muestra de sample_indices ya recogidos.
+    """
+    if n <= PLOT_DENSITY_THRESHOLD:
+        return sample
+    counts = np.zeros((PLOT_DENSITY_BINS, PLOT_DENSITY_BINS))
+    for x, y in points():
+        counts += np.histogram2d(x, y, bins=PLOT_DENSITY_BINS, range=[[lows[0], highs[0]], [lows[1], highs[1]]])[0]
+    xedges = np.linspace(lows[0], highs[0], PLOT_DENSITY_BINS + 1)
+    yedges = np.linspace(lows[1], highs[1], PLOT_DENSITY_BINS + 1)
+    return {"counts": counts, "xedges": xedges, "yedges": yedges}
+
+def run_linear_regression_chunked(source: str, target: str, features: List[str], metadata: Dict):
+    """OLS acumulando X'X, X'y e y'y bloque a bloque; misma salida que run_linear_regression"""
+    columns = [target] + features
+    k = len(features) + 1
+    XtX, Xty, yty = np.zeros((k, k)), np.zeros(k), 0.0
+    n, head = 0, None
+    lows, highs = np.full(len(columns), np.inf), np.full(len(columns), -np.inf)
+    for data in iter_training_chunks(source, columns):
+        if len(data) == 0:
+            continue
+        X = with_intercept(data[:, 1:])
+        XtX += X.T @ X
+        Xty += X.T @ data[:, 0]
+        yty += data[:, 0] @ data[:, 0]
+        n += len(data)
+        lows, highs = np.minimum(lows, data.min(axis=0)), np.maximum(highs, data.max(axis=0))
+        if head is None:
+            head = data[:k + 1]
+
+    if n < 2:
+        raise AnalysisError("No hay suficientes datos válidos para entrenar el modelo")
+    result, model = ols_from_crossproducts(XtX, Xty, yty, n, target, features, head)
+    params = np.asarray(model.params)
+
+    # Segunda pasada: la muestra de puntos de los gráficos y el rango de los residuos
+    sample = sample_indices(n, PLOT_MAX_POINTS)
+    picked = []
+    fit_low, fit_high = np.full(2, np.inf), np.full(2, -np.inf)
+    offset = 0
+    for data in iter_training_chunks(source, columns):
+        fitted = with_intercept(data[:, 1:]) @ params
+        resid = data[:, 0] - fitted
+        if len(data):
+            pairs = np.column_stack([fitted, resid])
+            fit_low, fit_high = np.minimum(fit_low, pairs.min(axis=0)), np.maximum(fit_high, pairs.max(axis=0))
+        local = sample[(sample >= offset) & (sample < offset + len(data))] - offset
+        picked.append(np.column_stack([data[local], fitted[local], resid[local]]))
+        offset += len(data)
+    picked = np.concatenate(picked)  # columnas: objetivo, predictoras, ajustado, residuo
+
+    def residual_points():
+        for data in iter_training_chunks(source, columns):
+            fitted = with_intercept(data[:, 1:]) @ params
+            yield fitted, data[:, 0] - fitted
+
+    plots = {
+        "residuals": plot_spec("residuals", streamed_scatter(
+            residual_points, n, fit_low, fit_high, {"x": picked[:, -2], "y": picked[:, -1]}
+        )),
+        "visual": None,
+    }
+    if len(features) == 1:
+        def feature_points():
+            for data in iter_training_chunks(source, columns):
+                yield data[:, 1], data[:, 0]
+
+        x_range = np.array([lows[1], highs[1]])
+        plots["visual"] = plot_spec(
+            "fit_2d",
+            {**streamed_scatter(feature_points, n, lows[[1, 0]], highs[[1, 0]], {"x": picked[:, 1], "y": picked[:, 0]}),
+             "line_x": x_range, "line_y": params[0] + params[1] * x_range},
+            xlabel=features[0], ylabel=target,
+        )
+    elif len(features) == 2:
+        plots["visual"] = plot_spec(
+            "fit_3d",
+            {"x1": picked[:, 1], "x2": picked[:, 2], "y": picked[:, 0],
+             "x1_range": [lows[1], highs[1]], "x2_range": [lows[2], highs[2]], "coef": params[:3]},
+            xlabel=features[0], ylabel=features[1], zlabel=target,
         )
-        lda = LDA(n_components=n_components)
-        X_train_lda = lda.fit_transform(X_train, y_train)
-        y_pred = lda.predict(X_test)
 
-        # Métricas
-        accuracy = accuracy_score(y_test, y_pred)
-        f1 = f1_score(y_test, y_pred, average='weighted')
-        auc_score = roc_auc_score(y_test, lda.predict_proba(X_test)[:, 1]) if n_classes == 2 else None
+    model.remove_data()
+    result["model_id"] = save_model_to_disk(
+        model, "linear_regression", {**metadata, "r_squared": result["r_squared"]}
+    )
 
-        # --- Generación de Gráficos ---
-        def fig_to_base64(fig):
-            buf = BytesIO()
-            fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-            plt.close(fig)  # ¡Importante!
-            return base64.b64encode(buf.getvalue()).decode('utf-8')
+    return {"result": result, "plots": plots}
 
-        # Matriz de confusión
-        fig, ax = plt.subplots()
-        sns.heatmap(confusion_matrix(y_test, y_pred), annot=True, fmt='d', cmap='Blues', ax=ax)
-        ax.set_title("Matriz de Confusión")
-        conf_matrix_img = fig_to_base64(fig)
+def run_logistic_regression_chunked(source: str, target: str, features: List[str], metadata: Dict):
+    """Regresión logística por IRLS con gradiente y hessiana acumulados por bloques.
 
-        # Scree plot
-        fig, ax = plt.subplots()
-        ax.bar(range(1, n_components+1), lda.explained_variance_ratio_)
-        ax.set_title("Varianza Explicada por Componente")
-        scree_plot_img = fig_to_base64(fig)
-
-        # Proyección 2D (si aplica)
-        proj_2d = None
-        if n_components >= 2:
-            fig, ax = plt.subplots()
-            for i, class_name in enumerate(class_names):
-                mask = (y_train == i)
-                ax.scatter(X_train_lda[mask, 0], X_train_lda[mask, 1], label=class_name)
-            ax.set_title("Proyección LDA 2D")
-            ax.legend()
-            proj_2d = fig_to_base64(fig)
-
-        # Proyección 3D (si aplica)
-        proj_3d = None
-        if n_components >= 3:
-            fig = plt.figure()
-            ax = fig.add_subplot(111, projection='3d')
-            for i, class_name in enumerate(class_names):
-                mask = (y_train == i)
-                ax.scatter(X_train_lda[mask, 0], X_train_lda[mask, 1], X_train_lda[mask, 2], label=class_name)
-            ax.set_title("Proyección LDA 3D")
-            ax.legend()
-            proj_3d = fig_to_base64(fig)
+    Usa el mismo reparto 70/30 estratificado que run_logistic_regression; solo
+    el objetivo de las filas completas (un vector) se mantiene en memoria.
+    """
+    from scipy.special import expit
+    from scipy.stats import norm
+    from sklearn.metrics import accuracy_score, confusion_matrix, roc_auc_score, roc_curve
+    columns = [target] + features
+    y = np.concatenate([data[:, 0] for data in iter_training_chunks(source, columns)])
+    if len(y) < 2:
+        raise AnalysisError("No hay suficientes datos válidos para entrenar el modelo")
+    if len(np.unique(y)) != 2:
+        raise AnalysisError("La variable objetivo debe tener exactamente 2 valores para regresión logística")
+    if ((y < 0) | (y > 1)).any():
+        raise AnalysisError("La variable objetivo debe tomar valores entre 0 y 1")
+    is_train, _ = train_test_masks(y)
 
-        return {
-            "metrics": {
-                "accuracy": accuracy,
-                "f1_score": f1,
-                "auc_roc": auc_score,
-                "confusion_matrix": confusion_matrix(y_test, y_pred).tolist(),
-                "class_names": class_names,
-                "explained_variance": lda.explained_variance_ratio_.tolist()
-            },
-            "plots": {
-                "confusion_matrix": conf_matrix_img,
-                "scree_plot": scree_plot_img,
-                "projection_2d": proj_2d,
-                "projection_3d": proj_3d
-            }
-        }
+    def split_chunks():
+        offset = 0
+        for data in iter_training_chunks(source, columns):
+            rows = is_train[offset:offset + len(data)]
+            offset += len(data)
+            yield data, rows
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    def train_chunks():
+        for data, rows in split_chunks():
+            yield with_intercept(data[rows, 1:]), data[rows, 0]
 
-@app.get("/preview/{file_id}")
-async def preview_file(file_id: str, encoded: Optional[bool] = False):
-    """Devuelve una muestra del archivo original o codificado"""
+    def newton_terms(params):
+        H, g = np.zeros((len(params), len(params))), np.zeros(len(params))
+        for X, y_chunk in train_chunks():
+            p = expit(X @ params)
+            H += (X * (p * (1 - p))[:, None]).T @ X
+            g += X.T @ (y_chunk - p)
+        return H, g
+
+    params = np.zeros(len(features) + 1)
+    converged = False
+    try:
+        for iterations in range(1, LOGIT_MAX_ITER + 1):
+            H, g = newton_terms(params)
+            step = np.linalg.solve(H, g)
+            params = params + step
+            if np.abs(step).max() < LOGIT_TOL:
+                converged = True
+                break
+
+        # Última pasada: hessiana en los parámetros finales y predicciones de test
+        H = np.zeros_like(H)
+        y_test, y_pred_prob = [], []
+        for data, rows in split_chunks():
+            X = with_intercept(data[rows, 1:])
+            p = expit(X @ params)
+            H += (X * (p * (1 - p))[:, None]).T @ X
+            y_test.append(data[~rows, 0])
+            y_pred_prob.append(expit(with_intercept(data[~rows, 1:]) @ params))
+        normalized_cov = np.linalg.inv(H)
+    except np.linalg.LinAlgError:
+        raise AnalysisError("Matriz singular: revisa si hay predictoras colineales o separación perfecta")
+    y_test, y_pred_prob = np.concatenate(y_test), np.concatenate(y_pred_prob)
+    y_pred = (y_pred_prob >= 0.5).astype(int)
+
+    # Métricas
+    accuracy = accuracy_score(y_test, y_pred)
+    conf_matrix = confusion_matrix(y_test, y_pred)
+    fpr, tpr, _ = roc_curve(y_test, y_pred_prob)
+    auc_score = roc_auc_score(y_test, y_pred_prob)
+
+    # Tabla de coeficientes (mismas columnas que summary2 de statsmodels)
+    bse = np.sqrt(np.diag(normalized_cov))
+    z = params / bse
+    q = norm.ppf(0.975)
+    summary_table = [
+        {"Variable": name, "Coefficient": b, "Std_Error": se, "Z_value": zv,
+         "P_value": 2 * norm.sf(abs(zv)), "[0.025": b - q * se, "0.975]": b + q * se}
+        for name, b, se, zv in zip(["const"] + features, params.tolist(), bse.tolist(), z.tolist())
+    ]
+
+    plots = {
+        "confusion_matrix": plot_spec("confusion_matrix", {"matrix": conf_matrix}, axis_labels=True),
+        "roc_curve": plot_spec("roc_curve", line_arrays(fpr, tpr), auc=float(auc_score)),
+    }
+
+    result = {
+        "target": target,
+        "features": features,
+        "summary_table": summary_table,
+        "accuracy": accuracy,
+        "auc": auc_score,
+        "model_type": "logistic_regression"
+    }
+
+    # El modelo se crea sobre unas pocas filas solo para guardar la misma estructura de statsmodels
+    X_head, y_head = next(train_chunks())
+    model = logit_results(X_head, y_head, params, normalized_cov, converged, iterations, int(is_train.sum()))
+    model.remove_data()
+    result["model_id"] = save_model_to_disk(
+        model, "logistic_regression", {**metadata, "accuracy": accuracy, "auc": auc_score}
+    )
+
+    return {"result": result, "plots": plots}
+
+def run_lda_chunked(source: str, target: str, features: List[str], metadata: Dict):
+    """LDA con medias por clase y covarianza intra-clase acumuladas por bloques.
+
+    Reproduce el solucionador "svd" de scikit-learn a partir de esos
+    estadísticos y el mismo reparto 70/30 estratificado que run_lda.
+    """
+    from sklearn.metrics import accuracy_score, confusion_matrix, f1_score, roc_auc_score
+    from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
+    # Primera pasada: clases del objetivo (como LabelEncoder) sin guardar las filas
+    labels, codes = {}, []
+    for _, raw in iter_training_chunks(source, features, raw=target):
+        for value in pd.unique(raw):
+            labels.setdefault(value, len(labels))
+        codes.append(pd.Index(list(labels)).get_indexer(raw))
+    classes = np.unique(np.asarray(list(labels)))  # mismo orden que LabelEncoder
+    class_names = classes.tolist()
+    remap = np.empty(len(labels), dtype=np.int64)
+    remap[[labels[c] for c in classes]] = np.arange(len(classes))
+    y = remap[np.concatenate(codes)] if codes else np.empty(0, dtype=np.int64)
+
+    n_classes = len(class_names)
+    n_components = min(len(features), n_classes - 1)
+    if n_components < 1:
+        raise AnalysisError("Se requieren al menos 2 clases para LDA")
+    is_train, train_idx = train_test_masks(y)
+
+    def split_chunks():
+        offset = 0
+        for X, _ in iter_training_chunks(source, features, raw=target):
+            rows = is_train[offset:offset + len(X)]
+            labels_chunk = y[offset:offset + len(X)]
+            yield offset, X, rows, labels_chunk
+            offset += len(X)
+
+    # Segunda pasada: media y matriz de dispersión de cada clase (fusión de Chan)
+    p = len(features)
+    counts = np.zeros(n_classes)
+    means = np.zeros((n_classes, p))
+    scatter = np.zeros((n_classes, p, p))
+    for _, X, rows, labels_chunk in split_chunks():
+        for k in range(n_classes):
+            Xk = X[rows & (labels_chunk == k)]
+            if len(Xk) == 0:
+                continue
+            mean_k = Xk.mean(axis=0)
+            centered = Xk - mean_k
+            delta = mean_k - means[k]
+            total = counts[k] + len(Xk)
+            scatter[k] += centered.T @ centered + np.outer(delta, delta) * counts[k] * len(Xk) / total
+            means[k] += delta * len(Xk) / total
+            counts[k] = total
+
+    # Solucionador "svd" de LinearDiscriminantAnalysis a partir de los estadísticos
+    lda = LDA(n_components=n_components)
+    n_samples = counts.sum()
+    within = scatter.sum(axis=0)
+    priors = counts / n_samples
+    std = np.sqrt(np.diag(within) / n_samples)
+    std[std == 0] = 1.0
+    eigvals, eigvecs = np.linalg.eigh(within / np.outer(std, std) / n_samples)
+    order = np.argsort(eigvals)[::-1]
+    S, Vt = np.sqrt(np.clip(eigvals[order], 0, None)), eigvecs[:, order].T
+    rank = int(np.sum(S > lda.tol))
+    scalings = (Vt[:rank, :] / std).T / S[:rank]
+    xbar = priors @ means
+    centers = (np.sqrt(n_samples * priors / (n_classes - 1)) * (means - xbar).T).T @ scalings
+    _, S, Vt = np.linalg.svd(centers, full_matrices=False)
+    rank = int(np.sum(S > lda.tol * S[0]))
+    lda.classes_ = np.arange(n_classes)
+    lda.priors_, lda.means_, lda.xbar_ = priors, means, xbar
+    lda.explained_variance_ratio_ = (S ** 2 / np.sum(S ** 2))[:n_components]
+    lda.scalings_ = scalings @ Vt.T[:, :rank]
+    coef = (means - xbar) @ lda.scalings_
+    intercept = -0.5 * np.sum(coef ** 2, axis=1) + np.log(priors)
+    lda.coef_ = coef @ lda.scalings_.T
+    lda.intercept_ = intercept - xbar @ lda.coef_.T
+    if n_classes == 2:
+        lda.coef_ = (lda.coef_[1] - lda.coef_[0]).reshape(1, -1)
+        lda.intercept_ = np.array([lda.intercept_[1] - lda.intercept_[0]])
+    lda._max_components = lda._n_features_out = n_components
+    lda.n_features_in_ = p
+    lda.feature_names_in_ = np.asarray(features, dtype=object)
+
+    # Tercera pasada: predicciones de test y proyección de la muestra de entrenamiento
+    y_train = y[train_idx]
+    sample = train_idx[stratified_indices(y_train, PLOT_MAX_POINTS)]
+    position = {row: i for i, row in enumerate(sample.tolist())}
+    projected = np.zeros((len(sample), n_components))
+    y_test, y_pred, y_prob = [], [], []
+    for offset, X, rows, labels_chunk in split_chunks():
+        X_test = pd.DataFrame(X[~rows], columns=features)
+        if len(X_test):
+            y_test.append(labels_chunk[~rows])
+            y_pred.append(lda.predict(X_test))
+            if n_classes == 2:
+                y_prob.append(lda.predict_proba(X_test)[:, 1])
+        local = sample[(sample >= offset) & (sample < offset + len(X))]
+        if len(local):
+            projected[[position[r] for r in local.tolist()]] = lda.transform(
+                pd.DataFrame(X[local - offset], columns=features)
+            )
+    y_test, y_pred = np.concatenate(y_test), np.concatenate(y_pred)
+
+    # Métricas
+    accuracy = accuracy_score(y_test, y_pred)
+    f1 = f1_score(y_test, y_pred, average='weighted')
+    auc_score = roc_auc_score(y_test, np.concatenate(y_prob)) if n_classes == 2 else None
+    conf_matrix = confusion_matrix(y_test, y_pred)
+
+    plots = {
+        "confusion_matrix": plot_spec("confusion_matrix", {"matrix": conf_matrix}),
+        "scree_plot": plot_spec("scree", {"explained_variance": lda.explained_variance_ratio_}),
+        "projection_2d": None,
+        "projection_3d": None,
+    }
+    if n_components >= 2:
+        plots["projection_2d"] = plot_spec(
+            "projection", {"projected": projected[:, :2], "labels": y[sample]}, class_names=class_names
+        )
+    if n_components >= 3:
+        plots["projection_3d"] = plot_spec(
+            "projection", {"projected": projected[:, :3], "labels": y[sample]}, class_names=class_names
+        )
+
+    result = {
+        "metrics": {
+            "accuracy": accuracy,
+            "f1_score": f1,
+            "auc_roc": auc_score,
+            "confusion_matrix": conf_matrix.tolist(),
+            "class_names": class_names,
+            "explained_variance": lda.explained_variance_ratio_.tolist()
+        },
+        "model_id": save_model_to_disk(
+            lda, "lda", {**metadata, "class_names": class_names, "accuracy": accuracy}
+        ),
+    }
+
+    return {"result": result, "plots": plots}
+
+
+# Selección de variables
+FEATURE_SELECTION_N_JOBS = int(os.environ.get("CORRSTAR_FEATURE_SELECTION_JOBS", "-1"))  # procesos por búsqueda
+FEATURE_SELECTION_SEED = 42
+
+
+class FeatureSelectionRequest(BaseModel):
+    target: str
+    features: List[str]
+    task: Literal["auto", "linear", "logistic"] = "auto"  # auto: logística si el objetivo es binario
+    folds: int = 5
+    max_features: Optional[int] = None  # límite de pasos de la búsqueda paso a paso
+    min_improvement: float = 0.001  # mejora mínima de la puntuación CV para añadir otra variable
+
+@stage("select_features.prepare")
+def prepare_select_features(file_id: str, req: FeatureSelectionRequest):
+    """Valida la petición y devuelve las filas completas de predictoras y objetivo"""
     if file_id not in global_data:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    if not req.features:
+        raise HTTPException(status_code=400, detail="Faltan variables predictoras")
+    if req.folds < 2:
+        raise HTTPException(status_code=400, detail="Se necesitan al menos 2 particiones")
+
+    df = global_data.working_frame(file_id)
+    missing = [col for col in [req.target] + req.features if col not in df.columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Columnas no encontradas: {missing}")
+    if req.target in req.features:
+        raise HTTPException(status_code=400, detail="La variable objetivo no puede ser predictora")
+
+    values, valid = global_data.numeric_columns(file_id, [req.target] + req.features)
+    data = values[valid.all(axis=1)]
+    return {"X": data[:, 1:], "y": data[:, 0]}, {
+        "target": req.target, "features": req.features, "task": req.task,
+        "folds": req.folds, "max_features": req.max_features, "min_improvement": req.min_improvement,
+    }
+
+def cv_score_columns(X: np.ndarray, y: np.ndarray, columns: List[int], task: str, cv, scoring: str) -> float:
+    """Puntuación media de validación cruzada usando solo ``columns`` de X"""
+    from sklearn.linear_model import LinearRegression, LogisticRegression
+    from sklearn.model_selection import cross_val_score
+    estimator = LinearRegression() if task == "linear" else LogisticRegression(max_iter=1000)
+    return float(cross_val_score(estimator, X[:, columns], y, cv=cv, scoring=scoring).mean())
 
-    df = None
-    if encoded and "dummy_encoded" in global_data[file_id]:
-        df = global_data[file_id]["dummy_encoded"]
+@stage("select_features.search")
+def run_select_features(X: np.ndarray, y: np.ndarray, target: str, features: List[str], task: str,
+                        folds: int, max_features: Optional[int], min_improvement: float):
+    """Cribado univariante, RFE y búsqueda paso a paso con validación cruzada (pool de procesos).
+
+    Los ajustes candidatos de cada paso se reparten entre procesos con joblib;
+    X llega como memmap de solo lectura y joblib la comparte sin copiarla.
+    """
+    from sklearn.linear_model import LinearRegression, LogisticRegression
+    from sklearn.feature_selection import RFE, SelectKBest, f_classif, f_regression
+    from sklearn.model_selection import KFold, StratifiedKFold
+    from sklearn.preprocessing import StandardScaler
+    classes = np.unique(y)
+    if task == "auto":
+        task = "logistic" if len(classes) == 2 else "linear"
+    if task == "logistic":
+        if len(classes) != 2:
+            raise AnalysisError("La variable objetivo debe tener exactamente 2 valores para regresión logística")
+        y = (y == classes[1]).astype(np.int64)
+        cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=FEATURE_SELECTION_SEED)
+        scoring, score_func = "roc_auc", f_classif
+        if np.bincount(y).min() < folds:
+            raise AnalysisError("Cada clase necesita al menos tantas filas como particiones")
     else:
-        df = global_data[file_id]["dataframe"]
+        cv = KFold(n_splits=folds, shuffle=True, random_state=FEATURE_SELECTION_SEED)
+        scoring, score_func = "r2", f_regression
+    if len(y) < 2 * folds:
+        raise AnalysisError("No hay suficientes datos válidos para la validación cruzada")
+
+    n_features = len(features)
+    max_steps = min(max_features or n_features, n_features)
+    total = 2 + sum(n_features - step for step in range(max_steps))
+    done = 0
+    report_progress(done, total, "univariante")
+
+    # Cribado univariante
+    selector = SelectKBest(score_func, k="all").fit(X, y)
+    done += 1
+    report_progress(done, total, "rfe")
+
+    # RFE sobre las variables estandarizadas para que los coeficientes sean comparables
+    X_scaled = StandardScaler().fit_transform(X)
+    estimator = LinearRegression() if task == "linear" else LogisticRegression(max_iter=1000)
+    rfe = RFE(estimator, n_features_to_select=1).fit(X_scaled, y)
+    done += 1
+    report_progress(done, total, "paso a paso")
+
+    # Selección hacia delante: en cada paso se prueba cada variable restante
+    selected, step_scores = [], []
+    remaining = list(range(n_features))
+    best_score = -np.inf
+    with joblib.Parallel(n_jobs=FEATURE_SELECTION_N_JOBS) as parallel:
+        for step in range(max_steps):
+            scores = parallel(
+                joblib.delayed(cv_score_columns)(X, y, selected + [j], task, cv, scoring) for j in remaining
+            )
+            done += len(remaining)
+            report_progress(done, total, "paso a paso")
+            best = int(np.nanargmax(scores)) if not np.isnan(scores).all() else None
+            if best is None or scores[best] <= best_score + min_improvement:
+                break
+            best_score = scores[best]
+            selected.append(remaining.pop(best))
+            step_scores.append(best_score)
+    report_progress(total, total, "terminado")
+
+    step_of = {j: i for i, j in enumerate(selected)}
+    ranking = [
+        {
+            "feature": features[j],
+            "stepwise_step": step_of[j] + 1 if j in step_of else None,
+            "cv_score": step_scores[step_of[j]] if j in step_of else None,
+            "rfe_rank": int(rfe.ranking_[j]),
+            "univariate_score": float(selector.scores_[j]),
+            "univariate_p_value": float(selector.pvalues_[j]),
+        }
+        for j in range(n_features)
+    ]
+    ranking.sort(key=lambda r: (r["stepwise_step"] is None, r["stepwise_step"] or 0, r["rfe_rank"]))
 
     return {
-        "preview": df.head(10).fillna("").to_dict(orient="records"),
-        "columns": df.columns.tolist(),
-        "row_count": len(df)
+        "target": target,
+        "task": task,
+        "scoring": scoring,
+        "folds": folds,
+        "n_observations": len(y),
+        "selected_features": [features[j] for j in selected],
+        "cv_score": step_scores[-1] if step_scores else None,
+        "ranking": ranking,
     }
 
+@app.post("/select-features/{file_id}", status_code=202)
+async def select_features(file_id: str, req: FeatureSelectionRequest):
+    """Lanza la selección de variables; el avance y el resultado se consultan en /jobs/{job_id}"""
+    arrays, params = await run_in_threadpool(prepare_select_features, file_id, req)
+    job_id = await run_in_threadpool(job_manager.submit, "feature_selection", run_select_features, arrays, params)
+    return job_manager.status(job_id)
+
+
+# Trabajos en segundo plano
+@app.post("/jobs/calculate-correlation/{file_id}", status_code=202)
+async def submit_correlation_job(file_id: str, req: CorrelationRequest):
+    arrays, params = await run_in_threadpool(prepare_correlation, file_id, req)
+    job_id = await run_in_threadpool(job_manager.submit, "correlation", run_correlation, arrays, params)
+    return job_manager.status(job_id)
+
+@app.post("/jobs/train-linear-regression/{file_id}", status_code=202)
+async def submit_linear_regression_job(file_id: str, req: LinearRegressionRequest):
+    arrays, params = await run_in_threadpool(prepare_linear_regression, file_id, req)
+    job_id = await run_in_threadpool(job_manager.submit, "linear_regression", run_linear_regression, arrays, params, publish_result)
+    return job_manager.status(job_id)
+
+@app.post("/jobs/train-logistic-regression/{file_id}", status_code=202)
+async def submit_logistic_regression_job(file_id: str, req: LogisticRegressionRequest):
+    arrays, params = await run_in_threadpool(prepare_logistic_regression, file_id, req)
+    job_id = await run_in_threadpool(job_manager.submit, "logistic_regression", run_logistic_regression, arrays, params, publish_logistic_result)
+    return job_manager.status(job_id)
+
+@app.post("/jobs/train-lda/{file_id}", status_code=202)
+async def submit_lda_job(file_id: str, req: TrainLDARequest):
+    arrays, params = await run_in_threadpool(prepare_lda, file_id, req)
+    job_id = await run_in_threadpool(job_manager.submit, "lda", run_lda, arrays, params, publish_result)
+    return job_manager.status(job_id)
+
+@app.get("/jobs/")
+async def list_jobs():
+    """Lista los trabajos en cola, en ejecución y terminados recientemente"""
+    return {"jobs": [job_manager.status(job_id) for job_id in list(job_manager.jobs)]}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return job_manager.status(job_id)
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    return APIResponse(job_manager.result(job_id))
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancela un trabajo en cola o descarta el resultado de uno en ejecución"""
+    return job_manager.cancel(job_id)
+
+
+
+# Gráficos bajo demanda
+@app.get("/results/{result_id}/plots/{name}")
+async def get_result_plot(result_id: str, name: str):
+    """Devuelve el PNG de un gráfico, dibujándolo la primera vez que se pide"""
+    png = result_store.cached_png(result_id, name)
+    if png is None:
+        spec = result_store.plot_spec(result_id, name)
+        png = await job_manager.run("plot", render_plot, spec["arrays"], {"renderer": spec["renderer"], **spec["params"]})
+        result_store.cache_png(result_id, name, png)
+    return Response(content=png, media_type="image/png", headers={"Cache-Control": "private, max-age=3600"})
+
+
+
+# Registro de modelos
+@app.get("/models/")
+async def list_models():
+    """Lista los modelos guardados con sus metadatos"""
+    return {"models": await run_in_threadpool(model_registry.list)}
+
+@app.get("/models/{model_id}")
+async def get_model(model_id: str):
+    return model_registry.metadata(model_id)
+
+@app.post("/models/{model_id}/load")
+async def load_model(model_id: str):
+    """Carga el modelo en la caché para que las predicciones no esperen a leerlo"""
+    await run_in_threadpool(model_registry.load, model_id)
+    return model_registry.metadata(model_id)
+
+@app.delete("/models/{model_id}")
+async def delete_model(model_id: str):
+    model_registry.delete(model_id)
+    return {"message": f"Modelo {model_id} eliminado"}
+
+
+
+# Predicción por lotes
+PREDICT_CHUNK_ROWS = 100_000
+
+
+def encode_for_model(df: pd.DataFrame, encoding_maps: Dict) -> pd.DataFrame:
+    """Aplica a filas nuevas la misma codificación que encode_categoricals_auto"""
+    encoded = {}
+    for col, encoding in encoding_maps.items():
+        if col not in df.columns:
+            continue
+        if encoding["type"] == "ordinal":
+            encoded[col + "_ordinal"] = df[col].map(encoding["mapping"])
+        else:
+            # Mapas antiguos sin "categories": el valor se deduce del nombre de la dummy
+            categories = encoding.get("categories") or [d[len(col) + 1:] for d in encoding["dummies"]]
+            values = df[col].astype(str).to_numpy()
+            known = np.zeros(len(df), dtype=bool)
+            for dummy, category in zip(encoding["dummies"], categories):
+                hit = values == str(category)
+                encoded[dummy] = hit.astype(np.uint8)
+                known |= hit
+            if encoding.get("other"):
+                encoded[encoding["other"]] = (~known & df[col].notna().to_numpy()).astype(np.uint8)
+    if not encoded:
+        return df
+    new_columns = pd.DataFrame(encoded, index=df.index)
+    return pd.concat([df.drop(columns=new_columns.columns, errors="ignore"), new_columns], axis=1)
+
+def required_columns(metadata: Dict) -> List[str]:
+    """Columnas de entrada necesarias para construir las predictoras del modelo"""
+    derived = {}
+    for col, encoding in metadata.get("encoding_maps", {}).items():
+        names = [col + "_ordinal"] if encoding["type"] == "ordinal" else encoding["dummies"]
+        derived.update({name: col for name in names})
+    return list(dict.fromkeys(derived.get(f, f) for f in metadata["features"]))
+
+@stage("predict.score")
+def score_chunk(save_data: Dict, df: pd.DataFrame) -> pd.DataFrame:
+    """Puntúa un bloque de filas de forma vectorizada; las filas incompletas quedan nulas"""
+    from scipy.special import expit
+    stage_size(*df.shape)
+    metadata = save_data["metadata"]
+    model = save_data["model"]
+    df = encode_for_model(df.copy(), metadata.get("encoding_maps", {}))
+    X = np.column_stack([
+        pd.to_numeric(df[f], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        for f in metadata["features"]
+    ])
+    valid = ~np.isnan(X).any(axis=1)
+    out = {}
+
+    if save_data["model_type"] == "linear_regression":
+        params = np.asarray(model.params)
+        interactions = metadata.get("interactions", [])
+        if interactions:
+            position = {f: i for i, f in enumerate(metadata["features"])}
+            products = [X[:, [position[c] for c in term]].prod(axis=1) for term in interactions]
+            X = np.column_stack([X] + products)
+        out["prediction"] = params[0] + X @ params[1:]
+    elif save_data["model_type"] == "logistic_regression" and "class_names" not in metadata:
+        params = np.asarray(model.params)
+        probability = expit(params[0] + X @ params[1:])
+        out["probability"] = probability
+        out["prediction"] = pd.array(np.where(valid, probability >= 0.5, 0), dtype="Int64")
+        out["prediction"][~valid] = pd.NA
+    elif save_data["model_type"] == "logistic_regression":
+        # Motor "fast": clases con nombre, binarias o multinomiales
+        class_names = np.asarray(metadata["class_names"], dtype=object)
+        params = np.asarray(model.params).reshape(X.shape[1] + 1, -1)
+        probabilities = logistic_probabilities(params, with_intercept(X))
+        prediction = np.full(len(X), None, dtype=object)
+        prediction[valid] = class_names[probabilities[valid].argmax(axis=1)]
+        out["prediction"] = prediction
+        for i, name in enumerate(class_names):
+            out[f"probability_{name}"] = probabilities[:, i]
+    else:
+        class_names = np.asarray(metadata["class_names"], dtype=object)
+        prediction = np.full(len(X), None, dtype=object)
+        probabilities = np.full((len(X), len(class_names)), np.nan)
+        if valid.any():
+            prediction[valid] = class_names[model.predict(X[valid])]
+            probabilities[valid] = model.predict_proba(X[valid])
+        out["prediction"] = prediction
+        for i, name in enumerate(class_names):
+            out[f"probability_{name}"] = probabilities[:, i]
+
+    return pd.DataFrame(out)
+
+def read_prediction_chunks(path: str, content_type: str, metadata: Dict):
+    """Lee la entrada a predecir por bloques (CSV o Arrow IPC)"""
+    if content_type.startswith(ARROW_STREAM_TYPE):
+        with pyarrow.ipc.open_stream(path) as reader:
+            for batch in reader:
+                yield batch.to_pandas()
+    else:
+        dtypes = {col: str for col in metadata.get("encoding_maps", {})}
+        with pd.read_csv(path, dtype=dtypes, chunksize=PREDICT_CHUNK_ROWS) as reader:
+            yield from reader
+
+def prediction_stream(save_data: Dict, chunks, output_format: str, cleanup_path: Optional[str] = None):
+    """Genera la salida NDJSON o CSV bloque a bloque"""
+    try:
+        offset = 0
+        for chunk in chunks:
+            scored = score_chunk(save_data, chunk)
+            scored.insert(0, "row", np.arange(offset, offset + len(scored)))
+            offset += len(scored)
+            if output_format == "csv":
+                yield scored.to_csv(index=False, header=offset == len(scored))
+            elif len(scored):
+                yield scored.to_json(orient="records", lines=True)
+    finally:
+        if cleanup_path:
+            os.unlink(cleanup_path)
+
+@app.post("/predict/{model_id}")
+async def predict(model_id: str, request: Request, format: Literal["ndjson", "csv"] = "ndjson"):
+    """Puntúa filas nuevas con un modelo guardado.
+
+    La entrada puede ser JSON (lista de filas o ``{"rows": [...]}``), un CSV
+    como archivo multipart o cuerpo ``text/csv``, o Arrow IPC en streaming.
+    La respuesta se emite por bloques en NDJSON o CSV.
+    """
+    save_data = await run_in_threadpool(model_registry.load, model_id)
+    metadata = save_data["metadata"]
+    content_type = request.headers.get("content-type", "")
+    temp_path = None
+
+    if content_type.startswith("application/json"):
+        payload = await request.json()
+        rows = payload.get("rows") if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Se espera una lista de filas")
+        frame = pd.DataFrame(rows)
+        columns = frame.columns
+        chunks = (frame.iloc[i:i + PREDICT_CHUNK_ROWS] for i in range(0, len(frame), PREDICT_CHUNK_ROWS))
+    else:
+        if content_type.startswith(ARROW_STREAM_TYPE) and not HAS_PYARROW:
+            raise HTTPException(status_code=415, detail="Arrow IPC requiere pyarrow en el servidor")
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            if "file" not in form:
+                raise HTTPException(status_code=400, detail="Falta el archivo 'file'")
+            temp_path, _ = await spool_to_tempfile(iter_upload(form["file"]))
+        else:
+            temp_path, _ = await spool_to_tempfile(request.stream())
+        try:
+            if content_type.startswith(ARROW_STREAM_TYPE):
+                with pyarrow.ipc.open_stream(temp_path) as reader:
+                    columns = reader.schema.names
+            else:
+                columns = pd.read_csv(temp_path, nrows=0).columns
+        except Exception as e:
+            os.unlink(temp_path)
+            raise HTTPException(status_code=400, detail=f"Error al leer los datos: {str(e)}")
+        chunks = read_prediction_chunks(temp_path, content_type, metadata)
+
+    missing = [col for col in required_columns(metadata) if col not in columns]
+    if missing:
+        if temp_path:
+            os.unlink(temp_path)
+        raise HTTPException(status_code=400, detail=f"Columnas no encontradas: {missing}")
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(prediction_stream(save_data, chunks, format, temp_path), media_type=media_type)
 
 
+if __name__ == "__main__":
+    import sys
+    if "--startup-benchmark" in sys.argv:
+        # Guarda contra regresiones del arranque: sale con 1 si supera el presupuesto
+        result = startup_benchmark()
+        print(json.dumps(result, indent=2))
+        sys.exit(0 if result["ok"] else 1)
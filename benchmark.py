@@ -0,0 +1,433 @@
+"""Benchmarks reproducibles de los endpoints de CorrStarApp.
+
+Genera CSV sintéticos de tamaño parametrizable (filas, columnas, cardinalidad
+de la variable categórica y proporción de valores faltantes) y recorre todos
+los endpoints de FastAPI en proceso con el TestClient, sin red. Cada escenario
+se ejecuta en un proceso nuevo para que el pico de memoria sea el suyo. Se
+registran latencia, filas por segundo, pico de memoria residente y las etapas
+de Server-Timing en un JSON que se compara con una línea base.
+
+Uso:
+    python benchmark.py                          # preset "quick"
+    python benchmark.py --preset default --save-baseline
+    python benchmark.py --rows 10000,1000000 --cols 5,50 --cardinality 20 --missing 0.1
+    python benchmark.py --baseline benchmark_baseline.json   # sale con 1 si hay regresiones
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent
+DATA_DIR = ROOT / "bench_data"  # CSV generados; se reutilizan entre ejecuciones
+RESULTS_PATH = ROOT / "benchmark_results.json"
+BASELINE_PATH = ROOT / "benchmark_baseline.json"
+
+PRESETS = {
+    "quick": {"rows": [10_000], "cols": [5, 50]},
+    "default": {"rows": [10_000, 100_000, 1_000_000], "cols": [5, 50]},
+    "full": {"rows": [10_000, 100_000, 1_000_000, 10_000_000], "cols": [5, 50, 500]},
+}
+GENERATE_CHUNK_ROWS = 200_000
+# Una regresión exige superar la línea base en proporción y en valor absoluto,
+# para que el ruido de los endpoints de milisegundos no la dispare
+DEFAULT_THRESHOLDS = {"latency": 0.25, "min_seconds": 0.05, "rss": 0.20, "min_rss_bytes": 32 * 1024 * 1024}
+
+
+# Datos sintéticos
+def scenario_id(scenario: Dict) -> str:
+    return "r{rows}_c{cols}_k{cardinality}_m{missing:g}_s{seed}".format(**scenario)
+
+def numeric_names(cols: int) -> List[str]:
+    # Una de las columnas pedidas es la categórica "cat"
+    return [f"x{i}" for i in range(1, max(cols - 1, 1) + 1)]
+
+def generate_csv(path: Path, rows: int, cols: int, cardinality: int, missing: float, seed: int):
+    """Escribe el CSV por bloques con semillas por bloque, así es idéntico en cada máquina.
+
+    Columnas: predictores numéricos ``x1..``, la categórica ``cat`` y los
+    objetivos ``y`` (continuo), ``bin`` (binario) y ``cls`` (tres clases), que
+    dependen de los cinco primeros predictores y nunca faltan.
+    """
+    names = numeric_names(cols)
+    beta = np.zeros(len(names))
+    beta[:5] = [1.0, -0.5, 0.25, 0.75, -1.0][:len(names)]
+    scale = np.sqrt(beta @ beta + 1)
+    levels = np.array([f"k{i}" for i in range(cardinality)], dtype=object)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", newline="") as f:
+        for index, start in enumerate(range(0, rows, GENERATE_CHUNK_ROWS)):
+            n = min(GENERATE_CHUNK_ROWS, rows - start)
+            rng = np.random.default_rng([seed, index])
+            X = rng.normal(size=(n, len(names)))
+            codes = rng.integers(0, cardinality, n)
+            y = X @ beta + 0.3 * (codes % 3) + rng.normal(size=n)
+            chunk = pd.DataFrame(X, columns=names)
+            chunk["cat"] = levels[codes]
+            if missing > 0:
+                chunk = chunk.mask(rng.random(chunk.shape) < missing)
+            chunk["y"] = y
+            chunk["bin"] = (y > 0).astype(int)
+            chunk["cls"] = np.where(y > 0.43 * scale, "alto", np.where(y < -0.43 * scale, "bajo", "medio"))
+            chunk.to_csv(f, index=False, header=index == 0, float_format="%.6g")
+    os.replace(tmp, path)
+
+def dataset_path(scenario: Dict, data_dir: Path) -> Path:
+    path = data_dir / f"{scenario_id(scenario)}.csv"
+    if not path.exists():
+        data_dir.mkdir(parents=True, exist_ok=True)
+        print(f"Generando {path.name} ...", flush=True)
+        generate_csv(path, scenario["rows"], scenario["cols"], scenario["cardinality"], scenario["missing"], scenario["seed"])
+    return path
+
+
+# Medición de memoria
+def workers_peak_rss_bytes() -> Optional[int]:
+    """Suma del pico de memoria (VmHWM) de los procesos hijos vivos, como el pool; solo Linux"""
+    try:
+        pids = set()
+        for children in Path("/proc/self/task").glob("*/children"):
+            pids.update(children.read_text().split())
+        total = 0
+        for pid in pids:
+            try:
+                status = Path(f"/proc/{pid}/status").read_text()
+            except OSError:
+                continue  # terminó entre medias
+            for line in status.splitlines():
+                if line.startswith("VmHWM:"):
+                    total += int(line.split()[1]) * 1024
+        return total
+    except OSError:
+        return None
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration) / 1000
+    return stages
+
+
+# Ejecución de un escenario (en su propio proceso)
+class Recorder:
+    """Repite cada petición, comprueba el estado y guarda las medidas por endpoint"""
+
+    def __init__(self, client, rows: int, repeat: int):
+        self.client = client
+        self.rows = rows
+        self.repeat = repeat
+        self.endpoints: Dict[str, Dict] = {}
+
+    def measure(self, name: str, method: str, url: str, expect: int = 200, repeat: Optional[int] = None,
+                before=None, rows: Optional[int] = -1, **kwargs):
+        runs = []
+        for _ in range(repeat or self.repeat):
+            if before is not None:
+                before()
+            start = time.perf_counter()
+            response = self.client.request(method, url, **kwargs)
+            runs.append(time.perf_counter() - start)
+            if response.status_code != expect:
+                raise RuntimeError(f"{name}: {method} {url} -> {response.status_code} {response.text[:300]}")
+        self.record(name, runs, rows, parse_server_timing(response.headers.get("server-timing")),
+                    response.num_bytes_downloaded)
+        return response
+
+    def record(self, name: str, runs: List[float], rows: Optional[int] = -1, stages: Optional[Dict] = None,
+               response_bytes: Optional[int] = None):
+        import Server
+        rows = self.rows if rows == -1 else rows
+        seconds = float(np.median(runs))
+        self.endpoints[name] = {
+            "seconds": seconds,
+            "runs": runs,
+            "rows_per_second": rows / seconds if rows and seconds > 0 else None,
+            "peak_rss_bytes": Server.peak_rss_bytes(),  # máximo acumulado del proceso hasta aquí
+            "workers_peak_rss_bytes": workers_peak_rss_bytes(),
+            "stages": stages or {},
+            "response_bytes": response_bytes,  # tal como viajan (comprimidos si se negoció)
+        }
+
+    def job(self, name: str, url: str, body: Dict) -> str:
+        """Envía un trabajo y mide hasta que termina; devuelve su id"""
+        runs, job_id = [], None
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            response = self.client.post(url, json=body)
+            if response.status_code != 202:
+                raise RuntimeError(f"{name}: POST {url} -> {response.status_code} {response.text[:300]}")
+            job_id = response.json()["job_id"]
+            while (status := self.client.get(f"/jobs/{job_id}").json())["status"] in ("queued", "running"):
+                time.sleep(0.01)
+            runs.append(time.perf_counter() - start)
+            if status["status"] != "done":
+                raise RuntimeError(f"{name}: el trabajo terminó con {status}")
+        self.record(name, runs)
+        return job_id
+
+
+def run_scenario(scenario: Dict, csv_path: Path, repeat: int, model_features: int) -> Dict:
+    """Recorre todos los endpoints sobre el CSV; se ejecuta en un directorio de trabajo temporal"""
+    import Server
+    from fastapi.testclient import TestClient
+
+    client = TestClient(Server.app)
+    rec = Recorder(client, scenario["rows"], repeat)
+    start = time.perf_counter()
+    Server.warm_up()  # librerías y pool listos antes de medir: la latencia no incluye importaciones
+    warm_up_seconds = time.perf_counter() - start
+
+    numeric = numeric_names(scenario["cols"])
+    clear = Server.analysis_cache.clear  # sin caché: cada repetición calcula de verdad
+
+    def upload():
+        with open(csv_path, "rb") as f:
+            return client.post("/upload-csv/", files={"file": (csv_path.name, f, "text/csv")})
+    runs, uploaded = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = upload()
+        runs.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"upload-csv -> {response.status_code} {response.text[:300]}")
+        if uploaded is not None:  # solo se conserva la última subida
+            client.delete(f"/remove-file/{uploaded['file_id']}")
+        uploaded = response.json()
+    rec.record("upload-csv", runs, stages=parse_server_timing(response.headers.get("server-timing")))
+    fid = uploaded["file_id"]
+
+    rec.measure("list-files", "GET", "/list-files/", rows=None)
+    rec.measure("preview", "GET", f"/preview/{fid}?limit=100&stats=true", rows=None)
+    rec.measure("preview.arrow", "GET", f"/preview/{fid}?limit=1000&format=arrow", rows=None)
+    rec.measure("profile", "GET", f"/profile/{fid}", before=clear)
+    rec.measure("profile.cached", "GET", f"/profile/{fid}", repeat=1, rows=None)
+
+    for method in ("pearson", "spearman"):
+        body = {"variables": numeric + ["y"], "method": method}
+        rec.measure(f"correlation.{method}", "POST", f"/calculate-correlation/{fid}", json=body, before=clear)
+    # Kendall es el más caro: solo sobre las variables de los modelos
+    body = {"variables": numeric[:model_features] + ["y"], "method": "kendall"}
+    rec.measure("correlation.kendall", "POST", f"/calculate-correlation/{fid}", json=body, before=clear)
+    body = {"variables": numeric + ["y"], "method": "pearson", "missing": "pairwise"}
+    rec.measure("correlation.pairwise", "POST", f"/calculate-correlation/{fid}", json=body, before=clear)
+    rec.measure("correlation.cached", "POST", f"/calculate-correlation/{fid}", json=body, repeat=1, rows=None)
+
+    encoded = rec.measure("encode-categoricals", "POST", "/encode-categoricals-auto/",
+                          json={"file_id": fid, "columns": ["cat"]}).json()
+    rec.measure("preview.encoded", "GET", f"/preview/{fid}?encoded=true&limit=100", rows=None)
+    features = numeric[:model_features] + encoded["encoding_maps"]["cat"]["dummies"][:2]
+
+    linear = rec.measure("train-linear-regression", "POST", f"/train-linear-regression/{fid}",
+                         json={"target": "y", "features": features}, before=clear).json()
+    logistic = rec.measure("train-logistic-regression", "POST", f"/train-logistic-regression/{fid}",
+                           json={"target": "bin", "features": features}, before=clear).json()
+    rec.measure("train-logistic-regression.cv", "POST", f"/train-logistic-regression/{fid}",
+                json={"target": "bin", "features": features, "cv_folds": 5}, before=clear)
+    rec.measure("train-logistic-regression.multinomial", "POST", f"/train-logistic-regression/{fid}",
+                json={"target": "cls", "features": features, "class_weight": "balanced"}, before=clear)
+    lda = rec.measure("train-lda", "POST", f"/train-lda/{fid}",
+                      json={"target": "cls", "features": features}, before=clear).json()
+    rec.measure("train-lda.cached", "POST", f"/train-lda/{fid}",
+                json={"target": "cls", "features": features}, repeat=1, rows=None)
+    for name, url in ((n, u) for n, u in linear["plots"].items() if u):
+        # El primer GET dibuja el gráfico; los siguientes salen de la caché de PNG
+        rec.measure(f"plot.{name}", "GET", url, repeat=1, rows=None)
+        rec.measure(f"plot.{name}.cached", "GET", url, rows=None)
+
+    job_body = {"variables": numeric + ["y"], "method": "spearman"}
+    rec.job("jobs.correlation", f"/jobs/calculate-correlation/{fid}", job_body)
+    rec.job("jobs.train-linear-regression", f"/jobs/train-linear-regression/{fid}", {"target": "y", "features": features})
+    rec.job("jobs.train-logistic-regression", f"/jobs/train-logistic-regression/{fid}", {"target": "bin", "features": features})
+    job_id = rec.job("jobs.train-lda", f"/jobs/train-lda/{fid}", {"target": "cls", "features": features})
+    rec.measure("jobs.list", "GET", "/jobs/", rows=None)
+    rec.measure("jobs.status", "GET", f"/jobs/{job_id}", rows=None)
+    rec.measure("jobs.result", "GET", f"/jobs/{job_id}/result", rows=None)
+    rec.measure("jobs.delete", "DELETE", f"/jobs/{job_id}", repeat=1, rows=None)
+    selection = {"target": "y", "features": features[:10], "folds": 3, "max_features": 5}
+    rec.job("select-features", f"/select-features/{fid}", selection)
+
+    rec.measure("models.list", "GET", "/models/", rows=None)
+    rec.measure("models.get", "GET", f"/models/{linear['model_id']}", rows=None)
+    rec.measure("models.load", "POST", f"/models/{logistic['model_id']}/load", rows=None)
+
+    def predict(model_id: str):
+        with open(csv_path, "rb") as f:
+            response = client.post(f"/predict/{model_id}?format=csv", files={"file": (csv_path.name, f, "text/csv")})
+        if response.status_code != 200:
+            raise RuntimeError(f"predict -> {response.status_code} {response.text[:300]}")
+    for name, model in (("linear", linear), ("logistic", logistic), ("lda", lda)):
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            predict(model["model_id"])
+            runs.append(time.perf_counter() - start)
+        rec.record(f"predict.{name}", runs)
+
+    # Añadir un 1 % de filas y repetir los análisis que se actualizan solo con ellas
+    with open(csv_path, "rb") as f:
+        extra_rows = max(1, scenario["rows"] // 100)
+        extra = b"".join(f.readline() for _ in range(extra_rows + 1))
+    rec.measure("append", "POST", f"/append/{fid}", rows=extra_rows, files={"file": ("extra.csv", extra, "text/csv")})
+    body = {"variables": numeric + ["y"], "method": "pearson"}
+    rec.measure("correlation.pearson.after-append", "POST", f"/calculate-correlation/{fid}", json=body, before=clear)
+    rec.measure("train-linear-regression.after-append", "POST", f"/train-linear-regression/{fid}",
+                json={"target": "y", "features": features}, before=clear)
+
+    rec.measure("metrics", "GET", "/metrics", rows=None)
+    rec.measure("models.delete", "DELETE", f"/models/{lda['model_id']}", repeat=1, rows=None)
+    rec.measure("remove-file", "DELETE", f"/remove-file/{fid}", repeat=1, rows=None)
+    return {"scenario": scenario, "warm_up_seconds": warm_up_seconds, "endpoints": rec.endpoints}
+
+def run_scenario_subprocess(scenario: Dict, csv_path: Path, repeat: int, model_features: int) -> Dict:
+    """Lanza el escenario en un intérprete nuevo con un directorio de trabajo vacío"""
+    with tempfile.TemporaryDirectory(prefix="corrstar-bench-") as workdir:
+        output = Path(workdir) / "result.json"
+        env = dict(os.environ, CORRSTAR_WARMUP="0", PYTHONPATH=str(ROOT))
+        env.pop("CORRSTAR_ANALYSIS_CACHE_DIR", None)
+        command = [sys.executable, str(Path(__file__).resolve()), "--run-scenario", json.dumps(scenario),
+                   "--csv", str(csv_path), "--repeat", str(repeat), "--model-features", str(model_features),
+                   "--output", str(output)]
+        completed = subprocess.run(command, cwd=workdir, env=env)
+        if completed.returncode != 0 or not output.exists():
+            return {"scenario": scenario, "error": f"el proceso terminó con código {completed.returncode}", "endpoints": {}}
+        return json.loads(output.read_text())
+
+
+# Comparación con la línea base
+def compare(results: Dict, baseline: Dict, thresholds: Dict) -> List[str]:
+    """Devuelve las regresiones de latencia y memoria respecto a la línea base"""
+    regressions = []
+    for sid, base in baseline.get("scenarios", {}).items():
+        current = results["scenarios"].get(sid)
+        if current is None:
+            continue  # escenario no ejecutado esta vez
+        if current.get("error"):
+            regressions.append(f"{sid}: {current['error']}")
+            continue
+        for name, before in base.get("endpoints", {}).items():
+            now = current["endpoints"].get(name)
+            if now is None:
+                regressions.append(f"{sid} {name}: sin medida")
+                continue
+            limit = before["seconds"] * (1 + thresholds["latency"])
+            if now["seconds"] > limit and now["seconds"] - before["seconds"] > thresholds["min_seconds"]:
+                regressions.append(f"{sid} {name}: {now['seconds']:.3f}s > {before['seconds']:.3f}s "
+                                   f"(+{(now['seconds'] / before['seconds'] - 1) * 100:.0f}%)")
+        for key in ("peak_rss_bytes", "workers_peak_rss_bytes"):
+            before = max((e.get(key) or 0 for e in base.get("endpoints", {}).values()), default=0)
+            now = max((e.get(key) or 0 for e in current["endpoints"].values()), default=0)
+            if before and now > before * (1 + thresholds["rss"]) and now - before > thresholds["min_rss_bytes"]:
+                regressions.append(f"{sid} {key}: {now / 2**20:.0f} MiB > {before / 2**20:.0f} MiB")
+    return regressions
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "commit": commit,
+    }
+
+def print_summary(result: Dict):
+    sid = scenario_id(result["scenario"])
+    if result.get("error"):
+        print(f"{sid}: ERROR {result['error']}")
+        return
+    print(f"\n{sid}")
+    for name, e in result["endpoints"].items():
+        throughput = f"{e['rows_per_second']:>14,.0f} filas/s" if e["rows_per_second"] else " " * 21
+        rss = f"{(e['peak_rss_bytes'] or 0) / 2**20:8.0f} MiB"
+        print(f"  {name:36s} {e['seconds'] * 1000:10.1f} ms {throughput} {rss}")
+
+def int_list(text: str) -> List[int]:
+    return [int(v) for v in text.split(",") if v]
+
+def float_list(text: str) -> List[float]:
+    return [float(v) for v in text.split(",") if v]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--rows", type=int_list, help="filas separadas por comas; sustituye al preset")
+    parser.add_argument("--cols", type=int_list, help="columnas predictoras separadas por comas")
+    parser.add_argument("--cardinality", type=int_list, default=[10], help="niveles de la columna categórica")
+    parser.add_argument("--missing", type=float_list, default=[0.05], help="proporción de valores faltantes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="repeticiones por endpoint; se guarda la mediana")
+    parser.add_argument("--model-features", type=int, default=10, help="predictores numéricos de los modelos")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="guarda los resultados como línea base")
+    parser.add_argument("--latency-threshold", type=float, help="aumento relativo tolerado de la latencia")
+    parser.add_argument("--rss-threshold", type=float, help="aumento relativo tolerado del pico de memoria")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        result = run_scenario(json.loads(args.run_scenario), args.csv, args.repeat, args.model_features)
+        args.output.write_text(json.dumps(result))
+        return 0
+
+    preset = PRESETS[args.preset]
+    scenarios = [
+        {"rows": rows, "cols": cols, "cardinality": cardinality, "missing": missing, "seed": args.seed}
+        for rows, cols, cardinality, missing in itertools.product(
+            args.rows or preset["rows"], args.cols or preset["cols"], args.cardinality, args.missing)
+    ]
+    results = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(),
+               "repeat": args.repeat, "scenarios": {}}
+    for scenario in scenarios:
+        csv_path = dataset_path(scenario, args.data_dir)
+        result = run_scenario_subprocess(scenario, csv_path, args.repeat, args.model_features)
+        results["scenarios"][scenario_id(scenario)] = result
+        print_summary(result)
+    args.output.write_text(json.dumps(results, indent=1))
+    print(f"\nResultados en {args.output}")
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {"scenarios": {}}
+        baseline["thresholds"] = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+        baseline["environment"] = results["environment"]
+        baseline["scenarios"].update(results["scenarios"])
+        args.baseline.write_text(json.dumps(baseline, indent=1))
+        print(f"Línea base guardada en {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+    if args.latency_threshold is not None:
+        thresholds["latency"] = args.latency_threshold
+    if args.rss_threshold is not None:
+        thresholds["rss"] = args.rss_threshold
+    regressions = compare(results, baseline, thresholds)
+    for line in regressions:
+        print(f"REGRESIÓN {line}")
+    if not regressions:
+        print(f"Sin regresiones respecto a {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
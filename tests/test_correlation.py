@@ -0,0 +1,107 @@
+"""Pruebas de /calculate-correlation contra scipy.stats"""
+import os
+import sys
+import tempfile
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+# El servidor crea sus directorios en el directorio de trabajo al importarse
+os.environ.setdefault("CORRSTAR_WARMUP", "0")
+os.environ.setdefault("CORRSTAR_DATASET_DIR", "")
+os.chdir(tempfile.mkdtemp(prefix="corrstar-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+VARIABLES = ["a", "b", "c", "constante"]
+SCIPY = {"pearson": stats.pearsonr, "spearman": stats.spearmanr}
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(Server.app)
+
+
+@pytest.fixture(scope="module")
+def dataset(client):
+    rng = np.random.default_rng(7)
+    n = 60
+    a = rng.normal(size=n)
+    df = pd.DataFrame({
+        "a": a,
+        "b": 0.6 * a + rng.normal(size=n),
+        "c": np.round(rng.normal(size=n), 1),  # con empates para Spearman
+        "constante": np.full(n, 3.0),
+    })
+    # Faltantes distintos en cada columna para que listwise y pairwise difieran
+    for column, start in (("a", 0), ("b", 5), ("c", 11), ("constante", 17)):
+        df.loc[start::9, column] = np.nan
+    response = client.post("/upload-csv/", files={"file": ("datos.csv", df.to_csv(index=False).encode(), "text/csv")})
+    assert response.status_code == 200, response.text
+    return response.json()["file_id"], df
+
+
+def expected(df: pd.DataFrame, method: str, missing: str):
+    """Matrices de referencia calculadas par a par con scipy"""
+    k = len(VARIABLES)
+    corr, p_values, counts = np.ones((k, k)), np.zeros((k, k)), np.zeros((k, k), dtype=int)
+    complete = df[VARIABLES].dropna()
+    for i, x in enumerate(VARIABLES):
+        for j, y in enumerate(VARIABLES):
+            pair = complete if missing == "listwise" else df[[x, y]].dropna()
+            counts[i, j] = len(pair)
+            if i != j:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")  # columna constante: scipy avisa y devuelve NaN
+                    result = SCIPY[method](pair[x], pair[y])
+                corr[i, j], p_values[i, j] = result[0], result[1]
+    return corr, p_values, counts
+
+
+def as_array(matrix) -> np.ndarray:
+    return np.array([[np.nan if value is None else value for value in row] for row in matrix], dtype=float)
+
+
+def check(body: dict, df: pd.DataFrame, method: str, missing: str):
+    corr, p_values, counts = expected(df, method, missing)
+    off_diagonal = ~np.eye(len(VARIABLES), dtype=bool)
+    np.testing.assert_allclose(as_array(body["correlation_matrix"])[off_diagonal], corr[off_diagonal],
+                               rtol=1e-9, atol=1e-12, equal_nan=True)
+    np.testing.assert_allclose(as_array(body["p_value_matrix"])[off_diagonal], p_values[off_diagonal],
+                               rtol=1e-7, atol=1e-12, equal_nan=True)
+    np.testing.assert_array_equal(np.array(body["n_matrix"]), counts)
+    if missing == "listwise":
+        assert body["n_observations"] == len(df[VARIABLES].dropna())
+    # La diagonal es 1 por convención, también en la columna constante
+    assert np.allclose(np.diag(as_array(body["correlation_matrix"])), 1.0)
+
+
+@pytest.mark.parametrize("missing", ["listwise", "pairwise"])
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_matches_scipy(client, dataset, method, missing):
+    file_id, df = dataset
+    response = client.post(f"/calculate-correlation/{file_id}",
+                           json={"variables": VARIABLES, "method": method, "missing": missing})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    check(body, df, method, missing)
+    # La columna constante no tiene correlación definida con ninguna otra
+    assert all(body["correlation_matrix"][3][j] is None for j in range(3))
+
+
+def test_moments_path_matches_scipy(client, dataset):
+    file_id, df = dataset
+    req = Server.CorrelationRequest(variables=VARIABLES, method="pearson", missing="listwise")
+    # La primera llamada siembra el resumen; después se responde sin recorrer los datos
+    assert client.post(f"/calculate-correlation/{file_id}", json=req.model_dump()).status_code == 200
+    output = Server.correlation_from_moments(file_id, req)
+    assert output is not None
+    body = {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in output.items()}
+    check(body, df, "pearson", "listwise")
+    assert np.isnan(as_array(body["correlation_matrix"])[3, :3]).all()
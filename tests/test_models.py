@@ -0,0 +1,50 @@
+"""Pruebas del registro de modelos guardados"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("CORRSTAR_WARMUP", "0")
+os.environ.setdefault("CORRSTAR_DATASET_DIR", "")
+os.chdir(tempfile.mkdtemp(prefix="corrstar-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Server  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+
+def save(models_dir: Path, age: float) -> str:
+    model_id = str(uuid.uuid4())
+    save_data = {"model": f"modelo {model_id}", "metadata": {}, "model_type": "linear_regression"}
+    Server.joblib.dump(save_data, models_dir / f"{model_id}.joblib")
+    (models_dir / f"{model_id}.json").write_text("{}")
+    stamp = time.time() - age
+    os.utime(models_dir / f"{model_id}.joblib", (stamp, stamp))
+    return model_id
+
+
+def test_prune_keeps_most_recently_used(tmp_path):
+    registry = Server.ModelRegistry(tmp_path, cache_size=2, max_saved=3)
+    ids = [save(tmp_path, age) for age in (50, 40, 30, 20, 10)]
+    assert registry.load(ids[0])["model"] == f"modelo {ids[0]}"  # el más antiguo pasa a ser el más reciente
+    registry.prune()
+    assert sorted(p.stem for p in tmp_path.glob("*.joblib")) == sorted([ids[0], ids[3], ids[4]])
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == sorted([ids[0], ids[3], ids[4]])
+
+
+def test_pruned_model_is_not_served_from_cache(tmp_path):
+    registry = Server.ModelRegistry(tmp_path, cache_size=2, max_saved=1)
+    old = save(tmp_path, 10)
+    assert registry.load(old)["model"] == f"modelo {old}"
+    save(tmp_path, 0)
+    (tmp_path / f"{old}.joblib").unlink()  # p. ej. prune en un proceso del pool
+    with pytest.raises(HTTPException):
+        registry.load(old)
+
+
+def test_max_saved_never_below_cache_size(tmp_path):
+    assert Server.ModelRegistry(tmp_path, cache_size=8, max_saved=2).max_saved == 8
@@ -0,0 +1,84 @@
+"""Pruebas del ajuste OLS por productos cruzados contra statsmodels"""
+import os
+import sys
+import tempfile
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.formula.api as smf
+from statsmodels.stats.anova import anova_lm
+
+# El servidor crea sus directorios en el directorio de trabajo al importarse
+os.environ.setdefault("CORRSTAR_WARMUP", "0")
+os.environ.setdefault("CORRSTAR_DATASET_DIR", "")
+os.chdir(tempfile.mkdtemp(prefix="corrstar-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Server  # noqa: E402
+
+FEATURES = ["x1", "x2", "x3", "x4"]
+
+
+def design(kind: str):
+    """Predictoras y objetivo de cada caso; el ruido evita un R² casi 1"""
+    rng = np.random.default_rng(12)
+    n = 200
+    X = rng.normal(size=(n, len(FEATURES)))
+    beta = np.array([1.5, -2.0, 0.5, 0.0])
+    if kind == "badly_scaled":
+        # Escalas de 1e-6 a 1e6 (y medias lejos de cero) con coeficientes en proporción inversa
+        scales = np.array([1e-6, 1.0, 1e4, 1e6])
+        X = X * scales + np.array([0.0, 50.0, 3e5, -2e7])
+        beta = beta / scales
+    elif kind == "rank_deficient":
+        X[:, 3] = X[:, 0] + X[:, 1]  # x4 es combinación exacta de x1 y x2
+    y = 4.0 + (X - X.mean(axis=0)) @ beta + rng.normal(scale=2.0, size=n)
+    return X, y
+
+
+def fit(X: np.ndarray, y: np.ndarray):
+    design_matrix = Server.with_intercept(X)
+    return Server.ols_from_crossproducts(design_matrix.T @ design_matrix, design_matrix.T @ y, y @ y, len(y),
+                                         "y", FEATURES, np.column_stack([y, X]))
+
+
+def reference(X: np.ndarray, y: np.ndarray, equilibrate: bool = False):
+    """Ajuste de statsmodels con fórmula: coeficientes, errores estándar, p-valores y ANOVA de tipo II.
+
+    statsmodels usa la pseudoinversa de la matriz de diseño sin escalar, que
+    con escalas de 1e-6 a 1e6 pierde precisión en las columnas pequeñas. Con
+    ``equilibrate`` se ajusta sobre las columnas normalizadas y se deshace el
+    cambio de escala: los p-valores y la ANOVA no varían con él.
+    """
+    scales = np.linalg.norm(X, axis=0) if equilibrate else np.ones(X.shape[1])
+    df = pd.DataFrame(X / scales, columns=FEATURES).assign(y=y)
+    formula = "y ~ " + " + ".join(Server.quote(f) for f in FEATURES)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # diseño de rango incompleto
+        fitted = smf.ols(formula, data=df).fit()
+        anova = anova_lm(fitted, typ=2)
+    factor = np.append(1.0, 1 / scales)
+    return fitted.params * factor, fitted.bse * factor, fitted.pvalues, fitted.rsquared, fitted.df_resid, anova
+
+
+@pytest.mark.parametrize("kind", ["well_conditioned", "badly_scaled", "rank_deficient"])
+def test_matches_statsmodels(kind):
+    X, y = design(kind)
+    result, model = fit(X, y)
+    params, bse, p_values, r_squared, df_resid, anova = reference(X, y, equilibrate=kind == "badly_scaled")
+
+    np.testing.assert_allclose(result["intercept"], params.iloc[0], rtol=1e-9)
+    np.testing.assert_allclose(result["coefficients"], params.iloc[1:], rtol=1e-8)
+    np.testing.assert_allclose(result["intercept_p_value"], p_values.iloc[0], rtol=1e-6)
+    np.testing.assert_allclose(result["p_values"], p_values.iloc[1:], rtol=1e-6)
+    np.testing.assert_allclose(result["r_squared"], r_squared, rtol=1e-9)
+    # El modelo guardado da los mismos errores estándar y p-valores
+    np.testing.assert_allclose(model.bse, bse, rtol=1e-8)
+    np.testing.assert_allclose(model.pvalues, p_values, rtol=1e-6)
+    assert model.df_resid == df_resid  # 196 en el caso de rango incompleto: se usó la pseudoinversa
+
+    ours = pd.DataFrame(result["anova"]).set_index("index").rename_axis(None)
+    pd.testing.assert_frame_equal(ours, anova, check_exact=False, rtol=1e-6)
@@ -0,0 +1,35 @@
+"""Pruebas de la serialización de respuestas"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# El servidor crea sus directorios en el directorio de trabajo al importarse
+os.environ.setdefault("CORRSTAR_WARMUP", "0")
+os.environ.setdefault("CORRSTAR_DATASET_DIR", "")
+os.chdir(tempfile.mkdtemp(prefix="corrstar-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Server  # noqa: E402
+
+
+@pytest.mark.parametrize("arr", [
+    np.array([[1.0, np.nan], [0.25, -3.5]]),
+    np.array([[1, 2, 3]], dtype=np.int64),
+    np.arange(6, dtype=">f8").reshape(3, 2),  # big-endian: se envía en little-endian
+    np.asfortranarray(np.arange(6.0).reshape(2, 3)),  # columnas contiguas: se envía en orden C
+])
+def test_msgpack_arrays_travel_as_binary(arr):
+    encoded = Server.msgpack_default(arr)
+    assert isinstance(encoded["data"], bytes)
+    decoded = np.frombuffer(encoded["data"], dtype=encoded["dtype"]).reshape(encoded["shape"])
+    assert encoded["dtype"].startswith(("<", "|"))
+    np.testing.assert_array_equal(decoded, arr)
+
+
+def test_msgpack_other_types_use_json_default():
+    assert Server.msgpack_default(np.array(["a", None], dtype=object)) == ["a", None]
+    assert Server.msgpack_default(np.float64(0.5)) == 0.5
@@ -0,0 +1,63 @@
+"""Pruebas de la carga de CSV por bloques"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# El servidor crea sus directorios en el directorio de trabajo al importarse
+os.environ.setdefault("CORRSTAR_WARMUP", "0")
+os.environ.setdefault("CORRSTAR_DATASET_DIR", "")
+os.chdir(tempfile.mkdtemp(prefix="corrstar-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+LARGE_IDS = [9007199254740993, 9007199254740995, 2**62 + 1, -(2**63) + 1]
+
+
+@pytest.fixture
+def client():
+    return TestClient(Server.app)
+
+
+def upload(client, text: str) -> str:
+    response = client.post("/upload-csv/", files={"file": ("datos.csv", text.encode(), "text/csv")})
+    assert response.status_code == 200, response.text
+    return response.json()["file_id"]
+
+
+def test_large_integer_ids_keep_precision(client, monkeypatch):
+    # Bloques pequeños para que los enteros pasen por el camino por bloques
+    monkeypatch.setattr(Server, "CSV_CHUNK_ROWS", 2)
+    text = "id,x\n" + "".join(f"{value},{i}.5\n" for i, value in enumerate(LARGE_IDS))
+    file_id = upload(client, text)
+
+    df = Server.global_data[file_id]["dataframe"]
+    assert df["id"].dtype == "int64"
+    assert df["id"].tolist() == LARGE_IDS
+
+    preview = client.get(f"/preview/{file_id}", params={"limit": 10}).json()
+    assert [row["id"] for row in preview["preview"]] == LARGE_IDS
+
+
+def test_chunked_read_matches_read_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(Server, "CSV_CHUNK_ROWS", 2)
+    path = tmp_path / "datos.csv"
+    path.write_text("id,n,x,c\n9007199254740993,1,0.5,a\n9007199254740995,,1.5,b\n7,3,2.5,c\n")
+    df, chunks = Server.read_csv_chunked(str(path))
+    expected = pd.read_csv(path)
+    assert chunks == 2
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_non_integer_values_fall_back_to_full_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(Server, "CSV_SAMPLE_ROWS", 2)
+    monkeypatch.setattr(Server, "CSV_CHUNK_ROWS", 2)
+    path = tmp_path / "datos.csv"
+    path.write_text("id\n1\n2\n2.5\n")
+    df, _ = Server.read_csv_chunked(str(path))
+    pd.testing.assert_frame_equal(df, pd.read_csv(path))